@@ -0,0 +1,12 @@
+"""
+Summary statistics shared by the benchmark scripts
+"""
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, 0.0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,192 @@
+"""
+Benchmark: sync vs async database sessions under concurrent requests
+Replays query_session's logging path (session lookup, Query insert, session/agent
+counter updates, commit) from many concurrent requests on one event loop, the way
+the routers ran before (sync SessionLocal), after the async port (AsyncSessionLocal),
+and with the write-behind query log (session lookup only, writes batched).
+
+Usage:
+    python benchmarks/bench_db_throughput.py [--requests 2000] [--concurrency 50]
+                                             [--database-url sqlite:///./bench_db.sqlite]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from _stats import percentile
+
+
+async def measure_loop_lag(stop: asyncio.Event, samples: list, interval: float = 0.01):
+    """Record how late a 10ms sleep wakes up while requests are running"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+
+async def run(label, request_fn, total, concurrency):
+    """Drive `total` requests with bounded concurrency, return a result row"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+    
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await request_fn()
+            except Exception as e:
+                # e.g. "database is locked" once SQLite's busy timeout is exceeded (a 500 in the API)
+                errors.append(type(e).__name__)
+            latencies.append((time.perf_counter() - started) * 1000)
+    
+    lag_samples = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lag_samples))
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    
+    stop.set()
+    await lag_task
+    
+    return {
+        "mode": label,
+        "errors": len(errors),
+        "req_per_s": total / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "loop_lag_p95_ms": percentile(lag_samples, 95) if lag_samples else 0.0,
+        "loop_lag_max_ms": max(lag_samples) if lag_samples else 0.0,
+    }
+
+
+async def main_async(args):
+    from sqlalchemy import func, select
+    
+    from database import SessionLocal, AsyncSessionLocal, async_engine, init_db
+    from models import Agent, Session as SessionModel, Query
+    from query_log import QueryLogWriter
+    
+    init_db()
+    
+    # Seed one agent with one active session (the hot row every request updates)
+    agent_id, session_id = str(uuid.uuid4()), str(uuid.uuid4())
+    with SessionLocal() as db:
+        db.add(Agent(id=agent_id, name="Bench Agent", template_id="general", system_prompt="bench"))
+        db.add(SessionModel(id=session_id, agent_id=agent_id, livekit_room_name=f"session_{session_id}"))
+        db.commit()
+    
+    def new_query():
+        return Query(
+            id=str(uuid.uuid4()),
+            session_id=session_id,
+            agent_id=agent_id,
+            question="What is the leave policy?",
+            answer="context " * 100,
+            sources=["handbook.pdf"],
+            timestamp=datetime.utcnow()
+        )
+    
+    async def sync_request():
+        # What the routers did before: blocking calls inside `async def`
+        db = SessionLocal()
+        try:
+            session = db.get(SessionModel, session_id)
+            db.add(new_query())
+            session.query_count += 1
+            agent = db.get(Agent, agent_id)
+            agent.query_count += 1
+            agent.last_used = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+    
+    async def async_request():
+        async with AsyncSessionLocal() as db:
+            session = await db.get(SessionModel, session_id)
+            db.add(new_query())
+            session.query_count += 1
+            agent = await db.get(Agent, agent_id)
+            agent.query_count += 1
+            agent.last_used = datetime.utcnow()
+            await db.commit()
+    
+    writer = QueryLogWriter()
+    
+    async def write_behind_request():
+        async with AsyncSessionLocal() as db:
+            session = await db.get(SessionModel, session_id)
+            row = new_query()
+            writer.record(session.id, session.agent_id, row.question, row.answer, row.sources, row.timestamp)
+    
+    async def counters():
+        async with AsyncSessionLocal() as db:
+            rows = await db.scalar(select(func.count()).select_from(Query))
+            counter = await db.scalar(select(SessionModel.query_count).where(SessionModel.id == session_id))
+            return rows, counter
+    
+    results = []
+    for label, request_fn in (("sync", sync_request), ("async", async_request), ("w-behind", write_behind_request)):
+        rows_before, counter_before = await counters()
+        if label == "w-behind":
+            await writer.start()
+        result = await run(label, request_fn, args.requests, args.concurrency)
+        if label == "w-behind":
+            await writer.stop()
+        rows_after, counter_after = await counters()
+        
+        # Read-modify-write counters lose increments under concurrency, SQL increments don't
+        result["rows_logged"] = rows_after - rows_before
+        result["counter_delta"] = counter_after - counter_before
+        results.append(result)
+    
+    await async_engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    args = parser.parse_args()
+    
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="xebia_bench_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    
+    print("\n" + "=" * 72)
+    print("🗄️  DATABASE THROUGHPUT: SYNC vs ASYNC SESSIONS")
+    print("=" * 72)
+    print(f"   Database: {os.environ['DATABASE_URL']}")
+    print(f"   Requests: {args.requests}, concurrency: {args.concurrency}\n")
+    
+    results = asyncio.run(main_async(args))
+    
+    print(f"{'mode':<9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'lag p95':>10}{'lag max':>10}"
+          f"{'errors':>8}{'rows':>8}{'counter':>9}")
+    for r in results:
+        print(f"{r['mode']:<9}{r['req_per_s']:>10.0f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['loop_lag_p95_ms']:>10.1f}{r['loop_lag_max_ms']:>10.1f}"
+              f"{r['errors']:>8}{r['rows_logged']:>8}{r['counter_delta']:>9}")
+    print("\n'lag'     = event-loop delay seen by other requests (health checks, RAG calls) meanwhile")
+    print("'counter' = increase of Session.query_count (should equal 'rows')\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Benchmark: hot-path queries before and after the index migration (0005)
+Seeds a large database with the pre-0005 schema, times the queries the routers run
+and captures their query plans, applies the migration through the normal runner,
+then measures again.
+
+Usage:
+    python benchmarks/bench_indexes.py [--agents 200] [--sessions 50000] [--queries 500000]
+                                       [--repeat 50] [--database-url sqlite:///./bench_idx.sqlite]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from _stats import percentile
+
+SEED_BATCH = 10000
+
+
+def seed(engine, args, rng):
+    """Insert agents, documents, sessions and queries spread over the last 90 days"""
+    from models import Agent, Document, Session as SessionModel, Query
+    
+    now = datetime.utcnow()
+    agent_ids = [str(uuid.uuid4()) for _ in range(args.agents)]
+    session_rows = []
+    
+    with engine.begin() as conn:
+        conn.execute(Agent.__table__.insert(), [
+            {"id": agent_id, "name": f"Agent {n}", "template_id": "general", "system_prompt": "bench",
+             "created_at": now, "query_count": 0, "document_count": 0}
+            for n, agent_id in enumerate(agent_ids)
+        ])
+        conn.execute(Document.__table__.insert(), [
+            {"id": str(uuid.uuid4()), "agent_id": agent_id, "filename": f"doc_{n}.pdf",
+             "file_size": 100000, "chunk_count": 40, "uploaded_at": now}
+            for agent_id in agent_ids for n in range(args.documents_per_agent)
+        ])
+        
+        for _ in range(args.sessions):
+            started = now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600))
+            session_rows.append({
+                "id": str(uuid.uuid4()), "agent_id": rng.choice(agent_ids),
+                "livekit_room_name": "bench", "started_at": started, "ended_at": started + timedelta(minutes=5),
+                "query_count": 0, "status": "completed",
+            })
+        for start in range(0, len(session_rows), SEED_BATCH):
+            conn.execute(SessionModel.__table__.insert(), session_rows[start:start + SEED_BATCH])
+    
+    inserted = 0
+    while inserted < args.queries:
+        batch = []
+        for _ in range(min(SEED_BATCH, args.queries - inserted)):
+            session = rng.choice(session_rows)
+            batch.append({
+                "id": str(uuid.uuid4()), "session_id": session["id"], "agent_id": session["agent_id"],
+                "question": "What is the leave policy?", "answer": "context", "sources": ["doc_0.pdf"],
+                "timestamp": session["started_at"] + timedelta(seconds=rng.randint(0, 300)),
+            })
+        with engine.begin() as conn:
+            conn.execute(Query.__table__.insert(), batch)
+        inserted += len(batch)
+    
+    return agent_ids, [row["id"] for row in session_rows]
+
+
+def hot_path_queries(agent_ids, session_ids, rng):
+    """(label, statement factory) pairs mirroring what the routers run"""
+    from sqlalchemy import func, select, tuple_
+    from models import Agent, Document, Session as SessionModel, Query
+    
+    # Keyset cursor roughly in the middle of the feed
+    cursor = (datetime.utcnow() - timedelta(days=45), "")
+    
+    def agent_analytics():
+        agent_id = rng.choice(agent_ids)
+        return select(
+            select(func.count()).where(SessionModel.agent_id == agent_id).scalar_subquery(),
+            select(func.max(SessionModel.started_at)).where(SessionModel.agent_id == agent_id).scalar_subquery(),
+            select(func.count()).where(Query.agent_id == agent_id).scalar_subquery(),
+        )
+    
+    def agent_documents():
+        return select(Document).where(Document.agent_id == rng.choice(agent_ids))
+    
+    def feed(keyset=False):
+        stmt = (
+            select(Query.id, Query.agent_id, Query.question, Query.timestamp, Agent.name)
+            .outerjoin(Agent, Agent.id == Query.agent_id)
+            .order_by(Query.timestamp.desc(), Query.id.desc())
+            .limit(20)
+        )
+        if keyset:
+            stmt = stmt.where(tuple_(Query.timestamp, Query.id) < tuple_(*cursor))
+        return stmt
+    
+    def session_queries():
+        return select(Query.question, Query.timestamp).where(Query.session_id == rng.choice(session_ids))
+    
+    def last_24h():
+        return select(func.count()).select_from(Query).where(Query.timestamp >= datetime.utcnow() - timedelta(days=1))
+    
+    return [
+        ("agent analytics", agent_analytics),
+        ("agent documents", agent_documents),
+        ("recent feed", feed),
+        ("recent feed, cursor page", lambda: feed(keyset=True)),
+        ("session queries", session_queries),
+        ("queries last 24h", last_24h),
+    ]
+
+
+def query_plan(conn, stmt):
+    """The database's plan for a statement, one line per step"""
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup) if compiled.positional else compiled.params
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    rows = conn.exec_driver_sql(prefix + str(compiled), params).all()
+    return [str(row[-1]) for row in rows]
+
+
+def measure(engine, queries, repeat):
+    """Time each hot-path query `repeat` times, return {label: (p50, p95, plan)}"""
+    from sqlalchemy import text
+    
+    results = {}
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+        for label, make_stmt in queries:
+            plan = query_plan(conn, make_stmt())
+            latencies = []
+            for _ in range(repeat):
+                stmt = make_stmt()
+                started = time.perf_counter()
+                conn.execute(stmt).all()
+                latencies.append((time.perf_counter() - started) * 1000)
+            results[label] = (percentile(latencies, 50), percentile(latencies, 95), plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=200)
+    parser.add_argument("--documents-per-agent", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file (must be empty)")
+    args = parser.parse_args()
+    
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix="xebia_bench_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    
+    from database import Base, engine
+    from migrations import run_migrations
+    from migrations.m0005_hot_path_indexes import INDEXES, VERSION
+    from migrations.ops import drop_index
+    import models  # noqa: F401
+    
+    print("\n" + "=" * 72)
+    print("📇 HOT-PATH QUERIES: BEFORE vs AFTER INDEX MIGRATION")
+    print("=" * 72)
+    print(f"   Database: {os.environ['DATABASE_URL']}")
+    print(f"   Agents: {args.agents}, sessions: {args.sessions}, queries: {args.queries}\n")
+    
+    # Schema as it was before migration 0005
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine, target=VERSION - 1)
+    with engine.begin() as conn:
+        for name, table, _ in INDEXES:
+            drop_index(conn, name, table)
+    
+    rng = random.Random(42)
+    started = time.perf_counter()
+    agent_ids, session_ids = seed(engine, args, rng)
+    print(f"\n🌱 Seeded in {time.perf_counter() - started:.1f}s\n")
+    
+    queries = hot_path_queries(agent_ids, session_ids, random.Random(7))
+    before = measure(engine, queries, args.repeat)
+    
+    started = time.perf_counter()
+    run_migrations(engine)
+    print(f"   Migration took {time.perf_counter() - started:.1f}s\n")
+    
+    queries = hot_path_queries(agent_ids, session_ids, random.Random(7))
+    after = measure(engine, queries, args.repeat)
+    
+    print(f"{'query':<27}{'before p50':>12}{'p95':>9}{'after p50':>12}{'p95':>9}{'speedup':>10}")
+    for label, _ in queries:
+        b50, b95, _ = before[label]
+        a50, a95, _ = after[label]
+        print(f"{label:<27}{b50:>10.2f}ms{b95:>7.2f}ms{a50:>10.2f}ms{a95:>7.2f}ms{b50 / max(a50, 1e-6):>9.1f}x")
+    
+    print("\nQuery plans (before -> after):")
+    for label, _ in queries:
+        print(f"\n  {label}")
+        for line in before[label][2]:
+            print(f"    before: {line}")
+        for line in after[label][2]:
+            print(f"    after:  {line}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
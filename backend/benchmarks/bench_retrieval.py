@@ -0,0 +1,345 @@
+"""
+Benchmark: RAGPipeline retrieval latency and recall versus collection size and HNSW parameters
+Builds synthetic corpora in a throwaway ChromaDB store and, for every HNSW build
+configuration (max_neighbors "M" x ef_construction), grows one agent collection
+through the requested sizes. At each size it records ingest throughput (embed + store,
+as process_document does), the query_rag latency distribution, the raw vector search
+latency and recall@k against exact brute-force nearest neighbours, for every search ef.
+
+Corpora:
+    --corpus text     synthetic topic-skewed text embedded by StubEmbeddings (the real
+                      ingest path, slow beyond ~100k chunks)
+    --corpus vectors  clustered Gaussian unit vectors, no embedding step (for 1M chunks)
+
+Usage:
+    python benchmarks/bench_retrieval.py [--sizes 1000,10000,100000] [--corpus text|vectors]
+                                         [--m 16] [--ef-construction 100] [--ef-search 10,50,100]
+                                         [--k 5] [--queries 200] [--dim 384]
+                                         [--json results.json] [--baseline previous.json]
+    python benchmarks/bench_retrieval.py --corpus vectors --sizes 1000,10000,100000,1000000 \\
+                                         --m 8,16,32 --ef-construction 64,200 --ef-search 10,50,200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from _stats import percentile
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic corpora
+# ---------------------------------------------------------------------------
+
+class TextCorpus:
+    """Chunks of pseudo-words, each chunk skewed towards one of many topics"""
+    
+    SYLLABLES = ["ka", "lo", "mi", "re", "su", "ta", "ne", "vo", "pi", "da", "ri", "ko", "an", "el", "us", "or"]
+    
+    def __init__(self, embeddings, seed: int, vocabulary: int = 5000, topics: int = 200, words: int = 150):
+        self.embeddings = embeddings
+        self.rng = random.Random(seed)
+        self.words = words
+        self.vocabulary = sorted({
+            "".join(self.rng.choice(self.SYLLABLES) for _ in range(self.rng.randint(2, 4)))
+            for _ in range(vocabulary * 2)
+        })[:vocabulary]
+        # Each topic favours a small slice of the vocabulary
+        self.topics = [self.rng.sample(self.vocabulary, 40) for _ in range(topics)]
+    
+    def _text(self, topic_share: float, length: int) -> str:
+        topic = self.rng.choice(self.topics)
+        return " ".join(
+            self.rng.choice(topic) if self.rng.random() < topic_share else self.rng.choice(self.vocabulary)
+            for _ in range(length)
+        )
+    
+    def chunks(self, count: int):
+        """(texts, embeddings) for the next batch of chunks"""
+        texts = [self._text(0.5, self.words) for _ in range(count)]
+        return texts, self.embeddings.embed_documents(texts)
+    
+    def questions(self, count: int):
+        return [self._text(0.8, 8) for _ in range(count)]
+
+
+class VectorCorpus:
+    """Clustered Gaussian unit vectors, no embedding model involved"""
+    
+    def __init__(self, dim: int, seed: int, clusters: int = 500, spread: float = 0.35):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+        self.centers = self.rng.standard_normal((clusters, dim)).astype(np.float32)
+        self.spread = spread
+        self.question_vectors = {}
+    
+    def _vectors(self, count: int) -> np.ndarray:
+        centers = self.centers[self.rng.integers(0, len(self.centers), count)]
+        vectors = centers + self.spread * self.rng.standard_normal((count, self.dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    
+    def chunks(self, count: int):
+        vectors = self._vectors(count)
+        return [f"synthetic chunk {n}" for n in range(count)], vectors.tolist()
+    
+    def questions(self, count: int):
+        names = [f"question {len(self.question_vectors) + n}" for n in range(count)]
+        for name, vector in zip(names, self._vectors(count)):
+            self.question_vectors[name] = vector.tolist()
+        return names
+    
+    # Embeddings interface for RAGPipeline.query_rag
+    def embed_query(self, text: str):
+        return self.question_vectors[text]
+    
+    def embed_documents(self, texts):
+        return [self.question_vectors[text] for text in texts]
+
+
+# ---------------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------------
+
+def brute_force_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, block: int = 100000):
+    """Exact k nearest neighbours (squared L2, Chroma's default space) as row indices"""
+    best_dist = np.full((len(queries), 0), np.inf, dtype=np.float32)
+    best_idx = np.zeros((len(queries), 0), dtype=np.int64)
+    query_norms = (queries ** 2).sum(axis=1, keepdims=True)
+    for start in range(0, len(corpus), block):
+        part = corpus[start:start + block]
+        dist = query_norms - 2 * queries @ part.T + (part ** 2).sum(axis=1)
+        take = min(k, part.shape[0])
+        idx = np.argpartition(dist, take - 1, axis=1)[:, :take]
+        best_dist = np.concatenate([best_dist, np.take_along_axis(dist, idx, axis=1)], axis=1)
+        best_idx = np.concatenate([best_idx, idx + start], axis=1)
+        keep = np.argsort(best_dist, axis=1)[:, :k]
+        best_dist = np.take_along_axis(best_dist, keep, axis=1)
+        best_idx = np.take_along_axis(best_idx, keep, axis=1)
+    return best_idx
+
+
+def ingest(pipeline, collection, corpus, start: int, count: int, stored: list, batch_size: int) -> float:
+    """Embed and add chunks [start, start + count), returns chunks per second"""
+    started = time.perf_counter()
+    done = 0
+    while done < count:
+        n = min(batch_size, count - done)
+        texts, embeddings = corpus.chunks(n)
+        ids = [f"chunk_{start + done + i}" for i in range(n)]
+        collection.add(
+            ids=ids,
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=[{"document_id": "bench", "filename": "bench.txt", "chunk_index": start + done + i} for i in range(n)],
+        )
+        stored.append(np.asarray(embeddings, dtype=np.float32))
+        done += n
+    return count / (time.perf_counter() - started)
+
+
+async def time_query_rag(pipeline, agent_id: str, questions, k: int):
+    """End-to-end query_rag latency (embed + search + formatting) in ms, sequential"""
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        await pipeline.query_rag(agent_id, question, k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def set_ef_search(pipeline, collection, ef_search: int):
+    """Change search ef; Chroma only applies it when the HNSW segment is reloaded, so reopen the client"""
+    import chromadb
+    from chromadb.config import Settings
+    
+    collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+    pipeline.chroma_client.clear_system_cache()
+    pipeline.chroma_client = chromadb.PersistentClient(
+        path=pipeline.chroma_path,
+        settings=Settings(anonymized_telemetry=False, allow_reset=True),
+    )
+    return pipeline.chroma_client.get_collection(collection.name)
+
+
+def measure(pipeline, collection, agent_id, questions, question_vectors, truth, k):
+    """query_rag latency, vector search latency and recall@k for the current search ef"""
+    rag_latencies = asyncio.run(time_query_rag(pipeline, agent_id, questions, k))
+    
+    search_latencies = []
+    hits = 0
+    for vector, expected in zip(question_vectors, truth):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[vector.tolist()], n_results=k, include=[])
+        search_latencies.append((time.perf_counter() - started) * 1000)
+        found = {int(chunk_id.rsplit("_", 1)[1]) for chunk_id in result["ids"][0]}
+        hits += len(found & set(expected.tolist()))
+    
+    summary = lambda values: {
+        "mean_ms": sum(values) / len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+    }
+    return {
+        "query_rag": summary(rag_latencies),
+        "vector_search": summary(search_latencies),
+        f"recall_at_{k}": hits / (len(truth) * k),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    import chromadb
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": commit,
+        "chromadb": chromadb.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def result_key(row):
+    return (row["size"], row["m"], row["ef_construction"], row["ef_search"])
+
+
+def print_row(row, k, baseline=None):
+    line = (f"   {row['size']:>9} {row['m']:>4} {row['ef_construction']:>6} {row['ef_search']:>6} "
+            f"{row['ingest_chunks_per_s']:>10.0f} {row['query_rag']['p50_ms']:>9.2f} {row['query_rag']['p95_ms']:>9.2f} "
+            f"{row['vector_search']['p50_ms']:>9.2f} {row[f'recall_at_{k}']:>9.3f}")
+    previous = baseline.get(result_key(row)) if baseline else None
+    if previous and f"recall_at_{k}" in previous:
+        line += (f"   Δp95 {row['query_rag']['p95_ms'] - previous['query_rag']['p95_ms']:+.2f} ms"
+                 f"  Δrecall {row[f'recall_at_{k}'] - previous[f'recall_at_{k}']:+.3f}")
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int_list, default=int_list("1000,10000,100000"), help="Collection sizes (chunks)")
+    parser.add_argument("--corpus", choices=["text", "vectors"], default="text")
+    parser.add_argument("--m", type=int_list, default=int_list("16"), help="HNSW max_neighbors values")
+    parser.add_argument("--ef-construction", type=int_list, default=int_list("100"))
+    parser.add_argument("--ef-search", type=int_list, default=int_list("10,50,100"))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Chunks per embed/add call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chroma-path", default=None, help="Keep the store here instead of a temp dir")
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    parser.add_argument("--baseline", default=None, help="Earlier --json output to compare against")
+    args = parser.parse_args()
+    sizes = sorted(args.sizes)
+    
+    # Throwaway store and deterministic embeddings, set before the pipeline reads them
+    os.environ["CHROMADB_PATH"] = args.chroma_path or tempfile.mkdtemp(prefix="xebia_bench_rag_")
+    os.environ["USE_STUB_EMBEDDINGS"] = "true"
+    os.environ["STUB_EMBEDDING_DIM"] = str(args.dim)
+    os.environ["STUB_EMBEDDING_LATENCY_MS"] = "0"
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    from rag_pipeline import RAGPipeline
+    
+    pipeline = RAGPipeline()
+    batch_size = min(args.batch_size, pipeline.chroma_client.get_max_batch_size())
+    
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = {result_key(row): row for row in json.load(f)["results"]}
+    
+    print("\n" + "=" * 72)
+    print("🔎 RETRIEVAL BENCHMARK")
+    print("=" * 72)
+    print(f"   Store: {os.environ['CHROMADB_PATH']}")
+    print(f"   Corpus: {args.corpus}, dim {args.dim}, sizes {sizes}, {args.queries} queries, k={args.k}")
+    print(f"\n   {'size':>9} {'M':>4} {'ef_c':>6} {'ef_s':>6} {'ingest/s':>10} {'rag p50':>9} {'rag p95':>9} "
+          f"{'vec p50':>9} {'recall':>9}")
+    
+    results = []
+    for m in args.m:
+        for ef_construction in args.ef_construction:
+            agent_id = f"bench_m{m}_efc{ef_construction}"
+            collection = pipeline.chroma_client.create_collection(
+                name=f"agent_{agent_id}",
+                metadata={"agent_id": agent_id},
+                configuration={"hnsw": {"max_neighbors": m, "ef_construction": ef_construction}},
+            )
+            
+            # Same corpus and questions for every build configuration
+            if args.corpus == "text":
+                corpus = TextCorpus(pipeline.embeddings, args.seed)
+            else:
+                corpus = VectorCorpus(args.dim, args.seed)
+                pipeline.embeddings = corpus
+            questions = corpus.questions(args.queries)
+            question_vectors = np.asarray(
+                [corpus.embed_query(q) if args.corpus == "vectors" else pipeline.embeddings.embed_query(q) for q in questions],
+                dtype=np.float32,
+            )
+            
+            stored = []
+            for size in sizes:
+                # Grow the collection to this size, timing only the new chunks
+                have = sum(len(part) for part in stored)
+                throughput = ingest(pipeline, collection, corpus, have, size - have, stored, batch_size)
+                
+                all_vectors = np.concatenate(stored) if len(stored) > 1 else stored[0]
+                stored = [all_vectors]
+                truth = brute_force_top_k(all_vectors, question_vectors, args.k)
+                
+                for ef_search in args.ef_search:
+                    collection = set_ef_search(pipeline, collection, ef_search)
+                    row = {
+                        "size": size,
+                        "corpus": args.corpus,
+                        "m": m,
+                        "ef_construction": ef_construction,
+                        "ef_search": ef_search,
+                        "k": args.k,
+                        "ingest_chunks_per_s": throughput,
+                        **measure(pipeline, collection, agent_id, questions, question_vectors, truth, args.k),
+                    }
+                    results.append(row)
+                    print_row(row, args.k, baseline)
+            
+            pipeline.chroma_client.delete_collection(collection.name)
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "config": vars(args), "results": results}, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
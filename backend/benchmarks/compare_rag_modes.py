@@ -0,0 +1,58 @@
+"""
+Compare time-to-first-audio between RAG modes
+Reads the per-turn records written by the voice worker when TURN_LATENCY_LOG is set
+
+Usage:
+    1. Start the worker with TURN_LATENCY_LOG=turn_latency.jsonl
+    2. Run voice sessions against an agent in 'tool' mode, then switch it to 'proactive'
+       (PUT /api/agents/{id} with {"rag_mode": "proactive"}) and repeat the same questions
+    3. python benchmarks/compare_rag_modes.py turn_latency.jsonl
+"""
+
+import json
+import sys
+from collections import defaultdict
+
+from _stats import percentile
+
+
+def load_records(path):
+    """Group ttfa_ms values by rag_mode"""
+    by_mode = defaultdict(list)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            by_mode[record.get("rag_mode", "tool")].append(record["ttfa_ms"])
+    return by_mode
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "turn_latency.jsonl"
+    by_mode = load_records(path)
+    
+    if not by_mode:
+        print(f"❌ No turn latency records found in {path}")
+        return 1
+    
+    print("\n" + "=" * 60)
+    print("⏱️  TIME TO FIRST AUDIO BY RAG MODE")
+    print("=" * 60 + "\n")
+    print(f"{'mode':<12}{'turns':>8}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    
+    for mode, values in sorted(by_mode.items()):
+        mean = sum(values) / len(values)
+        print(f"{mode:<12}{len(values):>8}{percentile(values, 50):>10.0f}{percentile(values, 95):>10.0f}{mean:>10.0f}")
+    
+    if "tool" in by_mode and "proactive" in by_mode:
+        saved = percentile(by_mode["tool"], 50) - percentile(by_mode["proactive"], 50)
+        print(f"\n📉 Proactive mode p50 improvement: {saved:.0f} ms")
+    
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
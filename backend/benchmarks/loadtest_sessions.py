@@ -0,0 +1,388 @@
+"""
+Load test: concurrent voice sessions against one backend
+Runs the session lifecycle the frontend and worker drive - POST /api/sessions/start,
+several POST /api/sessions/{id}/query, POST /api/sessions/{id}/end - from a growing
+number of virtual users, and reports throughput, per-endpoint latency percentiles
+and the backend's CPU, memory and event-loop lag at each concurrency level.
+
+By default the backend is started in a child process with a temporary database and
+vector store, a local stand-in for livekit.api.LiveKitAPI and deterministic stub
+embeddings (USE_STUB_EMBEDDINGS), so no LiveKit server or embedding API is needed.
+
+Usage:
+    python benchmarks/loadtest_sessions.py [--ramp 1,5,10,25,50] [--level-duration 20]
+                                           [--queries-per-session 5] [--think-ms 200]
+                                           [--corpus ./docs | --synthetic-docs 20]
+                                           [--embedding-latency-ms 0] [--livekit-latency-ms 30]
+                                           [--slo-p95-ms 1000] [--max-error-rate 0.01] [--json out.json]
+    python benchmarks/loadtest_sessions.py --url http://localhost:8000   # existing backend, no resource stats
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from _stats import percentile
+
+TOPICS = {
+    "leave": "leave vacation holiday days annual paid sick parental request approval manager calendar",
+    "security": "security password vpn laptop encryption phishing incident badge access mfa device",
+    "expenses": "expenses receipt travel hotel flight reimbursement card per diem mileage approval",
+    "onboarding": "onboarding buddy laptop accounts training first week orientation handbook checklist",
+    "benefits": "benefits pension insurance health dental gym allowance bonus stock wellbeing",
+    "remote": "remote hybrid office desk booking home workspace internet allowance equipment",
+}
+
+
+# ---------------------------------------------------------------------------
+# Server side (child process)
+# ---------------------------------------------------------------------------
+
+class FakeRoomService:
+    """Stand-in for LiveKitAPI.room with a configurable network delay"""
+    
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.rooms = set()
+    
+    async def create_room(self, request):
+        await asyncio.sleep(self.latency)
+        self.rooms.add(request.name)
+    
+    async def delete_room(self, request):
+        await asyncio.sleep(self.latency)
+        self.rooms.discard(request.room)
+
+
+class FakeLiveKitAPI:
+    """Local stand-in for livekit.api.LiveKitAPI (room create / delete only)"""
+    
+    def __init__(self, *args, **kwargs):
+        self.room = FakeRoomService(float(os.getenv("LOADTEST_LIVEKIT_LATENCY_MS", "30")) / 1000)
+    
+    async def aclose(self):
+        pass
+
+
+def serve(port: int) -> None:
+    """Run the backend with the LiveKit stand-in (invoked as a child process)"""
+    from livekit import api
+    api.LiveKitAPI = FakeLiveKitAPI
+    
+    import uvicorn
+    from main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def start_server(args):
+    """Start the backend child process on a free port, returns (process, base_url)"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    
+    tmp_dir = tempfile.mkdtemp(prefix="xebia_loadtest_")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_dir}/loadtest.db",
+        CHROMADB_PATH=f"{tmp_dir}/chroma",
+        USE_STUB_EMBEDDINGS="true",
+        STUB_EMBEDDING_LATENCY_MS=str(args.embedding_latency_ms),
+        LOADTEST_LIVEKIT_LATENCY_MS=str(args.livekit_latency_ms),
+        LIVEKIT_API_KEY="loadtest",
+        LIVEKIT_API_SECRET="loadtest-secret-loadtest-secret-0",
+        REAPER_ENABLED="false",
+    )
+    env.pop("ASYNC_DATABASE_URL", None)
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), "--serve", str(port)],
+        cwd=str(Path(__file__).resolve().parent.parent),
+        env=env,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+# ---------------------------------------------------------------------------
+# Client side
+# ---------------------------------------------------------------------------
+
+def synthetic_corpus(count: int, words: int, rng: random.Random):
+    """(filename, bytes) documents, each mostly about one topic"""
+    all_words = " ".join(TOPICS.values()).split()
+    docs = []
+    for n in range(count):
+        topic = list(TOPICS)[n % len(TOPICS)]
+        topic_words = TOPICS[topic].split()
+        paragraphs = []
+        for _ in range(max(1, words // 80)):
+            paragraphs.append(" ".join(
+                rng.choice(topic_words) if rng.random() < 0.7 else rng.choice(all_words) for _ in range(80)
+            ) + ".")
+        docs.append((f"{topic}_{n}.txt", "\n\n".join(paragraphs).encode("utf-8")))
+    return docs
+
+
+def corpus_from_dir(path: str):
+    """(filename, bytes) for the supported files in a directory"""
+    docs = []
+    for file in sorted(Path(path).iterdir()):
+        if file.suffix.lower() in (".pdf", ".docx", ".txt"):
+            docs.append((file.name, file.read_bytes()))
+    return docs
+
+
+def random_question(rng: random.Random) -> str:
+    topic = rng.choice(list(TOPICS))
+    words = rng.sample(TOPICS[topic].split(), 3)
+    return f"What is the policy on {' '.join(words)}?"
+
+
+async def wait_healthy(client, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.3)
+    raise RuntimeError("Backend did not become healthy")
+
+
+async def setup_agent(client, docs) -> str:
+    """Create the load-test agent and upload the corpus, returns the agent id"""
+    response = await client.post("/api/agents/create", json={"name": "Load Test Agent", "template_id": "general"})
+    response.raise_for_status()
+    agent_id = response.json()["id"]
+    
+    chunks = 0
+    started = time.perf_counter()
+    for filename, content in docs:
+        response = await client.post(f"/api/agents/{agent_id}/upload", files={"file": (filename, content)})
+        response.raise_for_status()
+        chunks += response.json()["chunks_processed"]
+    print(f"📚 Uploaded {len(docs)} documents ({chunks} chunks) in {time.perf_counter() - started:.1f}s")
+    return agent_id
+
+
+class LevelStats:
+    """Latencies and failures of one concurrency level"""
+    
+    def __init__(self):
+        self.latencies = defaultdict(list)  # endpoint -> ms
+        self.errors = defaultdict(int)  # endpoint -> failed requests
+        self.sessions = 0
+    
+    async def timed(self, endpoint, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        if not ok:
+            self.errors[endpoint] += 1
+        return response if ok else None
+    
+    @property
+    def requests(self):
+        return sum(len(v) for v in self.latencies.values())
+    
+    @property
+    def error_count(self):
+        return sum(self.errors.values())
+
+
+async def virtual_user(client, agent_id, stats: LevelStats, deadline, args, rng):
+    """Run sessions back to back until the level's deadline"""
+    while time.monotonic() < deadline:
+        response = await stats.timed("start", client.post("/api/sessions/start", json={"agent_id": agent_id}))
+        if response is None:
+            await asyncio.sleep(0.1)
+            continue
+        session_id = response.json()["session_id"]
+        
+        for _ in range(args.queries_per_session):
+            await stats.timed("query", client.post(
+                f"/api/sessions/{session_id}/query", json={"question": random_question(rng)}
+            ))
+            # Pause between questions, like a user listening to the answer
+            await asyncio.sleep(args.think_ms / 1000 * rng.uniform(0.5, 1.5))
+        
+        await stats.timed("end", client.post(f"/api/sessions/{session_id}/end"))
+        stats.sessions += 1
+
+
+async def sample_resources(process, client, stop: asyncio.Event, samples: list):
+    """CPU %, RSS of the backend process tree and event-loop lag from /metrics, every 0.5s"""
+    import psutil
+    
+    proc = psutil.Process(process.pid) if process is not None else None
+    if proc is not None:
+        proc.cpu_percent(None)
+    
+    while not stop.is_set():
+        await asyncio.sleep(0.5)
+        sample = {}
+        if proc is not None:
+            try:
+                tree = [proc] + proc.children(recursive=True)
+                sample["cpu"] = sum(p.cpu_percent(None) for p in tree)
+                sample["rss_mb"] = sum(p.memory_info().rss for p in tree) / 1e6
+            except psutil.Error:
+                pass
+        try:
+            text = (await client.get("/metrics")).text
+            for line in text.splitlines():
+                if line.startswith("event_loop_lag_last_seconds "):
+                    sample["lag_ms"] = float(line.split()[1]) * 1000
+        except Exception:
+            pass
+        samples.append(sample)
+
+
+async def run_level(client, process, agent_id, concurrency, args):
+    stats = LevelStats()
+    samples = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(sample_resources(process, client, stop, samples))
+    
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.level_duration
+    await asyncio.gather(*(
+        virtual_user(client, agent_id, stats, deadline, args, random.Random(concurrency * 1000 + n))
+        for n in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    
+    def series(key):
+        return [s[key] for s in samples if key in s]
+    
+    result = {
+        "concurrency": concurrency,
+        "sessions": stats.sessions,
+        "requests": stats.requests,
+        "errors": stats.error_count,
+        "error_rate": stats.error_count / max(1, stats.requests),
+        "req_per_s": stats.requests / elapsed,
+        "sessions_per_s": stats.sessions / elapsed,
+        "endpoints": {
+            endpoint: {
+                "count": len(values),
+                "errors": stats.errors[endpoint],
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "p99_ms": percentile(values, 99),
+            }
+            for endpoint, values in stats.latencies.items()
+        },
+        "cpu_avg": sum(series("cpu")) / len(series("cpu")) if series("cpu") else None,
+        "cpu_max": max(series("cpu"), default=None),
+        "rss_max_mb": max(series("rss_mb"), default=None),
+        "loop_lag_max_ms": max(series("lag_ms"), default=None),
+    }
+    return result
+
+
+def print_level(result):
+    fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+    print(f"\n▶ concurrency {result['concurrency']}: {result['sessions']} sessions, "
+          f"{result['req_per_s']:.1f} req/s, {result['errors']} errors ({result['error_rate']:.1%}), "
+          f"CPU avg {fmt(result['cpu_avg'], '.0f')}% max {fmt(result['cpu_max'], '.0f')}%, "
+          f"RSS {fmt(result['rss_max_mb'], '.0f')} MB, loop lag max {fmt(result['loop_lag_max_ms'], '.0f')} ms")
+    print(f"   {'endpoint':<8}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint in ("start", "query", "end"):
+        e = result["endpoints"].get(endpoint)
+        if e:
+            print(f"   {endpoint:<8}{e['count']:>8}{e['errors']:>8}{e['p50_ms']:>10.1f}{e['p95_ms']:>10.1f}{e['p99_ms']:>10.1f}")
+
+
+async def main_async(args):
+    import httpx
+    
+    process, base_url = (None, args.url) if args.url else start_server(args)
+    max_users = max(args.ramp)
+    limits = httpx.Limits(max_connections=max_users * 2, max_keepalive_connections=max_users * 2)
+    
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await wait_healthy(client)
+            rng = random.Random(42)
+            docs = corpus_from_dir(args.corpus) if args.corpus else synthetic_corpus(args.synthetic_docs, args.doc_words, rng)
+            agent_id = await setup_agent(client, docs)
+            
+            for concurrency in args.ramp:
+                result = await run_level(client, process, agent_id, concurrency, args)
+                results.append(result)
+                print_level(result)
+                
+                query_p95 = result["endpoints"].get("query", {}).get("p95_ms", 0)
+                if result["error_rate"] > args.max_error_rate or query_p95 > args.slo_p95_ms:
+                    print(f"\n💥 Breaking point at {concurrency} concurrent sessions "
+                          f"(error rate {result['error_rate']:.1%}, query p95 {query_p95:.0f} ms)")
+                    break
+            else:
+                print(f"\n✅ No breaking point up to {max(args.ramp)} concurrent sessions")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+    
+    return results
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve":
+        serve(int(sys.argv[2]))
+        return
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Existing backend to test instead of starting one")
+    parser.add_argument("--ramp", default="1,5,10,25,50", help="Comma separated concurrency levels")
+    parser.add_argument("--level-duration", type=float, default=20.0, help="Seconds per concurrency level")
+    parser.add_argument("--queries-per-session", type=int, default=5)
+    parser.add_argument("--think-ms", type=float, default=200.0, help="Mean pause between questions")
+    parser.add_argument("--corpus", default=None, help="Directory of .pdf/.docx/.txt files to upload")
+    parser.add_argument("--synthetic-docs", type=int, default=20)
+    parser.add_argument("--doc-words", type=int, default=2000)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0, help="Simulated embedding model time")
+    parser.add_argument("--livekit-latency-ms", type=float, default=30.0, help="Simulated LiveKit API round trip")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--slo-p95-ms", type=float, default=1000.0, help="Query p95 that counts as broken")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    args = parser.parse_args()
+    args.ramp = [int(level) for level in args.ramp.split(",")]
+    
+    print("\n" + "=" * 72)
+    print("🚦 CONCURRENT SESSION LOAD TEST")
+    print("=" * 72)
+    print(f"   Backend: {args.url or 'local child process (fake LiveKit, stub embeddings)'}")
+    print(f"   Ramp: {args.ramp}, {args.level_duration:.0f}s per level, "
+          f"{args.queries_per_session} queries per session, think time {args.think_ms:.0f} ms")
+    
+    results = asyncio.run(main_async(args))
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "levels": results}, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+    print()
+
+
+if __name__ == "__main__":
+    main()
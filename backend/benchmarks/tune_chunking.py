@@ -0,0 +1,280 @@
+"""
+Offline tuning of an agent's chunk settings (Agent.chunk_size / chunk_overlap)
+Re-chunks the agent's documents (originals from the blob store) with every candidate
+chunk size x overlap, embeds them with the configured embedding model and replays a
+sample of the agent's logged questions (Query rows) with exact nearest-neighbour search,
+so chunking is the only thing that varies. For each candidate it reports:
+
+    hit rate   share of questions whose top-k context covers the logged answer (at least
+               --coverage of its content words) or, for questions without an answer,
+               holds a chunk of one of the logged source documents
+    context    mean characters of the top-k chunks, sent to the model on each voice turn
+    index      chunks stored (vectors) and characters embedded (embedding cost)
+
+The recommendation is the candidate with the smallest context (then the smallest index)
+whose hit rate is within --tolerance of the best one. Nothing is written: apply it with
+PUT /api/agents/{id} {"chunk_size": ..., "chunk_overlap": ...}, which re-indexes the agent.
+Logged answers and sources come from the current settings, so treat the hit rate as a
+relative measure between candidates.
+
+Run from backend/ so DATABASE_URL and BLOB_STORE_DIR resolve as they do for the server.
+
+Usage:
+    python benchmarks/tune_chunking.py --agent <agent_id> [--sizes 300,500,800,1000,1500]
+                                       [--overlaps 0,0.1,0.2] [--queries 200] [--k 5]
+                                       [--coverage 0.5] [--tolerance 0.02] [--json out.json]
+    python benchmarks/tune_chunking.py --agent <agent_id> --stub-embeddings   # dry run, no model calls
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+EMBED_BATCH = 100  # chunks per embedding call
+STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "all", "any", "can", "her", "was", "one", "our", "out",
+    "has", "have", "had", "this", "that", "with", "from", "they", "will", "would", "there", "their", "what",
+    "about", "which", "when", "your", "also", "into", "than", "then", "them", "these", "those", "been",
+    "were", "being", "does", "did", "how", "who", "its", "more", "some", "such", "only", "other", "may",
+}
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+def float_list(value):
+    return [float(v) for v in value.split(",")]
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def fmt(value):
+    return f"{value:.3f}" if value is not None else "-"
+
+
+def content_words(text):
+    return {word for word in _WORD.findall((text or "").lower()) if word not in STOPWORDS}
+
+
+async def load_agent(agent_id, queries, seed):
+    """The agent, its documents with a stored original, and a sample of its logged questions"""
+    from sqlalchemy import select
+    from blob_store import blob_store
+    from database import AsyncSessionLocal, async_engine
+    from models import Agent, Document, Query
+
+    try:
+        async with AsyncSessionLocal() as db:
+            agent = await db.get(Agent, agent_id)
+            if agent is None:
+                raise SystemExit(f"❌ Agent {agent_id} not found")
+            documents = (await db.execute(select(Document).where(Document.agent_id == agent_id))).scalars().all()
+            result = await db.execute(
+                select(Query.question, Query.answer, Query.sources)
+                .where(Query.agent_id == agent_id, Query.question.isnot(None))
+                .order_by(Query.timestamp.desc())
+                .limit(queries * 5)
+            )
+            logged = [
+                {"question": row.question, "answer": row.answer or "", "sources": row.sources or []}
+                for row in result if row.question.strip()
+            ]
+    finally:
+        await async_engine.dispose()  # an open aiosqlite connection keeps the process from exiting
+
+    stored = [d for d in documents if blob_store.exists(d.blob_key)]
+    originals = [(blob_store.path(d.blob_key), d.filename) for d in stored]
+    random.Random(seed).shuffle(logged)
+    return agent, originals, len(documents) - len(stored), logged[:queries]
+
+
+def chunk_corpus(pipeline, agent_id, originals, chunk_size, chunk_overlap):
+    """Chunks (text, filename) of all originals with one setting, de-duplicated as at ingest"""
+    from dedup import NearDuplicateIndex
+
+    index = NearDuplicateIndex()
+    corpus = []
+    for path, filename in originals:
+        try:
+            chunks, _ = pipeline.extract_chunks(path, filename, chunk_size, chunk_overlap)
+        except ValueError:
+            continue  # no text
+        chunks, _ = pipeline.suppress_duplicates(agent_id, chunks, None, index, False)
+        corpus.extend((chunk, filename) for chunk in chunks)
+    return corpus
+
+
+def embed(pipeline, texts, cache):
+    """Unit vectors for texts, embedding only those not seen with an earlier candidate"""
+    missing = [text for text in dict.fromkeys(texts) if text not in cache]
+    for start in range(0, len(missing), EMBED_BATCH):
+        batch = missing[start:start + EMBED_BATCH]
+        for text, vector in zip(batch, pipeline.embeddings.embed_documents(batch)):
+            vector = np.asarray(vector, dtype=np.float32)
+            cache[text] = vector / (np.linalg.norm(vector) or 1.0)
+    return np.stack([cache[text] for text in texts]) if texts else np.zeros((0, 1), dtype=np.float32)
+
+
+def evaluate(corpus, chunk_vectors, questions, question_vectors, k, coverage):
+    """Hit rate, answer coverage, source hit rate and context size over the questions"""
+    scores = question_vectors @ chunk_vectors.T
+    top = np.argsort(-scores, axis=1)[:, :k]
+
+    hits, judged, coverages, source_hits, sourced, context_chars = 0, 0, [], 0, 0, []
+    for question, row in zip(questions, top):
+        context = [corpus[i] for i in row]
+        context_chars.append(sum(len(text) for text, _ in context))
+        files = {filename for _, filename in context}
+        source_hit = bool(files & set(question["sources"]))
+        if question["sources"]:
+            sourced += 1
+            source_hits += source_hit
+
+        answer = content_words(question["answer"])
+        if len(answer) >= 3:
+            covered = len(answer & content_words(" ".join(text for text, _ in context))) / len(answer)
+            coverages.append(covered)
+            hit = covered >= coverage
+        elif question["sources"]:
+            hit = source_hit
+        else:
+            continue
+        judged += 1
+        hits += hit
+
+    return {
+        "hit_rate": round(hits / judged, 4) if judged else None,
+        "questions_judged": judged,
+        "answer_coverage": round(float(np.mean(coverages)), 4) if coverages else None,
+        "source_hit_rate": round(source_hits / sourced, 4) if sourced else None,
+        "context_chars": round(float(np.mean(context_chars)), 1) if context_chars else 0.0,
+    }
+
+
+def recommend(results, tolerance):
+    """Smallest context, then index, among candidates within tolerance of the best hit rate"""
+    rated = [row for row in results if row["hit_rate"] is not None]
+    if not rated:
+        return None
+    best = max(row["hit_rate"] for row in rated)
+    eligible = [row for row in rated if row["hit_rate"] >= best - tolerance]
+    return min(eligible, key=lambda row: (row["context_chars"], row["chunks"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agent", required=True, help="Agent id")
+    parser.add_argument("--sizes", type=int_list, default=int_list("300,500,800,1000,1500"), help="chunk_size candidates")
+    parser.add_argument("--overlaps", type=float_list, default=float_list("0,0.1,0.2"), help="Overlaps as a fraction of chunk_size")
+    parser.add_argument("--queries", type=int, default=200, help="Logged questions to replay")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per question (query_rag default)")
+    parser.add_argument("--coverage", type=float, default=0.5, help="Answer content words the context must hold")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Hit rate a smaller setting may give up")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stub-embeddings", action="store_true", help="Deterministic hashed embeddings (dry run)")
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    args = parser.parse_args()
+
+    # The live vector store is never touched, retrieval is replayed in memory
+    os.environ["CHROMADB_PATH"] = tempfile.mkdtemp(prefix="xebia_tune_chunking_")
+    if args.stub_embeddings:
+        os.environ["USE_STUB_EMBEDDINGS"] = "true"
+        os.environ["STUB_EMBEDDING_LATENCY_MS"] = "0"
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    from rag_pipeline import RAGPipeline, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+
+    agent, originals, without_original, questions = asyncio.run(load_agent(args.agent, args.queries, args.seed))
+    if not originals:
+        print(f"❌ No stored originals for agent {args.agent}, re-upload its documents to tune chunking")
+        return 1
+    if not questions:
+        print(f"❌ No logged questions for agent {args.agent}")
+        return 1
+
+    pipeline = RAGPipeline()
+    current = (agent.chunk_size or DEFAULT_CHUNK_SIZE,
+               DEFAULT_CHUNK_OVERLAP if agent.chunk_overlap is None else agent.chunk_overlap)
+    candidates = sorted({
+        (size, int(size * ratio)) for size in args.sizes for ratio in args.overlaps if int(size * ratio) < size
+    } | {current})
+
+    print("\n" + "=" * 72)
+    print("✂️  CHUNKING TUNER")
+    print("=" * 72)
+    print(f"   Agent: {agent.name} ({agent.id}), current chunk_size {current[0]}, overlap {current[1]}")
+    print(f"   Corpus: {len(originals)} documents ({without_original} without a stored original skipped)")
+    print(f"   Questions: {len(questions)}, k={args.k}, answer coverage >= {args.coverage}")
+    print(f"\n   {'size':>6} {'overlap':>8} {'chunks':>8} {'embedded':>10} {'context':>9} {'hit rate':>9} "
+          f"{'coverage':>9} {'src hit':>8} {'embed s':>8}")
+
+    cache = {}
+    started = time.perf_counter()
+    question_vectors = embed(pipeline, [q["question"] for q in questions], {})
+    results = []
+    for chunk_size, chunk_overlap in candidates:
+        corpus = chunk_corpus(pipeline, agent.id, originals, chunk_size, chunk_overlap)
+        if not corpus:
+            continue
+        embed_started = time.perf_counter()
+        chunk_vectors = embed(pipeline, [text for text, _ in corpus], cache)
+        row = {
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "current": (chunk_size, chunk_overlap) == current,
+            "chunks": len(corpus),
+            "embedded_chars": sum(len(text) for text, _ in corpus),
+            "embed_seconds": round(time.perf_counter() - embed_started, 2),
+            **evaluate(corpus, chunk_vectors, questions, question_vectors, args.k, args.coverage),
+        }
+        results.append(row)
+        print(f" {'*' if row['current'] else ' '} {chunk_size:>6} {chunk_overlap:>8} {row['chunks']:>8} "
+              f"{row['embedded_chars']:>10} {row['context_chars']:>9.0f} {fmt(row['hit_rate']):>9} "
+              f"{fmt(row['answer_coverage']):>9} {fmt(row['source_hit_rate']):>8} {row['embed_seconds']:>8.1f}")
+
+    best = recommend(results, args.tolerance)
+    baseline = next((row for row in results if row["current"]), None)
+    print(f"\n   * current setting, {time.perf_counter() - started:.1f}s total")
+    if best is None:
+        print("❌ No question could be judged (logged questions have neither answers nor sources)")
+    elif best["current"]:
+        print("✅ The current setting is already the recommended one")
+    else:
+        print(f"💡 Recommended: chunk_size {best['chunk_size']}, chunk_overlap {best['chunk_overlap']}")
+        if baseline is not None and baseline["hit_rate"] is not None:
+            print(f"   hit rate {baseline['hit_rate']:.3f} -> {best['hit_rate']:.3f}, "
+                  f"context {baseline['context_chars']:.0f} -> {best['context_chars']:.0f} chars/turn, "
+                  f"index {baseline['chunks']} -> {best['chunks']} chunks")
+        print(f"   Apply: PUT /api/agents/{agent.id} "
+              f"{json.dumps({'chunk_size': best['chunk_size'], 'chunk_overlap': best['chunk_overlap']})}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "agent_id": agent.id,
+                "created_at": datetime.utcnow().isoformat(),
+                "args": vars(args),
+                "documents": len(originals),
+                "questions": len(questions),
+                "results": results,
+                "recommended": best,
+            }, f, indent=2)
+        print(f"   Results written to {args.json}")
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
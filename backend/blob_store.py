@@ -0,0 +1,84 @@
+"""
+Original document store
+Uploaded files are kept under BLOB_STORE_DIR keyed by their SHA-256 (Document.blob_key),
+so the same file uploaded to several agents is stored once and every document can be
+re-extracted and re-embedded later (see reindex.py). Blobs are written with an atomic
+rename and never modified; ones no Document references any more are removed by the
+collection reaper's sweep after a grace period that covers uploads still in flight.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, Optional, Set
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "./blobs")
+BLOB_STORE_ENABLED = os.getenv("BLOB_STORE_ENABLED", "true").lower() == "true"
+BLOB_MIN_AGE = 3600  # seconds; unreferenced blobs younger than this may belong to an upload in flight
+
+
+class BlobStore:
+    """Content-addressed store of original uploaded files"""
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: Optional[str]) -> bool:
+        return bool(key) and os.path.exists(self.path(key))
+
+    def _write(self, source_path: str, key: str) -> bool:
+        destination = self.path(key)
+        if os.path.exists(destination):
+            os.utime(destination)  # restarts the grace period for the sweep
+            return False
+
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        tmp_path = f"{destination}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, destination)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return True
+
+    async def put(self, source_path: str, key: str) -> Optional[str]:
+        """Store a spooled upload under its SHA-256 (a no-op if already stored), returns the key"""
+        if not BLOB_STORE_ENABLED:
+            return None
+        await asyncio.to_thread(self._write, source_path, key)
+        return key
+
+    def sweep(self, referenced: Set[str], min_age: float = BLOB_MIN_AGE, dry_run: bool = False) -> Dict:
+        """Remove blobs not in referenced (and leftover temp files) older than min_age"""
+        deleted = 0
+        freed = 0
+        if not os.path.isdir(self.root):
+            return {"blobs_deleted": 0, "blob_bytes_reclaimed": 0}
+
+        now = time.time()
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                key = name.split(".", 1)[0]
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime <= min_age or (key in referenced and name == key):
+                    continue
+                if not dry_run:
+                    os.unlink(path)
+                deleted += 1
+                freed += stat.st_size
+        return {"blobs_deleted": deleted, "blob_bytes_reclaimed": freed}
+
+
+# Singleton instance
+blob_store = BlobStore()
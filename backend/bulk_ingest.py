@@ -0,0 +1,374 @@
+"""
+Bulk document ingestion
+Many files, or the members of zip archives, go through one pipeline. A producer extracts,
+chunks and de-duplicates file N+1 on a worker thread while the consumer embeds file N,
+and embedding calls are filled up to BULK_EMBED_BATCH chunks across file boundaries, so
+hundreds of small documents cost a few large embedding calls instead of one call each.
+Each document is committed as soon as its chunks are stored and every file gets its own
+outcome (success, duplicate, error or skipped), so one bad file does not sink the batch.
+Chunks repeating an earlier file of the upload are held back rather than dropped and only
+stored if that file ends up failing, so its failure does not take them with it.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from fastapi import UploadFile
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import dedup
+import metrics
+from metrics import observe
+from tracing import span
+from models import Agent, Document
+from schemas import DocumentResponse
+from rag_pipeline import rag_pipeline, UPLOAD_READ_BLOCK
+from blob_store import blob_store
+from upload_limits import MAX_UPLOAD_BYTES
+
+logger = logging.getLogger(__name__)
+
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "500"))
+BULK_MAX_EXTRACTED_BYTES = int(float(os.getenv("BULK_MAX_EXTRACTED_MB", "1024")) * 1024 * 1024)
+BULK_EMBED_BATCH = int(os.getenv("BULK_EMBED_BATCH", "256"))  # chunks per embedding call
+BULK_PREFETCH_FILES = int(os.getenv("BULK_PREFETCH_FILES", "4"))  # extracted files queued ahead of embedding
+
+
+class BulkLimitExceeded(Exception):
+    """A bulk upload holds too many files or expands beyond BULK_MAX_EXTRACTED_MB"""
+
+
+def _entry(filename: str, **fields) -> Dict:
+    return {"filename": filename, "path": None, "status": None, **fields}
+
+
+def _check_file_count(entries: List[Dict]) -> None:
+    if len(entries) >= BULK_MAX_FILES:
+        raise BulkLimitExceeded(f"A bulk upload may hold at most {BULK_MAX_FILES} files")
+
+
+def _spool_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, limit: int) -> Dict:
+    """Copy an archive member to a temporary file, hashing it (sizes in the zip header are not trusted)"""
+    digest = hashlib.sha256()
+    size = 0
+    with archive.open(info) as source, tempfile.NamedTemporaryFile(delete=False, suffix=Path(info.filename).suffix) as tmp_file:
+        try:
+            while True:
+                block = source.read(UPLOAD_READ_BLOCK)
+                if not block:
+                    break
+                size += len(block)
+                if size > limit:
+                    raise BulkLimitExceeded(f"{info.filename} expands beyond the upload limits")
+                digest.update(block)
+                tmp_file.write(block)
+        except Exception:
+            tmp_file.close()
+            os.unlink(tmp_file.name)
+            raise
+    return {"path": tmp_file.name, "size": size, "sha256": digest.hexdigest()}
+
+
+def expand_archive(path: str, archive_name: str, allowed_extensions: Iterable[str], entries: List[Dict]) -> None:
+    """Spool the supported members of a zip archive into entries"""
+    extracted = sum(entry.get("size", 0) for entry in entries)
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        entries.append(_entry(archive_name, status="error", detail="Not a valid zip archive"))
+        return
+
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or Path(name).name.startswith("."):
+                continue
+            _check_file_count(entries)
+            if Path(name).suffix.lower() not in allowed_extensions:
+                entries.append(_entry(name, status="skipped", detail="Unsupported file type"))
+                continue
+            if info.file_size > MAX_UPLOAD_BYTES:
+                entries.append(_entry(name, status="error", detail="File exceeds the upload size limit"))
+                continue
+
+            spooled = _spool_member(archive, info, min(MAX_UPLOAD_BYTES, BULK_MAX_EXTRACTED_BYTES - extracted))
+            extracted += spooled["size"]
+            entries.append(_entry(name, **spooled))
+
+
+async def spool_files(files: List[UploadFile], allowed_extensions: Iterable[str], entries: List[Dict]) -> None:
+    """Stream uploaded files to disk, expanding zip archives, into entries (caller removes them)"""
+    for file in files:
+        filename = file.filename or "upload"
+        suffix = Path(filename).suffix.lower()
+        if suffix != ".zip" and suffix not in allowed_extensions:
+            entries.append(_entry(filename, status="error", detail="Unsupported file type"))
+            continue
+        _check_file_count(entries)
+
+        spooled = await rag_pipeline.spool_upload(file)
+        if suffix != ".zip":
+            entries.append(_entry(filename, **spooled))
+            continue
+        try:
+            await asyncio.to_thread(expand_archive, spooled["path"], filename, allowed_extensions, entries)
+        finally:
+            os.unlink(spooled["path"])
+
+
+def remove_spooled(entries: List[Dict]) -> None:
+    for entry in entries:
+        if entry.get("path") and os.path.exists(entry["path"]):
+            os.unlink(entry["path"])
+
+
+async def _stored_hashes(db: AsyncSession, agent_id: str, hashes: set) -> Dict[str, str]:
+    """Content hash -> document id for the agent's documents matching any of the hashes"""
+    if not hashes:
+        return {}
+    result = await db.execute(
+        select(Document.content_hash, Document.id).where(
+            Document.agent_id == agent_id, Document.content_hash.in_(hashes)
+        )
+    )
+    return dict(result.all())
+
+
+def _hold_back_repeats(index: dedup.NearDuplicateIndex, extracted: Dict[str, Dict], entry: Dict, chunks: List[str]) -> List[str]:
+    """Move chunks repeating an earlier file of the upload to entry["held_back"], returns the others"""
+    kept = []
+    entry["held_back"] = []  # (chunk, entry of the earlier file holding a copy)
+    for chunk in chunks:
+        signature = entry["signatures"][chunk]
+        position = index.match(signature)
+        if position is not None:
+            entry["held_back"].append((chunk, extracted[index.owners[position]]))
+            continue
+        index.add(signature, entry["doc_id"])
+        kept.append(chunk)
+    return kept
+
+
+async def _extract(agent: Agent, entries: List[Dict], known: Dict[str, str], queue: asyncio.Queue) -> None:
+    """Producer: extract, chunk and de-duplicate one file after another"""
+    agent_id, chunk_size, chunk_overlap = agent.id, agent.chunk_size, agent.chunk_overlap
+    index = dedup.NearDuplicateIndex()  # chunks kept from earlier files of this upload
+    extracted: Dict[str, Dict] = {}  # doc_id -> entry, for the owners in index
+    try:
+        for entry in entries:
+            duplicate_of = known.get(entry["sha256"])
+            if duplicate_of:
+                entry.update(status="duplicate", duplicate_of=duplicate_of)
+                continue
+            entry["doc_id"] = str(uuid.uuid4())
+            known[entry["sha256"]] = entry["doc_id"]
+
+            try:
+                chunks, furniture_lines = await asyncio.to_thread(
+                    rag_pipeline.extract_chunks, entry["path"], entry["filename"], chunk_size, chunk_overlap
+                )
+                # Against the stored chunks here, against earlier files of the upload once they are stored
+                suppressed_by = set()
+                entry["signatures"] = {}  # MinHash of the kept chunks, reused for the repeats check and the LSH metadata
+                chunks, suppressed = await asyncio.to_thread(
+                    rag_pipeline.suppress_duplicates,
+                    agent_id, chunks, None, None, True, entry["doc_id"], suppressed_by, entry["signatures"]
+                )
+                if dedup.DEDUP_ENABLED:
+                    chunks = await asyncio.to_thread(_hold_back_repeats, index, extracted, entry, chunks)
+            except Exception as e:
+                metrics.INGEST_DOCUMENTS.labels("error").inc()
+                entry.update(status="error", detail=str(e))
+                continue
+
+            entry.update(
+                chunks=chunks, chunks_suppressed=suppressed, suppressed_by=suppressed_by,
+                furniture_lines_removed=furniture_lines
+            )
+            extracted[entry["doc_id"]] = entry
+            await queue.put(entry)
+    except Exception as e:
+        logger.error(f"❌ Bulk extraction stopped: {e}")
+        for entry in entries:
+            if entry["status"] is None and "chunks" not in entry:
+                entry.update(status="error", detail=f"Extraction stopped: {e}")
+    await queue.put(None)
+
+
+async def _embed_batch(batch: List[tuple]) -> None:
+    """Embed one batch of (entry, chunk position) pairs that may span several files"""
+    texts = [entry["chunks"][n] for entry, n in batch]
+    try:
+        vectors = await asyncio.to_thread(rag_pipeline.embed_chunks, texts)
+    except Exception as e:
+        for entry, _ in batch:
+            if entry["status"] is None:
+                metrics.INGEST_DOCUMENTS.labels("error").inc()
+                entry.update(status="error", detail=f"Embedding failed: {e}")
+        return
+
+    for (entry, n), vector in zip(batch, vectors):
+        entry["embeddings"][n] = vector
+        entry["missing"] -= 1
+
+
+async def _store(db: AsyncSession, agent: Agent, entry: Dict) -> None:
+    """Add a fully embedded file's chunks and commit its Document row"""
+    agent_id = agent.id
+    doc_id = entry["doc_id"]
+    stored = False
+    try:
+        # Held-back repeats of earlier files are dropped if that file was stored, else stored here
+        # (earlier files are always settled first: embedding batches are filled in file order)
+        restored = []
+        for chunk, earlier in entry.get("held_back", ()):
+            if earlier["status"] == "success":
+                entry["suppressed_by"].add(earlier["doc_id"])
+            else:
+                restored.append(chunk)
+        entry["chunks_suppressed"] += len(entry.get("held_back", ())) - len(restored)
+        if restored:
+            entry["embeddings"] += await asyncio.to_thread(rag_pipeline.embed_chunks, restored)
+            entry["chunks"] = entry["chunks"] + restored
+        chunks = entry["chunks"]
+        
+        if chunks:
+            chunk_ids, metadatas = await asyncio.to_thread(
+                rag_pipeline.chunk_records, doc_id, entry["filename"], chunks, None, entry["signatures"]
+            )
+            async with rag_pipeline.agent_lock(agent_id):
+                with observe(metrics.INGEST_STAGE_LATENCY.labels("store")), span("ingest.store"):
+                    await asyncio.to_thread(
+                        rag_pipeline.add_chunks,
+                        agent_id,
+                        agent.index_profile,
+                        ids=chunk_ids,
+                        embeddings=entry["embeddings"],
+                        documents=chunks,
+                        metadatas=metadatas
+                    )
+            stored = True
+
+        document = Document(
+            id=doc_id,
+            agent_id=agent_id,
+            filename=entry["filename"],
+            file_size=entry["size"],
+            chunk_count=len(chunks),
+            content_hash=entry["sha256"],
+            blob_key=await blob_store.put(entry["path"], entry["sha256"]),
+            suppressed_by=sorted(entry["suppressed_by"]) or None,
+            uploaded_at=datetime.utcnow()
+        )
+        agent.document_count += 1
+        agent.updated_at = datetime.utcnow()
+        db.add(document)
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        await db.refresh(agent)  # rollback expires it, later files still update it
+        if stored:
+            async with rag_pipeline.agent_lock(agent_id):
+                await asyncio.to_thread(rag_pipeline.delete_document_chunks, agent_id, doc_id)
+        existing = await _stored_hashes(db, agent_id, {entry["sha256"]}) if isinstance(e, IntegrityError) else {}
+        if existing:
+            # A concurrent upload of the same file committed first
+            entry.update(status="duplicate", duplicate_of=existing[entry["sha256"]])
+        else:
+            metrics.INGEST_DOCUMENTS.labels("error").inc()
+            entry.update(status="error", detail=str(e))
+        return
+
+    metrics.INGEST_DOCUMENTS.labels("success").inc()
+    metrics.INGEST_CHUNKS.inc(len(chunks))
+    metrics.INGEST_BYTES.inc(entry["size"])
+    entry.update(status="success", document=DocumentResponse.model_validate(document))
+
+
+async def _embed_and_store(db: AsyncSession, agent: Agent, queue: asyncio.Queue) -> None:
+    """Consumer: fill embedding batches across files, store each file once all its chunks are embedded"""
+    waiting: List[Dict] = []  # files with chunks still being embedded
+    buffer: List[tuple] = []  # (entry, chunk position) not yet embedded
+    done = False
+    while not done:
+        entry = await queue.get()
+        if entry is None:
+            done = True
+        else:
+            entry["embeddings"] = [None] * len(entry["chunks"])
+            entry["missing"] = len(entry["chunks"])
+            waiting.append(entry)
+            buffer.extend((entry, n) for n in range(len(entry["chunks"])))
+
+        while len(buffer) >= BULK_EMBED_BATCH or (done and buffer):
+            batch, buffer = buffer[:BULK_EMBED_BATCH], buffer[BULK_EMBED_BATCH:]
+            await _embed_batch(batch)
+            buffer = [item for item in buffer if item[0]["status"] is None]  # drop chunks of failed files
+
+        for entry in waiting:
+            if entry["status"] is None and entry["missing"] == 0:
+                await _store(db, agent, entry)
+        waiting = [entry for entry in waiting if entry["status"] is None]
+
+
+def _result(entry: Dict, uploaded: Dict[str, Dict]) -> Dict:
+    status = entry["status"]
+    duplicate_of = entry.get("duplicate_of")
+    original = uploaded.get(duplicate_of) if status == "duplicate" else None
+    if original is not None and original["status"] == "duplicate":
+        duplicate_of = original["duplicate_of"]  # the earlier copy in this upload was itself a duplicate
+    elif original is not None and original["status"] != "success":
+        return {"filename": entry["filename"], "status": "error", "detail": "Duplicate of a file that failed"}
+
+    result = {"filename": entry["filename"], "status": status}
+    if status == "success":
+        result.update(
+            document=entry["document"],
+            chunks_processed=len(entry["chunks"]),
+            chunks_suppressed=entry["chunks_suppressed"],
+            furniture_lines_removed=entry["furniture_lines_removed"]
+        )
+    elif status == "duplicate":
+        result["duplicate_of"] = duplicate_of
+    else:
+        result["detail"] = entry.get("detail")
+    return result
+
+
+async def ingest_files(db: AsyncSession, agent: Agent, entries: List[Dict]) -> Dict:
+    """Ingest spooled files into an agent's knowledge base, one result per file in upload order"""
+    pending = [entry for entry in entries if entry["status"] is None]
+    known = await _stored_hashes(db, agent.id, {entry["sha256"] for entry in pending})
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=BULK_PREFETCH_FILES)
+    with span("ingest.bulk", files=len(pending)):
+        producer = asyncio.create_task(_extract(agent, pending, known, queue))
+        try:
+            await _embed_and_store(db, agent, queue)
+        finally:
+            producer.cancel()
+
+    uploaded = {entry["doc_id"]: entry for entry in entries if entry.get("doc_id")}
+    results = [_result(entry, uploaded) for entry in entries]
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("success", "duplicate", "error", "skipped")}
+    logger.info(f"📦 Bulk upload for agent {agent.id}: {counts}")
+    return {
+        "status": "success" if not counts["error"] else ("partial" if counts["success"] or counts["duplicate"] else "error"),
+        "documents_added": counts["success"],
+        "duplicates": counts["duplicate"],
+        "errors": counts["error"],
+        "skipped": counts["skipped"],
+        "chunks_processed": sum(r.get("chunks_processed", 0) for r in results),
+        "files": results,
+    }
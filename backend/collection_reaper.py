@@ -0,0 +1,232 @@
+"""
+Vector store garbage collection
+Session collections are normally dropped by end_session, but clients that never
+call it leave agent_{id}_session_{sid} collections behind. The reaper periodically
+cross-references collections with the sessions / agents tables, deletes stale ones
+in bulk and removes the HNSW segment files ChromaDB leaves on disk after a delete
+(only for an in-process store; a Chroma server's files are not ours to sweep or size).
+It also sweeps original files in the blob store that no document references any more.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update
+
+from database import AsyncSessionLocal
+from models import Agent, Document, Session as SessionModel
+from rag_pipeline import rag_pipeline
+from blob_store import blob_store
+from vector_store import dir_size
+
+logger = logging.getLogger(__name__)
+
+REAPER_ENABLED = os.getenv("REAPER_ENABLED", "true").lower() == "true"
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "900"))  # seconds between passes
+SESSION_MAX_AGE_HOURS = float(os.getenv("SESSION_MAX_AGE_HOURS", "6"))  # active sessions older than this are abandoned
+SEGMENT_MIN_AGE = 600  # seconds; never touch segment directories younger than this
+
+_SESSION_COLLECTION = re.compile(r"^agent_(?P<agent_id>[0-9a-f-]{36})_session_(?P<session_id>[0-9a-f-]{36})$")
+_AGENT_COLLECTION = re.compile(r"^agent_(?P<agent_id>[0-9a-f-]{36})$")
+_REBUILD_COLLECTION = re.compile(r"^agent_(?P<agent_id>[0-9a-f-]{36})_(rebuild|retired)_[0-9a-f]{8}$")
+_UUID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+_LOOKUP_CHUNK = 500  # ids per IN (...) query
+
+
+def sweep_segment_files(chroma_path: str, min_age: float = SEGMENT_MIN_AGE) -> int:
+    """
+    Remove segment directories no longer referenced by ChromaDB, returns bytes freed.
+    ChromaDB drops a deleted collection's metadata but keeps its HNSW files on disk.
+    """
+    db_file = os.path.join(chroma_path, "chroma.sqlite3")
+    if not os.path.exists(db_file):
+        return 0
+    
+    # List directories before reading the segment table, so a collection created
+    # meanwhile is either referenced already or not yet in our listing
+    candidates = [
+        entry for entry in os.scandir(chroma_path)
+        if entry.is_dir() and _UUID.match(entry.name) and time.time() - entry.stat().st_mtime > min_age
+    ]
+    
+    try:
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+        try:
+            live = {row[0] for row in conn.execute("SELECT id FROM segments")}
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Segment sweep skipped, could not read ChromaDB segments: {e}")
+        return 0
+    
+    freed = 0
+    for entry in candidates:
+        if entry.name not in live:
+            size = dir_size(entry.path)
+            shutil.rmtree(entry.path, ignore_errors=True)
+            freed += size
+    return freed
+
+
+class CollectionReaper:
+    """Periodic cleanup of orphaned and stale ChromaDB collections"""
+    
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        interval: float = REAPER_INTERVAL,
+        max_session_age: timedelta = timedelta(hours=SESSION_MAX_AGE_HOURS),
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_session_age = max_session_age
+        self.last_report: Optional[Dict] = None
+        
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self) -> None:
+        """Start the periodic reaper task (call from app startup)"""
+        if self._task is not None or not REAPER_ENABLED:
+            return
+        self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self) -> None:
+        """Stop the reaper task (call from app shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _loop(self) -> None:
+        while True:
+            try:
+                report = await self.run_once()
+                if report["collections_deleted"] or report["bytes_reclaimed"] or report["blobs_deleted"]:
+                    # bytes_reclaimed is None with a Chroma server (not measured)
+                    logger.info(
+                        f"🧹 Reaped {report['collections_deleted']} collections and {report['blobs_deleted']} blobs, "
+                        f"reclaimed {((report['bytes_reclaimed'] or 0) + report['blob_bytes_reclaimed']) / 1e6:.1f} MB"
+                    )
+            except Exception as e:
+                logger.error(f"❌ Collection reaper pass failed: {e}")
+            await asyncio.sleep(self.interval)
+    
+    async def run_once(self, dry_run: bool = False) -> Dict:
+        """One reaper pass, returns a report of what was (or would be) deleted"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        
+        async with self._lock:
+            started = time.perf_counter()
+            local = rag_pipeline.chroma_local
+            size_before = await asyncio.to_thread(dir_size, rag_pipeline.chroma_path) if local else None
+            names = await asyncio.to_thread(rag_pipeline.list_collection_names)
+            
+            sessions = {}  # session_id -> collection name
+            agents = {}  # agent_id -> base collection name
+            rebuild_leftovers = []  # staging / retired collections of interrupted index rebuilds
+            for name in names:
+                match = _SESSION_COLLECTION.match(name)
+                if match:
+                    sessions[match["session_id"]] = name
+                    continue
+                match = _AGENT_COLLECTION.match(name)
+                if match:
+                    agents[match["agent_id"]] = name
+                    continue
+                match = _REBUILD_COLLECTION.match(name)
+                if match and match["agent_id"] not in rag_pipeline.rebuilding | rag_pipeline.reindexing:
+                    rebuild_leftovers.append(name)
+            
+            stale: List[str] = list(rebuild_leftovers)
+            abandoned: List[str] = []
+            reasons = {
+                "orphaned": 0, "completed": 0, "abandoned": 0, "deleted_agent": 0,
+                "interrupted_rebuild": len(rebuild_leftovers),
+            }
+            cutoff = datetime.utcnow() - self.max_session_age
+            
+            async with self.session_factory() as db:
+                known_sessions = {}
+                session_ids = list(sessions)
+                for start in range(0, len(session_ids), _LOOKUP_CHUNK):
+                    result = await db.execute(
+                        select(SessionModel.id, SessionModel.status, SessionModel.started_at)
+                        .where(SessionModel.id.in_(session_ids[start:start + _LOOKUP_CHUNK]))
+                    )
+                    known_sessions.update({row.id: row for row in result})
+                
+                for session_id, name in sessions.items():
+                    row = known_sessions.get(session_id)
+                    if row is None:
+                        reasons["orphaned"] += 1
+                    elif row.status != "active":
+                        reasons["completed"] += 1  # end_session's cleanup didn't run or failed
+                    elif row.started_at is not None and row.started_at < cutoff:
+                        reasons["abandoned"] += 1  # client went away without ending the session
+                        abandoned.append(session_id)
+                    else:
+                        continue
+                    stale.append(name)
+                
+                agent_ids = list(agents)
+                known_agents = set()
+                for start in range(0, len(agent_ids), _LOOKUP_CHUNK):
+                    result = await db.execute(select(Agent.id).where(Agent.id.in_(agent_ids[start:start + _LOOKUP_CHUNK])))
+                    known_agents.update(result.scalars())
+                for agent_id, name in agents.items():
+                    if agent_id not in known_agents:
+                        reasons["deleted_agent"] += 1
+                        stale.append(name)
+                
+                result = await db.execute(select(Document.blob_key).where(Document.blob_key.isnot(None)).distinct())
+                referenced_blobs = set(result.scalars())
+                
+                if abandoned and not dry_run:
+                    for start in range(0, len(abandoned), _LOOKUP_CHUNK):
+                        await db.execute(
+                            update(SessionModel)
+                            .where(SessionModel.id.in_(abandoned[start:start + _LOOKUP_CHUNK]))
+                            .where(SessionModel.status == "active")
+                            .values(status="completed", ended_at=datetime.utcnow())
+                        )
+                    await db.commit()
+            
+            # Blobs written after the lookup above are younger than the sweep's grace period
+            blob_report = await asyncio.to_thread(blob_store.sweep, referenced_blobs, dry_run=dry_run)
+            
+            deleted = []
+            bytes_reclaimed = 0 if local else None
+            if not dry_run:
+                deleted = await asyncio.to_thread(rag_pipeline.delete_collections, stale)
+                if local:
+                    await asyncio.to_thread(sweep_segment_files, rag_pipeline.chroma_path)
+                    size_after = await asyncio.to_thread(dir_size, rag_pipeline.chroma_path)
+                    bytes_reclaimed = max(0, size_before - size_after)
+            
+            self.last_report = {
+                "dry_run": dry_run,
+                "collections_scanned": len(names),
+                "collections_stale": len(stale),
+                "collections_deleted": len(deleted),
+                "sessions_closed": len(abandoned) if not dry_run else 0,
+                "reasons": reasons,
+                "bytes_before": size_before,
+                "bytes_reclaimed": bytes_reclaimed,
+                **blob_report,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "finished_at": datetime.utcnow().isoformat(),
+            }
+            return self.last_report
+
+
+# Singleton instance
+collection_reaper = CollectionReaper()
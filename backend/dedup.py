@@ -0,0 +1,136 @@
+"""
+Boilerplate and near-duplicate suppression for ingestion
+Corporate PDFs repeat headers, footers, disclaimers and table-of-contents lines on
+every page; left in, they become chunks that crowd out real hits. Two stages run
+before embedding:
+  - page furniture: lines that recur on many pages of a PDF, and TOC dot-leader
+    lines, are removed from the text before chunking
+  - near duplicates: chunks whose MinHash-estimated Jaccard similarity (5-word
+    shingles) with an earlier chunk of the same document, or with a stored chunk of
+    the agent, reaches NEAR_DUPLICATE_THRESHOLD are dropped
+A document whose chunks were dropped against another document's records that document
+(Document.suppressed_by); deleting or replacing it restores the dropped chunks, see
+document_updates.restore_dependents().
+Stored chunks carry their LSH band hashes (lsh_0 ... lsh_15 metadata), so candidates
+from the agent's corpus come from one metadata query instead of a scan.
+"""
+
+import hashlib
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+FURNITURE_PAGE_RATIO = float(os.getenv("FURNITURE_PAGE_RATIO", "0.5"))  # share of pages a line must appear on
+FURNITURE_MIN_PAGES = 3  # documents shorter than this have no recognizable furniture
+
+SHINGLE_WORDS = 5
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS  # 4 rows: pairs above ~0.5 similarity share a band, verified afterwards
+LSH_KEYS = [f"lsh_{band}" for band in range(LSH_BANDS)]
+
+_PRIME = (1 << 31) - 1
+# Fixed permutations, derived deterministically so signatures stored in Chroma stay comparable across restarts
+_A = np.array([int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:4], "big") % (_PRIME - 1) + 1 for i in range(NUM_PERM)], dtype=np.int64)
+_B = np.array([int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:4], "big") % _PRIME for i in range(NUM_PERM)], dtype=np.int64)
+
+_WORD = re.compile(r"[a-z0-9]+")
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+_TOC_LINE = re.compile(r"(\.{4,}|…{2,}|(\s\.){3,})\s*\d+\s*$")  # "Introduction ........ 3"
+
+
+# ---------------------------------------------------------------------------
+# Page furniture
+# ---------------------------------------------------------------------------
+
+def _furniture_key(line: str) -> str:
+    """Line identity ignoring case, spacing and numbers (page numbers, dates)"""
+    return _DIGITS.sub("#", _SPACES.sub(" ", line.strip().lower()))
+
+
+def strip_page_furniture(pages: List[str]) -> Tuple[str, int]:
+    """Join PDF pages without repeated headers/footers and TOC lines, returns (text, lines removed)"""
+    furniture = set()
+    if len(pages) >= FURNITURE_MIN_PAGES:
+        counts = Counter()
+        for page in pages:
+            counts.update({_furniture_key(line) for line in page.splitlines() if line.strip()})
+        min_pages = max(FURNITURE_MIN_PAGES, FURNITURE_PAGE_RATIO * len(pages))
+        furniture = {key for key, count in counts.items() if count >= min_pages}
+    
+    removed = 0
+    kept_pages = []
+    for page in pages:
+        kept_lines = []
+        for line in page.splitlines():
+            if line.strip() and (_furniture_key(line) in furniture or _TOC_LINE.search(line)):
+                removed += 1
+                continue
+            kept_lines.append(line)
+        kept_pages.append("\n".join(kept_lines))
+    return "\n".join(kept_pages) + "\n", removed
+
+
+# ---------------------------------------------------------------------------
+# MinHash / LSH
+# ---------------------------------------------------------------------------
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of a text's word shingles"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    x = np.fromiter((zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles), dtype=np.int64, count=len(shingles))
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def lsh_bands(signature: np.ndarray) -> Dict[str, str]:
+    """Band hashes of a signature, stored as chunk metadata"""
+    return {
+        LSH_KEYS[band]: hashlib.blake2b(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes(), digest_size=8).hexdigest()
+        for band in range(LSH_BANDS)
+    }
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(a == b))
+
+
+class NearDuplicateIndex:
+    """In-memory LSH index of signatures, each with the id of the document it came from"""
+    
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.signatures: List[np.ndarray] = []
+        self.owners: List[Optional[str]] = []
+        self.buckets: Dict[Tuple[str, str], List[int]] = {}
+    
+    def add(self, signature: np.ndarray, owner: Optional[str] = None) -> None:
+        position = len(self.signatures)
+        self.signatures.append(signature)
+        self.owners.append(owner)
+        for key, value in lsh_bands(signature).items():
+            self.buckets.setdefault((key, value), []).append(position)
+    
+    def match(self, signature: np.ndarray) -> Optional[int]:
+        """Position of an indexed signature the given one nearly duplicates, None if there is none"""
+        candidates = set()
+        for key, value in lsh_bands(signature).items():
+            candidates.update(self.buckets.get((key, value), ()))
+        for n in sorted(candidates):
+            if similarity(signature, self.signatures[n]) >= self.threshold:
+                return n
+        return None
+    
+    def is_duplicate(self, signature: np.ndarray) -> bool:
+        return self.match(signature) is not None
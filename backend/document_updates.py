@@ -0,0 +1,308 @@
+"""
+Incremental document replacement
+Re-chunks the new version of a document, matches its chunks to the stored ones by
+content hash, embeds only the chunks that are new, re-labels the unchanged ones and
+drops the ones that disappeared.
+
+Every replacement first writes a plan file (REPLACE_PLAN_DIR/<doc_id>.json, which
+also keeps two replacements of one document from overlapping). Vector changes are
+applied in an order that can be undone: new chunks are added and kept ones re-labelled,
+then the Document row is committed, and only then are removed chunks deleted. If the
+process dies part-way, recover_replacements() on the next startup checks whether the
+row was committed (the commit stores the plan's id in Document.replace_plan_id) and
+either finishes the deletes or removes the added chunks, so the vector store and
+Document.chunk_count never drift apart.
+
+Deleting or replacing a document can take away the kept copy of chunks that other
+documents dropped as near duplicates (Document.suppressed_by); restore_dependents()
+re-processes those documents from their originals so the dropped chunks come back.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics
+from database import AsyncSessionLocal
+from models import Agent, Document
+from rag_pipeline import rag_pipeline
+from blob_store import blob_store
+from plan_files import write_plan
+
+logger = logging.getLogger(__name__)
+
+REPLACE_PLAN_DIR = os.getenv("REPLACE_PLAN_DIR", "./replace_plans")
+RESTORE_REINDEX_POLL = 1.0  # seconds between checks for a running re-index of the agent
+
+
+class ReplaceInProgress(Exception):
+    """Another replacement of the same document has not finished"""
+
+
+class DuplicateContent(Exception):
+    """The new version is identical to another document of the agent"""
+
+
+def _plan_path(doc_id: str) -> str:
+    return os.path.join(REPLACE_PLAN_DIR, f"{doc_id}.json")
+
+
+def replacement_in_progress(doc_id: str) -> bool:
+    return os.path.exists(_plan_path(doc_id))
+
+
+def _claim(doc_id: str) -> str:
+    """Create the document's plan file, fails if a replacement is already running"""
+    os.makedirs(REPLACE_PLAN_DIR, exist_ok=True)
+    path = _plan_path(doc_id)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise ReplaceInProgress(f"Document {doc_id} is already being replaced")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"doc_id": doc_id, "created_at": datetime.utcnow().isoformat()}, f)
+    return path
+
+
+def diff_chunks(doc_id: str, filename: str, chunks: List[str], stored: Dict, signatures: Optional[Dict] = None) -> Dict:
+    """Match new chunks to stored ones by content hash (signatures: MinHash per chunk text from suppress_duplicates)"""
+    # Stored chunk IDs per hash, in document order (older chunks have no chunk_hash metadata)
+    pool: Dict[str, List[str]] = {}
+    order = sorted(range(len(stored["ids"])), key=lambda n: (stored["metadatas"][n] or {}).get("chunk_index", n))
+    for n in order:
+        digest = (stored["metadatas"][n] or {}).get("chunk_hash") or rag_pipeline.chunk_hash(stored["documents"][n])
+        pool.setdefault(digest, []).append(stored["ids"][n])
+    
+    new_ids, new_metadatas = rag_pipeline.chunk_records(doc_id, filename, chunks, taken=set(stored["ids"]), signatures=signatures)
+    
+    add = {"ids": [], "documents": [], "metadatas": []}
+    keep = {"ids": [], "metadatas": []}
+    for chunk, chunk_id, metadata in zip(chunks, new_ids, new_metadatas):
+        candidates = pool.get(metadata["chunk_hash"])
+        if candidates:
+            keep["ids"].append(candidates.pop(0))
+            keep["metadatas"].append(metadata)
+        else:
+            add["ids"].append(chunk_id)
+            add["documents"].append(chunk)
+            add["metadatas"].append(metadata)
+    
+    removed = [chunk_id for ids in pool.values() for chunk_id in ids]
+    old_metadata = dict(zip(stored["ids"], stored["metadatas"]))
+    return {
+        "add": add,
+        "keep": keep,
+        "removed_ids": removed,
+        "kept_old_metadatas": [old_metadata[chunk_id] for chunk_id in keep["ids"]],
+    }
+
+
+async def _settle(plan: Dict, committed: bool) -> None:
+    """Finish (committed) or undo (not committed) a plan's vector changes"""
+    async with rag_pipeline.agent_lock(plan["agent_id"]):
+        if committed:
+            await asyncio.to_thread(rag_pipeline.apply_chunk_changes, plan["agent_id"], delete_ids=plan["removed_ids"])
+        else:
+            await asyncio.to_thread(
+                rag_pipeline.apply_chunk_changes,
+                plan["agent_id"],
+                update={"ids": plan["kept_ids"], "metadatas": plan["kept_old_metadatas"]},
+                delete_ids=plan["added_ids"]
+            )
+
+
+async def replace_document(db: AsyncSession, agent: Agent, document: Document, spooled: Dict, filename: str) -> Dict:
+    """Replace a document's chunks with those of a new version, re-embedding only what changed"""
+    doc_id = document.id  # the instance expires on rollback
+    plan_path = _claim(doc_id)
+    plan = None
+    committed = False
+    try:
+        chunks, furniture_lines = await asyncio.to_thread(
+            rag_pipeline.extract_chunks, spooled["path"], filename, agent.chunk_size, agent.chunk_overlap
+        )
+        # The document's own stored chunks are the old version, not duplicates
+        suppressed_by, signatures = set(), {}
+        chunks, suppressed = await asyncio.to_thread(
+            rag_pipeline.suppress_duplicates, agent.id, chunks, document.id, None, True, document.id, suppressed_by, signatures
+        )
+        stored = await asyncio.to_thread(rag_pipeline.document_chunks, agent.id, document.id)
+        diff = diff_chunks(document.id, filename, chunks, stored, signatures)
+        
+        # Embedding is the expensive part and touches nothing, do it before recording the plan
+        add = diff["add"]
+        if add["ids"]:
+            add["embeddings"] = await asyncio.to_thread(rag_pipeline.embed_chunks, add["documents"])
+        
+        plan = {
+            "plan_id": uuid.uuid4().hex,
+            "doc_id": document.id,
+            "agent_id": agent.id,
+            "content_hash": spooled["sha256"],
+            "added_ids": add["ids"],
+            "removed_ids": diff["removed_ids"],
+            "kept_ids": diff["keep"]["ids"],
+            "kept_old_metadatas": diff["kept_old_metadatas"],
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        write_plan(plan_path, plan)
+        
+        # Step 1: new chunks in, unchanged chunks re-labelled (reversible)
+        async with rag_pipeline.agent_lock(agent.id):
+            await asyncio.to_thread(
+                rag_pipeline.apply_chunk_changes, agent.id, add=add, update=diff["keep"], index_profile=agent.index_profile
+            )
+        
+        # Step 2: the Document row switches to the new version
+        if document.content_hash != spooled["sha256"]:
+            document.uploaded_at = datetime.utcnow()  # not for a restore, which re-processes the same file
+        document.filename = filename
+        document.file_size = spooled["size"]
+        document.chunk_count = len(chunks)
+        document.content_hash = spooled["sha256"]
+        document.blob_key = await blob_store.put(spooled["path"], spooled["sha256"])
+        document.suppressed_by = sorted(suppressed_by) or None
+        document.replace_plan_id = plan["plan_id"]  # the commit marker recovery checks
+        agent.updated_at = datetime.utcnow()
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            await _settle(plan, committed=False)
+            os.unlink(plan_path)
+            raise DuplicateContent("Another document of this agent has identical content")
+        committed = True
+        
+        # Step 3: chunks that are no longer in the document go
+        await _settle(plan, committed=True)
+        os.unlink(plan_path)
+    
+    except (ReplaceInProgress, DuplicateContent):
+        raise
+    except Exception:
+        if not committed:
+            await db.rollback()
+        if plan is None:
+            os.unlink(plan_path)  # nothing was touched
+        else:
+            # Undo step 1 (or finish step 3 after a commit) now, otherwise leave the plan for startup recovery
+            try:
+                await _settle(plan, committed)
+                os.unlink(plan_path)
+            except Exception as e:
+                logger.error(f"❌ Could not settle replacement of document {doc_id}, left for recovery: {e}")
+        raise
+    
+    metrics.INGEST_REPLACED_CHUNKS.labels("added").inc(len(plan["added_ids"]))
+    metrics.INGEST_REPLACED_CHUNKS.labels("kept").inc(len(plan["kept_ids"]))
+    metrics.INGEST_REPLACED_CHUNKS.labels("removed").inc(len(plan["removed_ids"]))
+    metrics.INGEST_CHUNKS.inc(len(plan["added_ids"]))
+    metrics.INGEST_BYTES.inc(spooled["size"])
+    
+    return {
+        "chunks_processed": len(chunks),
+        "chunks_suppressed": suppressed,
+        "furniture_lines_removed": furniture_lines,
+        "chunks_added": len(plan["added_ids"]),
+        "chunks_unchanged": len(plan["kept_ids"]),
+        "chunks_removed": len(plan["removed_ids"]),
+    }
+
+
+async def _restore_document(agent_id: str, doc_id: str, source: str, session_factory) -> Dict:
+    """Re-process one document from its original, returns the replacement counts (empty if skipped)"""
+    async with session_factory() as db:
+        agent = await db.get(Agent, agent_id)
+        document = await db.get(Document, doc_id)
+        if agent is None or document is None:
+            return {}
+        if not blob_store.exists(document.blob_key):
+            logger.warning(f"⚠️ Document {doc_id} has no stored original, chunks dropped against {source} cannot be restored")
+            return {}
+        spooled = {"path": blob_store.path(document.blob_key), "size": document.file_size, "sha256": document.content_hash}
+        try:
+            return await replace_document(db, agent, document, spooled, document.filename)
+        except ReplaceInProgress:
+            # The running replacement de-duplicates against the chunks stored now
+            logger.info(f"ℹ️ Document {doc_id} is being replaced, not restoring its chunks")
+        except Exception as e:
+            logger.error(f"❌ Could not restore chunks of document {doc_id} dropped against {source}: {e}")
+        return {}
+
+
+async def restore_dependents(agent_id: str, doc_id: str, session_factory=AsyncSessionLocal) -> int:
+    """Re-process the documents whose near-duplicate chunks were dropped against a document that
+    was deleted or replaced, so the chunks it no longer holds are stored again; returns how many changed"""
+    # A running re-index rewrites suppressed_by from scratch, read it once that is done
+    while agent_id in rag_pipeline.reindexing:
+        await asyncio.sleep(RESTORE_REINDEX_POLL)
+    
+    restored = 0
+    pending = [doc_id]
+    seen = {doc_id}
+    while pending:
+        source = pending.pop(0)
+        async with session_factory() as db:
+            result = await db.execute(
+                select(Document.id, Document.suppressed_by)
+                .where(Document.agent_id == agent_id, Document.suppressed_by.isnot(None))
+            )
+            dependents = [dependent for dependent, sources in result.all() if source in sources and dependent not in seen]
+        
+        for dependent in dependents:
+            seen.add(dependent)
+            changes = await _restore_document(agent_id, dependent, source, session_factory)
+            if changes.get("chunks_added") or changes.get("chunks_removed"):
+                restored += 1
+                logger.info(
+                    f"♻️ Restored document {dependent} after {source} changed: "
+                    f"{changes['chunks_added']} chunks added, {changes['chunks_removed']} removed"
+                )
+            if changes.get("chunks_removed"):
+                pending.append(dependent)  # documents relying on the chunks it lost need the same
+    return restored
+
+
+async def recover_replacements(session_factory=AsyncSessionLocal) -> int:
+    """Settle replacements interrupted by a crash, returns how many plans were resolved"""
+    if not os.path.isdir(REPLACE_PLAN_DIR):
+        return 0
+    
+    resolved = 0
+    for name in sorted(os.listdir(REPLACE_PLAN_DIR)):
+        path = os.path.join(REPLACE_PLAN_DIR, name)
+        if name.endswith(".json.tmp"):
+            os.unlink(path)  # never became a plan
+            continue
+        if not name.endswith(".json"):
+            continue
+        
+        with open(path, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+        
+        if "added_ids" in plan:
+            # The commit is the switch-over point: a row carrying the plan's id means the replacement happened
+            # (a restore re-stores the same file, so the content hash cannot tell; plans from before
+            # replace_plan_id fall back to it)
+            async with session_factory() as db:
+                document = await db.get(Document, plan["doc_id"])
+            if document is None:
+                committed = False
+            elif "plan_id" in plan:
+                committed = document.replace_plan_id == plan["plan_id"]
+            else:
+                committed = document.content_hash == plan["content_hash"]
+            await _settle(plan, committed)
+            logger.info(f"🩹 {'Finished' if committed else 'Rolled back'} interrupted replacement of document {plan['doc_id']}")
+        
+        os.unlink(path)
+        resolved += 1
+    return resolved
@@ -0,0 +1,66 @@
+"""
+HNSW index profiles for agent collections
+A profile fixes the distance space and the HNSW graph parameters (max_neighbors "M",
+ef_construction, ef_search) a knowledge base collection is built with. Agents store a
+profile name; "auto" picks a tier from the collection's chunk count. Extra or
+overriding profiles can be supplied as JSON in INDEX_PROFILES_JSON, e.g.
+    {"cosine_large": {"space": "cosine", "max_neighbors": 32, "ef_construction": 300, "ef_search": 200}}
+Measure candidates with benchmarks/bench_retrieval.py before changing the tiers.
+"""
+
+import json
+import os
+from typing import Dict, Optional
+
+AUTO_PROFILE = "auto"
+
+INDEX_PROFILES: Dict[str, Dict] = {
+    # Chroma's defaults: plenty for a few thousand chunks
+    "small": {"space": "l2", "max_neighbors": 16, "ef_construction": 100, "ef_search": 100},
+    # Denser graph so recall holds up at tens of thousands of chunks
+    "medium": {"space": "l2", "max_neighbors": 24, "ef_construction": 200, "ef_search": 150},
+    # Hundreds of thousands of chunks: bigger graph and search beam
+    "large": {"space": "l2", "max_neighbors": 32, "ef_construction": 300, "ef_search": 200},
+    # Recall over latency and memory, any size
+    "high_recall": {"space": "l2", "max_neighbors": 48, "ef_construction": 400, "ef_search": 400},
+}
+INDEX_PROFILES.update(json.loads(os.getenv("INDEX_PROFILES_JSON", "{}")))
+
+# Chunk counts at which "auto" moves up a tier
+INDEX_AUTO_MEDIUM_CHUNKS = int(os.getenv("INDEX_AUTO_MEDIUM_CHUNKS", "10000"))
+INDEX_AUTO_LARGE_CHUNKS = int(os.getenv("INDEX_AUTO_LARGE_CHUNKS", "100000"))
+
+HNSW_KEYS = ("space", "max_neighbors", "ef_construction", "ef_search")
+
+
+def is_valid_profile(name: str) -> bool:
+    return name == AUTO_PROFILE or name in INDEX_PROFILES
+
+
+def resolve_profile(name: Optional[str], chunk_count: int) -> str:
+    """Concrete profile for an agent's setting ("auto" or unknown -> tier by chunk count)"""
+    if name and name != AUTO_PROFILE and name in INDEX_PROFILES:
+        return name
+    if chunk_count >= INDEX_AUTO_LARGE_CHUNKS:
+        return "large"
+    if chunk_count >= INDEX_AUTO_MEDIUM_CHUNKS:
+        return "medium"
+    return "small"
+
+
+def hnsw_configuration(profile: str) -> Dict:
+    """Collection configuration for chromadb create_collection"""
+    settings = INDEX_PROFILES[profile]
+    return {"hnsw": {key: settings[key] for key in HNSW_KEYS if key in settings}}
+
+
+def collection_hnsw(collection) -> Dict:
+    """HNSW settings a collection was built with"""
+    hnsw = (collection.configuration_json or {}).get("hnsw") or {}
+    return {key: hnsw.get(key) for key in HNSW_KEYS}
+
+
+def matches_profile(collection, profile: str) -> bool:
+    """Whether a collection's index already follows a profile"""
+    current = collection_hnsw(collection)
+    return all(current.get(key) == value for key, value in hnsw_configuration(profile)["hnsw"].items())
@@ -0,0 +1,49 @@
+"""
+Process-wide LiveKit server API client
+One pooled HTTP session shared by all requests instead of a new client per call
+"""
+
+import logging
+import os
+from typing import Optional
+
+import aiohttp
+from livekit import api as livekit_api
+
+logger = logging.getLogger(__name__)
+
+
+class LiveKitClient:
+    def __init__(self):
+        self.url = os.getenv("LIVEKIT_URL", "ws://localhost:7880")
+        self.api_key = os.getenv("LIVEKIT_API_KEY")
+        self.api_secret = os.getenv("LIVEKIT_API_SECRET")
+        self.timeout = float(os.getenv("LIVEKIT_API_TIMEOUT", "10"))
+        self._api: Optional[livekit_api.LiveKitAPI] = None
+    
+    @property
+    def api(self) -> livekit_api.LiveKitAPI:
+        """Shared LiveKitAPI, created on first use (needs a running event loop)"""
+        if self._api is None:
+            self._api = livekit_api.LiveKitAPI(
+                url=self.url,
+                api_key=self.api_key,
+                api_secret=self.api_secret,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            logger.info(f"✅ LiveKit API client ready ({self.url})")
+        return self._api
+    
+    def access_token(self) -> livekit_api.AccessToken:
+        """New access token signed with the server credentials"""
+        return livekit_api.AccessToken(self.api_key, self.api_secret)
+    
+    async def close(self) -> None:
+        """Close the pooled HTTP session (on shutdown)"""
+        if self._api is not None:
+            await self._api.aclose()
+            self._api = None
+
+
+# Global instance
+livekit_client = LiveKitClient()
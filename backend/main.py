@@ -1,14 +1,30 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import asyncio
 import os
 
-from database import init_db
+from database import init_db, async_engine, AsyncSessionLocal
+from query_log import query_log
+from livekit_client import livekit_client
+from collection_reaper import collection_reaper
+from warmup import index_warmup, WARMUP_GATES_READINESS
+from document_updates import recover_replacements
+from rag_pipeline import rag_pipeline
+from upload_limits import UploadLimitMiddleware
+from metrics import MetricsMiddleware, loop_lag_monitor, render_metrics
+from tracing import TracingMiddleware, instrument_engine, setup_tracing
+from rollups import backfill_rollups
 from routers import agents, sessions, analytics
 
 # Load environment variables
 load_dotenv()
 
+# Optional OpenTelemetry tracing (TRACING_EXPORTER), DB statements become child spans
+if setup_tracing("xebia-voice-backend"):
+    instrument_engine(async_engine.sync_engine)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Xebia Voice AI Studio API",
@@ -16,6 +32,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Upload size cap and in-flight budget (inside CORS so rejections carry CORS headers)
+app.add_middleware(UploadLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -23,8 +42,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Latest-Cursor", "ETag", "Last-Modified"],  # Pagination cursors, cache validators
 )
 
+# Request count / latency per route (also times CORS handling)
+app.add_middleware(MetricsMiddleware)
+
+# Continues the caller's trace (traceparent header), no-op unless tracing is enabled
+app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(agents.router)
 app.include_router(sessions.router)
@@ -35,8 +61,26 @@ async def startup_event():
     """Initialize database on startup"""
     init_db()
     print("✅ Database initialized")
+    async with AsyncSessionLocal() as db:
+        await backfill_rollups(db)
+    await asyncio.to_thread(rag_pipeline.recover_switchovers)  # finish index switch-overs interrupted by a crash
+    await recover_replacements()  # settle document replacements interrupted by a crash
+    await query_log.start()
+    await collection_reaper.start()
+    await loop_lag_monitor.start()
+    await index_warmup.start()  # background, reported by /health/ready
     print("✅ FastAPI server started")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered query logs and close pooled connections"""
+    await index_warmup.stop()
+    await loop_lag_monitor.stop()
+    await collection_reaper.stop()
+    await query_log.stop()
+    await livekit_client.close()
+    await async_engine.dispose()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -51,6 +95,21 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: 503 until the index warm-up has finished (WARMUP_GATES_READINESS)"""
+    ready = index_warmup.done or not WARMUP_GATES_READINESS
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming_up", "warmup": index_warmup.progress}
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus metrics (text exposition format)"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
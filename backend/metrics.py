@@ -0,0 +1,201 @@
+"""
+Prometheus metrics for the backend
+Exposed in text exposition format at /metrics. Metric objects are module-level and
+label children for fixed label values are bound once, so recording a sample is a
+lock + add (about a microsecond) on the request path.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+
+# Latency buckets (seconds) for in-process work and for remote / disk-bound work
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SLOW_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# HTTP
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=SLOW_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+# Retrieval
+EMBED_LATENCY = Histogram(
+    "rag_embedding_seconds", "Time to compute embeddings", ["operation"], buckets=SLOW_BUCKETS
+)
+EMBED_QUERY = EMBED_LATENCY.labels("query")
+EMBED_DOCUMENTS = EMBED_LATENCY.labels("documents")
+VECTOR_QUERY_LATENCY = Histogram(
+    "rag_vector_query_seconds", "ChromaDB similarity search time", buckets=FAST_BUCKETS
+)
+RETRIEVALS = Counter(
+    "rag_retrievals_total", "Retrievals by outcome", ["result"]
+)
+RETRIEVAL_HIT = RETRIEVALS.labels("hit")
+RETRIEVAL_EMPTY = RETRIEVALS.labels("empty")
+RETRIEVAL_NO_COLLECTION = RETRIEVALS.labels("no_collection")
+RETRIEVAL_LATENCY = Histogram(
+    "rag_retrieval_seconds", "End-to-end retrieval time (embedding + search)", buckets=SLOW_BUCKETS
+)
+
+# Ingestion
+INGEST_STAGE_LATENCY = Histogram(
+    "ingest_stage_seconds", "Document ingestion time per stage", ["stage"], buckets=SLOW_BUCKETS
+)
+INGEST_DOCUMENTS = Counter("ingest_documents_total", "Documents ingested by outcome", ["status"])
+INGEST_CHUNKS = Counter("ingest_chunks_total", "Chunks embedded and stored")
+INGEST_BYTES = Counter("ingest_bytes_total", "Bytes of uploaded documents ingested")
+INGEST_SUPPRESSED_CHUNKS = Counter("ingest_suppressed_chunks_total", "Near-duplicate chunks dropped before embedding")
+INGEST_FURNITURE_LINES = Counter("ingest_furniture_lines_total", "Repeated page header/footer and TOC lines removed")
+INGEST_REPLACED_CHUNKS = Counter(
+    "ingest_replaced_chunks_total", "Chunks of replaced documents by outcome (added, kept, removed)", ["outcome"]
+)
+UPLOADS_REJECTED = Counter("uploads_rejected_total", "Uploads refused by the size / in-flight limits", ["reason"])
+UPLOAD_INFLIGHT_BYTES = Gauge("upload_inflight_bytes", "Upload bytes reserved by requests being received")
+
+# Sessions
+SESSION_COLLECTION_LATENCY = Histogram(
+    "session_collection_copy_seconds", "Time to copy an agent collection for a new session", buckets=SLOW_BUCKETS
+)
+SESSION_COLLECTION_CHUNKS = Counter("session_collection_chunks_total", "Chunks copied into session collections")
+
+# Caches (HTTP revalidation and in-process caches)
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by outcome", ["cache", "result"])
+
+# Database
+DB_COMMIT_LATENCY = Histogram(
+    "db_commit_seconds", "ORM commit time including the final flush", buckets=FAST_BUCKETS
+)
+QUERY_LOG_FLUSH_LATENCY = Histogram(
+    "query_log_flush_seconds", "Write-behind query log flush time", buckets=FAST_BUCKETS
+)
+QUERY_LOG_ROWS = Counter("query_log_rows_total", "Query rows written by the write-behind log")
+QUERY_LOG_PENDING = Gauge("query_log_pending_rows", "Query rows waiting in the write-behind buffer")
+QUERY_LOG_DROPPED = Counter(
+    "query_log_dropped_rows_total", "Query rows the write-behind log gave up on", ["reason"]
+)
+
+# Event loop
+LOOP_LAG = Gauge("event_loop_lag_last_seconds", "Most recent event-loop scheduling delay")
+LOOP_LAG_HISTOGRAM = Histogram("event_loop_lag_seconds", "Event-loop scheduling delay", buckets=FAST_BUCKETS)
+
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+
+@contextmanager
+def observe(histogram):
+    """Time a block into a histogram (or bound histogram child)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    """Count a cache hit or miss"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+# DB commit latency for every ORM session (sync and async), measured from the
+# start of commit() (which flushes pending changes) until the transaction is committed
+@event.listens_for(OrmSession, "before_commit")
+def _before_commit(session):
+    session.info["_commit_started"] = time.perf_counter()
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _after_commit(session):
+    started = session.info.pop("_commit_started", None)
+    if started is not None:
+        DB_COMMIT_LATENCY.observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count and latency per route template"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Route template (e.g. /api/sessions/{session_id}/query) keeps label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_LATENCY.labels(scope["method"], path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], path, str(status)).inc()
+
+
+class LoopLagMonitor:
+    """Samples how late a timer fires on the event loop"""
+    
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _loop(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            LOOP_LAG.set(lag)
+            LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+def render_metrics():
+    """Current metrics in Prometheus text format, (body, content type)"""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Several uvicorn workers: aggregate the per-process files
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+# Singleton instance
+loop_lag_monitor = LoopLagMonitor()
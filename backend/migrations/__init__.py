@@ -0,0 +1,95 @@
+"""
+Versioned schema migrations
+Runs on startup after init_db() creates any missing tables. Each migration module
+has a VERSION, a DESCRIPTION and an upgrade(conn) made of idempotent operations
+(see ops.py); applied versions are recorded in the schema_migrations table.
+
+Adding a migration: create mNNNN_<name>.py with the next VERSION and append it to MIGRATIONS.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, text
+from sqlalchemy.engine import Engine
+
+from migrations import (
+    m0001_agent_ui_fields,
+    m0002_agent_avatar,
+    m0003_agent_mcp_config,
+    m0004_agent_rag_mode,
+    m0005_hot_path_indexes,
+    m0006_agent_index_profile,
+    m0007_document_content_hash,
+    m0008_document_blob_key,
+    m0009_agent_chunking,
+    m0010_document_suppressed_by,
+    m0011_document_replace_plan_id,
+)
+
+MIGRATIONS = [
+    m0001_agent_ui_fields,
+    m0002_agent_avatar,
+    m0003_agent_mcp_config,
+    m0004_agent_rag_mode,
+    m0005_hot_path_indexes,
+    m0006_agent_index_profile,
+    m0007_document_content_hash,
+    m0008_document_blob_key,
+    m0009_agent_chunking,
+    m0010_document_suppressed_by,
+    m0011_document_replace_plan_id,
+]
+
+# Arbitrary key for the PostgreSQL advisory lock serializing concurrent app instances
+_PG_LOCK_KEY = 7310452
+
+metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def applied_versions(engine: Engine) -> set:
+    """Versions recorded in schema_migrations"""
+    metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        return set(conn.scalars(select(schema_migrations.c.version)))
+
+
+def run_migrations(engine: Engine, target: Optional[int] = None) -> list:
+    """Apply pending migrations in order (up to `target` if given), return the versions applied"""
+    versions = [migration.VERSION for migration in MIGRATIONS]
+    assert versions == sorted(set(versions)), "Migration versions must be unique and ascending"
+    
+    done = applied_versions(engine)
+    applied = []
+    
+    for migration in MIGRATIONS:
+        if migration.VERSION in done or (target is not None and migration.VERSION > target):
+            continue
+        
+        # One transaction per migration: schema change and version record commit together
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+                already = conn.scalar(
+                    select(schema_migrations.c.version).where(schema_migrations.c.version == migration.VERSION)
+                )
+                if already is not None:
+                    continue  # Another instance applied it while we waited for the lock
+            
+            print(f"🔧 Migration {migration.VERSION:04d}: {migration.DESCRIPTION}")
+            migration.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=migration.VERSION,
+                description=migration.DESCRIPTION,
+                applied_at=datetime.utcnow()
+            ))
+        applied.append(migration.VERSION)
+    
+    return applied
@@ -0,0 +1,19 @@
+"""
+Apply pending migrations to DATABASE_URL without starting the API
+
+Usage (from backend/):
+    python -m migrations
+"""
+
+import models  # noqa: F401  (registers the tables init_db creates)
+from database import engine, init_db
+from migrations import MIGRATIONS, applied_versions
+
+if __name__ == "__main__":
+    print(f"[+] Database: {engine.url.render_as_string(hide_password=True)}")
+    init_db()
+    
+    done = applied_versions(engine)
+    for migration in MIGRATIONS:
+        state = "applied" if migration.VERSION in done else "pending"
+        print(f"   {migration.VERSION:04d}  {state:<8} {migration.DESCRIPTION}")
@@ -0,0 +1,26 @@
+"""
+Add status and last_used to agents (UI compatibility fields)
+Formerly add_agent_fields.sql
+"""
+
+from sqlalchemy import Column, DateTime, String, text
+
+from migrations.ops import add_column
+
+VERSION = 1
+DESCRIPTION = "agents.status and agents.last_used"
+
+
+def upgrade(conn):
+    add_column(conn, "agents", Column("status", String(20), server_default=text("'active'")))
+    added = add_column(conn, "agents", Column("last_used", DateTime))
+    
+    conn.execute(text("UPDATE agents SET status = 'active' WHERE status IS NULL"))
+    
+    # Backfill last_used from the latest query of each agent
+    if added:
+        conn.execute(text(
+            "UPDATE agents SET last_used = "
+            "(SELECT MAX(queries.timestamp) FROM queries WHERE queries.agent_id = agents.id) "
+            "WHERE last_used IS NULL"
+        ))
@@ -0,0 +1,15 @@
+"""
+Add avatar_id to agents (Beyond Presence avatar)
+Formerly migrate_avatar.py / add_avatar_column.py
+"""
+
+from sqlalchemy import Column, String
+
+from migrations.ops import add_column
+
+VERSION = 2
+DESCRIPTION = "agents.avatar_id"
+
+
+def upgrade(conn):
+    add_column(conn, "agents", Column("avatar_id", String))
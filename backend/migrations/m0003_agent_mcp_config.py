@@ -0,0 +1,14 @@
+"""
+Add mcp_config to agents (Model Context Protocol servers)
+"""
+
+from sqlalchemy import JSON, Column
+
+from migrations.ops import add_column
+
+VERSION = 3
+DESCRIPTION = "agents.mcp_config"
+
+
+def upgrade(conn):
+    add_column(conn, "agents", Column("mcp_config", JSON))
@@ -0,0 +1,20 @@
+"""
+Add rag_mode to agents (knowledge base retrieval mode used by the voice worker)
+Formerly add_rag_mode.sql
+  'tool'      - the model calls query_documents (extra model round trip per answer)
+  'proactive' - the worker retrieves when the user's turn ends and injects the context
+"""
+
+from sqlalchemy import Column, String, text
+
+from migrations.ops import add_column
+
+VERSION = 4
+DESCRIPTION = "agents.rag_mode"
+
+
+def upgrade(conn):
+    add_column(conn, "agents", Column("rag_mode", String(20), server_default=text("'tool'")))
+    
+    # Existing agents keep the tool-calling behaviour
+    conn.execute(text("UPDATE agents SET rag_mode = 'tool' WHERE rag_mode IS NULL"))
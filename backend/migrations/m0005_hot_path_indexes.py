@@ -0,0 +1,23 @@
+"""
+Indexes for the columns every router filters or sorts on
+Names match the ones models.py declares, so fresh databases end up identical
+"""
+
+from migrations.ops import create_index
+
+VERSION = 5
+DESCRIPTION = "indexes on queries, sessions and documents hot paths"
+
+INDEXES = [
+    # (name, table, columns)
+    ("ix_queries_agent_id", "queries", ["agent_id"]),  # Agent analytics counts, agent deletion
+    ("ix_queries_session_id", "queries", ["session_id"]),  # Session transcript / cleanup
+    ("ix_queries_timestamp_id", "queries", ["timestamp", "id"]),  # Activity feed keyset pages, also serves timestamp ranges
+    ("ix_sessions_agent_started", "sessions", ["agent_id", "started_at"]),  # Per-agent session count and last session
+    ("ix_documents_agent_id", "documents", ["agent_id"]),  # Document list per agent
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns)
@@ -0,0 +1,16 @@
+"""
+Add index_profile to agents (HNSW parameters of the agent's Chroma collection)
+  'auto' picks a tier from the chunk count, see index_profiles.py for the named profiles
+"""
+
+from sqlalchemy import Column, String, text
+
+from migrations.ops import add_column
+
+VERSION = 6
+DESCRIPTION = "agents.index_profile"
+
+
+def upgrade(conn):
+    add_column(conn, "agents", Column("index_profile", String(40), server_default=text("'auto'")))
+    conn.execute(text("UPDATE agents SET index_profile = 'auto' WHERE index_profile IS NULL"))
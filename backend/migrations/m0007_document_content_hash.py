@@ -0,0 +1,17 @@
+"""
+Add content_hash to documents (sha256 of the uploaded file) for re-upload detection
+Documents uploaded before this migration keep a NULL hash: the original files are
+not stored, and NULLs never collide in the unique index.
+"""
+
+from sqlalchemy import Column, String
+
+from migrations.ops import add_column, create_index
+
+VERSION = 7
+DESCRIPTION = "documents.content_hash"
+
+
+def upgrade(conn):
+    add_column(conn, "documents", Column("content_hash", String(64)))
+    create_index(conn, "ux_documents_agent_content_hash", "documents", ["agent_id", "content_hash"], unique=True)
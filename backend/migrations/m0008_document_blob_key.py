@@ -0,0 +1,16 @@
+"""
+Add blob_key to documents: the original file's key in the blob store (its sha256)
+Documents uploaded before this migration keep a NULL key, their originals were not
+kept and a re-index carries their existing chunks over unchanged.
+"""
+
+from sqlalchemy import Column, String
+
+from migrations.ops import add_column
+
+VERSION = 8
+DESCRIPTION = "documents.blob_key"
+
+
+def upgrade(conn):
+    add_column(conn, "documents", Column("blob_key", String(64)))
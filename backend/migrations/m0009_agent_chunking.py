@@ -0,0 +1,16 @@
+"""
+Add chunk_size and chunk_overlap to agents (text splitter settings applied at ingest)
+  NULL keeps the pipeline defaults (DEFAULT_CHUNK_SIZE / DEFAULT_CHUNK_OVERLAP in rag_pipeline.py)
+"""
+
+from sqlalchemy import Column, Integer
+
+from migrations.ops import add_column
+
+VERSION = 9
+DESCRIPTION = "agents.chunk_size, agents.chunk_overlap"
+
+
+def upgrade(conn):
+    add_column(conn, "agents", Column("chunk_size", Integer))
+    add_column(conn, "agents", Column("chunk_overlap", Integer))
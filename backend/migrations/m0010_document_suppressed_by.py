@@ -0,0 +1,17 @@
+"""
+Add suppressed_by to documents: ids of the other documents whose chunks stood in for
+its near-duplicate chunks at ingest. Deleting or replacing one of them re-processes the
+document from its original so the dropped chunks come back.
+Documents ingested before this migration have no record (NULL).
+"""
+
+from sqlalchemy import JSON, Column
+
+from migrations.ops import add_column
+
+VERSION = 10
+DESCRIPTION = "documents.suppressed_by"
+
+
+def upgrade(conn):
+    add_column(conn, "documents", Column("suppressed_by", JSON))
@@ -0,0 +1,16 @@
+"""
+Add replace_plan_id to documents: the id of the replacement plan whose commit produced
+the current chunks. Crash recovery of a replacement checks it to tell whether the commit
+happened (a restore re-stores the same file, so the content hash cannot).
+"""
+
+from sqlalchemy import Column, String
+
+from migrations.ops import add_column
+
+VERSION = 11
+DESCRIPTION = "documents.replace_plan_id"
+
+
+def upgrade(conn):
+    add_column(conn, "documents", Column("replace_plan_id", String(32)))
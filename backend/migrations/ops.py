@@ -0,0 +1,53 @@
+"""
+Idempotent schema operations for migrations
+Every helper checks the live schema first, so a migration is a no-op on databases
+that init_db() just created from the current models
+"""
+
+from sqlalchemy import Column, inspect, text
+from sqlalchemy.engine import Connection
+from typing import Sequence
+
+
+def column_names(conn: Connection, table: str) -> set:
+    """Names of the columns currently on a table"""
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def add_column(conn: Connection, table: str, column: Column) -> bool:
+    """ALTER TABLE ... ADD COLUMN unless it already exists, returns True if added"""
+    if column.name in column_names(conn, table):
+        return False
+    
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    conn.execute(text(ddl))
+    print(f"   + {table}.{column.name}")
+    return True
+
+
+def index_names(conn: Connection, table: str) -> set:
+    """Names of the indexes currently on a table"""
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def create_index(conn: Connection, name: str, table: str, columns: Sequence[str], unique: bool = False) -> bool:
+    """CREATE [UNIQUE] INDEX unless an index with that name exists, returns True if created"""
+    if name in index_names(conn, table):
+        return False
+    
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+    print(f"   + index {name} on {table}({', '.join(columns)})")
+    return True
+
+
+def drop_index(conn: Connection, name: str, table: str) -> bool:
+    """DROP INDEX if it exists, returns True if dropped"""
+    if name not in index_names(conn, table):
+        return False
+    
+    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    print(f"   - index {name} on {table}")
+    return True
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, JSON, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, DateTime, JSON, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -25,6 +25,16 @@ class Agent(Base):
     # Avatar configuration
     avatar_id = Column(String, nullable=True)  # Beyond Presence avatar ID
     
+    # Knowledge base retrieval mode used by the voice worker
+    rag_mode = Column(String, default='tool')  # 'tool' (model calls query_documents), 'proactive' (injected each turn)
+    
+    # Vector index tuning (see index_profiles.py)
+    index_profile = Column(String, default='auto')  # 'auto' (tier by chunk count), 'small', 'medium', 'large', 'high_recall'
+    
+    # Text splitter settings applied at ingest, NULL uses the pipeline defaults (1000 / 200 characters)
+    chunk_size = Column(Integer, nullable=True)
+    chunk_overlap = Column(Integer, nullable=True)
+    
     # MCP Server configuration
     mcp_config = Column(JSON, nullable=True)  # Model Context Protocol server configuration
     # Stores: { "servers": [{"name": "...", "type": "http", "url": "...", "headers": {...}}] }
@@ -37,14 +47,22 @@ class Document(Base):
     __tablename__ = "documents"
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    agent_id = Column(String, ForeignKey('agents.id', ondelete='CASCADE'))
+    agent_id = Column(String, ForeignKey('agents.id', ondelete='CASCADE'), index=True)
     filename = Column(String)
     file_size = Column(Integer)
     chunk_count = Column(Integer)
+    content_hash = Column(String(64), nullable=True)  # sha256 of the uploaded file, NULL for uploads before 0007
+    blob_key = Column(String(64), nullable=True)  # original file in the blob store, NULL if it was not kept
+    suppressed_by = Column(JSON(none_as_null=True), nullable=True)  # ids of documents holding the kept copies of its near-duplicate chunks
+    replace_plan_id = Column(String(32), nullable=True)  # plan of the last replacement committed (document_updates.py)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     agent = relationship("Agent", back_populates="documents")
+    
+    __table_args__ = (
+        Index("ux_documents_agent_content_hash", "agent_id", "content_hash", unique=True),  # Re-upload detection
+    )
 
 class Session(Base):
     __tablename__ = "sessions"
@@ -60,13 +78,17 @@ class Session(Base):
     # Relationships
     agent = relationship("Agent", back_populates="sessions")
     queries = relationship("Query", back_populates="session")
+    
+    __table_args__ = (
+        Index("ix_sessions_agent_started", "agent_id", "started_at"),  # Per-agent session count and last session
+    )
 
 class Query(Base):
     __tablename__ = "queries"
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    session_id = Column(String, ForeignKey('sessions.id'))
-    agent_id = Column(String, ForeignKey('agents.id'))
+    session_id = Column(String, ForeignKey('sessions.id'), index=True)
+    agent_id = Column(String, ForeignKey('agents.id'), index=True)
     question = Column(Text)
     answer = Column(Text)
     sources = Column(JSON)  # List of document filenames
@@ -74,3 +96,21 @@ class Query(Base):
     
     # Relationships
     session = relationship("Session", back_populates="queries")
+    
+    __table_args__ = (
+        Index("ix_queries_timestamp_id", "timestamp", "id"),  # Activity feed keyset pages and timestamp ranges
+    )
+
+class ActivityRollup(Base):
+    """Hourly / daily activity counters per agent, maintained incrementally (see rollups.py)"""
+    __tablename__ = "activity_rollups"
+    
+    bucket = Column(String, primary_key=True)  # 'hour', 'day'
+    bucket_start = Column(DateTime, primary_key=True)  # UTC start of the bucket
+    agent_id = Column(String, primary_key=True)  # Kept after agent deletion for historical totals
+    session_count = Column(Integer, default=0, nullable=False)
+    query_count = Column(Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_activity_rollups_agent", "bucket", "agent_id", "bucket_start"),
+    )
@@ -0,0 +1,30 @@
+"""
+Keyset pagination cursors
+Opaque tokens encoding the (timestamp, id) sort key of the last row seen
+"""
+
+import base64
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+# Response headers carrying cursors (exposed to the browser via CORS)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+LATEST_CURSOR_HEADER = "X-Latest-Cursor"
+
+
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    """Encode a (timestamp, id) sort key as an opaque URL-safe token"""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor token, 400 on anything malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(timestamp), row_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
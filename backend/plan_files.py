@@ -0,0 +1,21 @@
+"""
+Crash-recovery plan files
+A multi-step change that cannot be made atomically (a document replacement, an index
+switch-over) first writes a plan describing it; startup recovery reads leftover plans
+and finishes or undoes the change.
+"""
+
+import json
+import os
+from typing import Dict
+
+
+def write_plan(path: str, plan: Dict) -> None:
+    """Atomically replace the plan file, durable before any change it describes is made"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,231 @@
+"""
+Write-behind query log
+Buffers Query rows and merges session/agent counter increments in memory, then
+writes them in one transaction on batch size, interval and shutdown, so RAG
+requests never wait on (or contend for) database writes. A batch that keeps failing
+is checked row by row and rows the database rejects (e.g. for a session deleted
+meanwhile) are dropped, so one bad row can't hold back the rest.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import DataError, IntegrityError
+
+from database import AsyncSessionLocal
+from models import Agent, Query, Session as SessionModel
+from rollups import apply_deltas, collect_deltas
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "2.0"))
+WRITE_BEHIND_MAX_PENDING = 50000  # Oldest rows are dropped beyond this if the database stays down
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "3"))  # failed flushes before rows are checked one by one
+WRITE_BEHIND_SETTLE_MARGIN = float(os.getenv("WRITE_BEHIND_SETTLE_MARGIN", "3.0"))  # seconds a flush may take to commit
+
+
+class QueryLogWriter:
+    """Buffered logger for Query rows and usage counters"""
+    
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        settle_margin: float = WRITE_BEHIND_SETTLE_MARGIN,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self.max_pending = max_pending
+        self.settle_margin = settle_margin
+        self._failed_flushes = 0  # consecutive flushes that failed
+        
+        self._rows: List[Dict] = []
+        self._session_counts: Dict[str, int] = defaultdict(int)
+        self._agent_counts: Dict[str, int] = defaultdict(int)
+        self._agent_last_used: Dict[str, datetime] = {}
+        
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def record(
+        self,
+        session_id: str,
+        agent_id: str,
+        question: str,
+        answer: str,
+        sources: List[str],
+        timestamp: Optional[datetime] = None,
+    ) -> None:
+        """Queue a query (no I/O, safe to call from the request path)"""
+        timestamp = timestamp or datetime.utcnow()
+        self._rows.append({
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "agent_id": agent_id,
+            "question": question,
+            "answer": answer,
+            "sources": sources,
+            "timestamp": timestamp,
+        })
+        self._trim()
+        
+        self._session_counts[session_id] += 1
+        self._agent_counts[agent_id] += 1
+        last_used = self._agent_last_used.get(agent_id)
+        if last_used is None or timestamp > last_used:
+            self._agent_last_used[agent_id] = timestamp
+        
+        # Without start() (scripts) rows stay buffered until flush() is called
+        if self._wakeup is not None and len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+    
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+    
+    @property
+    def settle_window(self) -> timedelta:
+        """How long after its timestamp a row may still be waiting in a buffer (of any
+        process running with these settings): the flush interval plus the time to commit"""
+        return timedelta(seconds=self.flush_interval + self.settle_margin)
+    
+    async def start(self) -> None:
+        """Start the periodic flush task (call from app startup)"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._flush_loop())
+    
+    async def stop(self) -> None:
+        """Stop the flush task and write everything still buffered (call from app shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+    
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Query log flush failed, will retry: {e}")
+    
+    async def flush(self) -> int:
+        """Write buffered rows and merged counters in one transaction, returns rows written"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        
+        async with self._flush_lock:
+            if not self._rows and not self._session_counts:
+                return 0
+            
+            rows, self._rows = self._rows, []
+            session_counts, self._session_counts = self._session_counts, defaultdict(int)
+            agent_counts, self._agent_counts = self._agent_counts, defaultdict(int)
+            agent_last_used, self._agent_last_used = self._agent_last_used, {}
+            
+            started = time.perf_counter()
+            try:
+                if self._failed_flushes >= self.max_attempts and rows:
+                    rows = await self._drop_rejected(rows, session_counts, agent_counts)
+                await self._write(rows, session_counts, agent_counts, agent_last_used)
+            except BaseException:
+                self._failed_flushes += 1
+                self._restore(rows, session_counts, agent_counts, agent_last_used)
+                raise
+            self._failed_flushes = 0
+            
+            metrics.QUERY_LOG_FLUSH_LATENCY.observe(time.perf_counter() - started)
+            metrics.QUERY_LOG_ROWS.inc(len(rows))
+            return len(rows)
+    
+    async def _write(self, rows, session_counts, agent_counts, agent_last_used) -> None:
+        async with self.session_factory() as db:
+            if rows:
+                await db.execute(insert(Query), rows)
+            for session_id, count in session_counts.items():
+                await db.execute(
+                    update(SessionModel)
+                    .where(SessionModel.id == session_id)
+                    .values(query_count=SessionModel.query_count + count)
+                )
+            for agent_id, count in agent_counts.items():
+                await db.execute(
+                    update(Agent)
+                    .where(Agent.id == agent_id)
+                    .values(query_count=Agent.query_count + count, last_used=agent_last_used[agent_id])
+                )
+            await apply_deltas(db, collect_deltas(
+                (row["agent_id"], row["timestamp"], 0, 1) for row in rows
+            ))
+            await db.commit()
+    
+    async def _drop_rejected(self, rows, session_counts, agent_counts) -> List[Dict]:
+        """Insert each row on its own (rolled back) and drop the ones the database rejects,
+        with their counter increments; errors other than a rejected row propagate"""
+        accepted = []
+        async with self.session_factory() as db:
+            for row in rows:
+                try:
+                    await db.execute(insert(Query), [row])
+                    accepted.append(row)
+                except (IntegrityError, DataError) as e:
+                    logger.error(f"❌ Query log dropped a row the database rejects: {e.orig}")
+                    metrics.QUERY_LOG_DROPPED.labels("rejected").inc()
+                    session_counts[row["session_id"]] -= 1
+                    agent_counts[row["agent_id"]] -= 1
+                finally:
+                    await db.rollback()
+        
+        for counts in (session_counts, agent_counts):
+            for key in [key for key, count in counts.items() if count <= 0]:
+                del counts[key]
+        return accepted
+    
+    def _trim(self) -> None:
+        """Bound the buffer by dropping the oldest rows"""
+        if len(self._rows) > self.max_pending:
+            dropped = len(self._rows) - self.max_pending
+            del self._rows[:dropped]
+            metrics.QUERY_LOG_DROPPED.labels("backlog_full").inc(dropped)
+            logger.error(f"❌ Query log backlog full, dropped {dropped} oldest rows")
+    
+    def _restore(self, rows, session_counts, agent_counts, agent_last_used) -> None:
+        """Put a failed batch back in front of anything recorded meanwhile"""
+        self._rows = rows + self._rows
+        self._trim()
+        for session_id, count in session_counts.items():
+            self._session_counts[session_id] += count
+        for agent_id, count in agent_counts.items():
+            self._agent_counts[agent_id] += count
+        for agent_id, last_used in agent_last_used.items():
+            current = self._agent_last_used.get(agent_id)
+            if current is None or last_used > current:
+                self._agent_last_used[agent_id] = last_used
+
+
+# Singleton instance
+query_log = QueryLogWriter()
+metrics.QUERY_LOG_PENDING.set_function(lambda: query_log.pending)
@@ -0,0 +1,371 @@
+"""
+RAG client for the voice worker
+Fetches knowledge base context for a live session from the backend RAG API
+(or directly from the shared Chroma server), speculatively prefetching on interim
+user transcripts to hide retrieval latency
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from chromadb.errors import NotFoundError
+
+from tracing import inject_headers, set_attributes, span
+from vector_store import chroma_server_url, format_results, load_embeddings, open_chroma_client
+
+logger = logging.getLogger(__name__)
+
+# Retrieval mode: 'http' (backend RAG API) or 'local' (query the Chroma server from this process,
+# needs CHROMA_SERVER_URL shared with the backend)
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "http").lower()
+
+# Query logging from the worker is batched (local retrieval and reused prefetches)
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "20"))
+QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "5.0"))
+QUERY_LOG_MAX_PENDING = 1000  # Drop the oldest entries if the backend stays unreachable
+
+# Speculative prefetch configuration
+RAG_PREFETCH = os.getenv("RAG_PREFETCH", "true").lower() == "true"
+PREFETCH_MIN_WORDS = int(os.getenv("PREFETCH_MIN_WORDS", "3"))  # Don't search on the first word or two
+PREFETCH_MIN_NEW_WORDS = int(os.getenv("PREFETCH_MIN_NEW_WORDS", "2"))  # Re-issue only after the transcript grew
+PREFETCH_MIN_SIMILARITY = float(os.getenv("PREFETCH_MIN_SIMILARITY", "0.6"))  # Reuse threshold for the final turn
+PREFETCH_CACHE_SIZE = 32
+PREFETCH_TTL = 60.0  # Seconds a prefetched result stays reusable
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def normalize_transcript(text: str) -> Tuple[str, ...]:
+    """Lowercased word tuple used as the prefetch cache key"""
+    return tuple(_WORD_RE.findall(text.lower()))
+
+
+def transcript_similarity(prefetched: Tuple[str, ...], final: Tuple[str, ...]) -> float:
+    """How well a prefetched transcript stands in for the final question (0..1)"""
+    if not prefetched or not final:
+        return 0.0
+    if prefetched == final:
+        return 1.0
+    if final[:len(prefetched)] == prefetched:
+        # Interim prefix of the final transcript: the longer the prefix, the closer
+        return len(prefetched) / len(final)
+    
+    # Fall back to word overlap (e.g. a tool-call question paraphrasing the user)
+    a, b = set(prefetched), set(final)
+    return len(a & b) / len(a | b)
+
+
+class LocalRetriever:
+    """
+    Query-only access to the agents' collections for RAG_RETRIEVAL_MODE=local.
+    Talks to the Chroma server the backend writes through (a persistent directory can't be
+    shared between processes) and embeds questions with the backend's embedding settings.
+    Collection handles are cached and looked up again once an index switch-over retired them.
+    """
+    
+    def __init__(self):
+        if not chroma_server_url():
+            raise RuntimeError("RAG_RETRIEVAL_MODE=local needs CHROMA_SERVER_URL (the Chroma server the backend uses)")
+        self.chroma_client = open_chroma_client(os.getenv("CHROMADB_PATH", "./chroma_db"))
+        self.embeddings = load_embeddings(
+            os.getenv("GOOGLE_API_KEY"),
+            os.getenv("USE_LOCAL_EMBEDDINGS", "false").lower() == "true"
+        )
+        self._collections: Dict[str, object] = {}
+    
+    def warm(self) -> None:
+        """Embed once so the first question doesn't pay the model's lazy initialization
+        (the collections themselves are warmed in the Chroma server by the backend's warm-up)"""
+        self.embeddings.embed_query("warm up")
+    
+    def _collection(self, name: str, refresh: bool = False):
+        if refresh or name not in self._collections:
+            self._collections[name] = self.chroma_client.get_collection(name)
+        return self._collections[name]
+    
+    def retrieve(self, agent_id: str, question: str, session_id: Optional[str] = None, k: int = 5) -> Dict:
+        """Same result shape as the backend's retrieve, with "error" when the collection is missing"""
+        name = f"agent_{agent_id}_session_{session_id}" if session_id else f"agent_{agent_id}"
+        question_embedding = self.embeddings.embed_query(question)
+        
+        for refresh in (False, True):
+            try:
+                collection = self._collection(name, refresh)
+                results = collection.query(
+                    query_embeddings=[question_embedding],
+                    n_results=min(k, collection.count())
+                )
+                return format_results(results)
+            except NotFoundError:
+                # Deleted, or retired by a switch-over: look the name up again once
+                self._collections.pop(name, None)
+                if refresh:
+                    break
+                time.sleep(0.05)  # caught between the two renames of a switch-over
+        return {"context": "", "sources": [], "error": f"Collection not found: {name}"}
+
+
+_local_retriever: Optional[LocalRetriever] = None
+_local_retriever_lock = threading.Lock()
+
+
+def load_local_retriever() -> LocalRetriever:
+    """The process' LocalRetriever (connects and loads the embedding model on first use)"""
+    global _local_retriever
+    with _local_retriever_lock:
+        if _local_retriever is None:
+            logger.info("📦 Loading local RAG retriever (local retrieval mode)")
+            _local_retriever = LocalRetriever()
+    return _local_retriever
+
+
+def format_rag_result(data: Dict, max_sources: int = 3) -> str:
+    """Format a RAG API response as context text followed by its top sources"""
+    context_text = data.get("context", "")
+    sources = data.get("sources", [])
+    
+    if sources:
+        source_list = ", ".join(sources[:max_sources])
+        return f"{context_text}\n\nSources: {source_list}"
+    return context_text
+
+
+class RAGClient:
+    """Retrieves knowledge base context for one voice session"""
+    
+    def __init__(self, backend_url: str, session_id: str, agent_id: Optional[str] = None, timeout: float = 10.0):
+        self.backend_url = backend_url
+        self.session_id = session_id
+        self.agent_id = agent_id
+        self.local = RAG_RETRIEVAL_MODE == "local" and bool(agent_id)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._http: Optional[aiohttp.ClientSession] = None
+        
+        # Batched query log, flushed to POST /api/sessions/{id}/log
+        self._log_entries: List[Dict] = []
+        self._log_wakeup = asyncio.Event()
+        self._log_task: Optional[asyncio.Task] = None
+        
+        # Prefetch state, keyed by normalized transcript
+        self._prefetched: "OrderedDict[Tuple[str, ...], Tuple[float, Dict]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, ...], asyncio.Task] = {}
+        self._last_prefetch_key: Tuple[str, ...] = ()
+    
+    def _get_http(self) -> aiohttp.ClientSession:
+        """Reuse one HTTP connection pool for all queries of the session"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(timeout=self.timeout)
+        return self._http
+    
+    async def query(self, question: str, speculative: bool = False) -> Dict:
+        """
+        Retrieve context for a question, returns {"context": str, "sources": [str]}
+        Speculative queries are not logged
+        """
+        if self.local:
+            data = await self._query_local(question)
+            if data is not None:
+                if not speculative:
+                    self._enqueue_log(question, data)
+                return data
+            # Fall through to the backend API
+        
+        return await self._query_http(question, speculative)
+    
+    async def _query_local(self, question: str) -> Optional[Dict]:
+        """In-process retrieval, None means fall back to HTTP"""
+        try:
+            with span("rag_client.local_retrieve"):
+                retriever = await asyncio.to_thread(load_local_retriever)
+                data = await asyncio.to_thread(retriever.retrieve, self.agent_id, question, self.session_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Local retrieval failed, falling back to backend API: {e}")
+            return None
+        
+        if data.get("error"):
+            logger.warning(f"⚠️ Local retrieval unavailable ({data['error']}), falling back to backend API")
+            return None
+        
+        logger.info(f"RAG (local) returned {len(data.get('context', ''))} chars, {len(data.get('sources', []))} sources")
+        return data
+    
+    async def _query_http(self, question: str, speculative: bool) -> Dict:
+        """Query the backend RAG API (logs non-speculative queries itself)"""
+        url = f"{self.backend_url}/api/sessions/{self.session_id}/query"
+        payload = {"question": question, "speculative": speculative}
+        
+        with span("rag_client.http_query", speculative=speculative):
+            # traceparent lets the backend continue this trace
+            async with self._get_http().post(url, json=payload, headers=inject_headers()) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise RuntimeError(f"RAG API error: {response.status} - {error_text}")
+                
+                data = await response.json()
+            logger.info(
+                f"RAG returned {len(data.get('context', ''))} chars, "
+                f"{len(data.get('sources', []))} sources{' (speculative)' if speculative else ''}"
+            )
+            return data
+    
+    def prefetch(self, transcript: str) -> None:
+        """Start a speculative lookup for an interim transcript (call from event handlers)"""
+        if not RAG_PREFETCH:
+            return
+        
+        key = normalize_transcript(transcript)
+        if len(key) < PREFETCH_MIN_WORDS or key in self._prefetched or key in self._in_flight:
+            return
+        
+        # Only re-issue once the user said something new, not on every interim word
+        last = self._last_prefetch_key
+        if last and key[:len(last)] == last and len(key) - len(last) < PREFETCH_MIN_NEW_WORDS:
+            return
+        
+        # Cancel lookups the user has talked past (no longer a prefix of what they're saying)
+        for stale_key, task in list(self._in_flight.items()):
+            if key[:len(stale_key)] != stale_key:
+                task.cancel()
+                self._in_flight.pop(stale_key, None)
+        
+        self._last_prefetch_key = key
+        task = asyncio.create_task(self._run_prefetch(key, transcript))
+        self._in_flight[key] = task
+    
+    async def _run_prefetch(self, key: Tuple[str, ...], transcript: str) -> Optional[Dict]:
+        try:
+            data = await self.query(transcript, speculative=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Speculative RAG prefetch failed: {e}")
+            return None
+        finally:
+            self._in_flight.pop(key, None)
+        
+        self._prefetched[key] = (time.monotonic(), data)
+        self._prefetched.move_to_end(key)
+        while len(self._prefetched) > PREFETCH_CACHE_SIZE:
+            self._prefetched.popitem(last=False)
+        return data
+    
+    def _closest_prefetch(self, key: Tuple[str, ...]):
+        """Best cached result or in-flight task for the final question"""
+        now = time.monotonic()
+        for cached_key in [k for k, (at, _) in self._prefetched.items() if now - at > PREFETCH_TTL]:
+            del self._prefetched[cached_key]
+        
+        candidates: List[Tuple[float, bool, object]] = []
+        for cached_key, (_, data) in self._prefetched.items():
+            candidates.append((transcript_similarity(cached_key, key), True, data))
+        for pending_key, task in self._in_flight.items():
+            candidates.append((transcript_similarity(pending_key, key), False, task))
+        
+        if not candidates:
+            return None
+        
+        # Prefer higher similarity, then results that are already available
+        score, done, result = max(candidates, key=lambda c: (c[0], c[1]))
+        if score < PREFETCH_MIN_SIMILARITY:
+            return None
+        return result
+    
+    async def get(self, question: str) -> Dict:
+        """Context for a final question, reusing the closest prefetched result when possible"""
+        key = normalize_transcript(question)
+        match = self._closest_prefetch(key)
+        
+        data = None
+        if isinstance(match, asyncio.Task):
+            try:
+                data = await asyncio.shield(match)
+            except asyncio.CancelledError:
+                if not match.cancelled():
+                    raise
+            except Exception:
+                data = None
+        elif match is not None:
+            data = match
+        
+        # The turn is over: drop lookups for transcripts that were never finalized
+        self._end_turn()
+        set_attributes(prefetch_reused=data is not None)
+        
+        if data is None:
+            return await self.query(question)
+        
+        logger.info(f"⚡ Reusing prefetched RAG result for: {question[:80]}")
+        self._enqueue_log(question, data)
+        return data
+    
+    def _end_turn(self) -> None:
+        for task in self._in_flight.values():
+            task.cancel()
+        self._in_flight.clear()
+        self._last_prefetch_key = ()
+    
+    def _enqueue_log(self, question: str, data: Dict) -> None:
+        """Queue a query the backend didn't log itself, flushed off the answer path"""
+        self._log_entries.append({
+            "question": question,
+            "context": data.get("context", ""),
+            "sources": data.get("sources", []),
+        })
+        if len(self._log_entries) > QUERY_LOG_MAX_PENDING:
+            del self._log_entries[:len(self._log_entries) - QUERY_LOG_MAX_PENDING]
+        
+        if self._log_task is None:
+            self._log_task = asyncio.create_task(self._log_flush_loop())
+        if len(self._log_entries) >= QUERY_LOG_BATCH_SIZE:
+            self._log_wakeup.set()
+    
+    async def _log_flush_loop(self) -> None:
+        """Flush the query log every QUERY_LOG_FLUSH_INTERVAL seconds or when a batch fills up"""
+        while True:
+            try:
+                await asyncio.wait_for(self._log_wakeup.wait(), timeout=QUERY_LOG_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._log_wakeup.clear()
+            await self._flush_logs()
+    
+    async def _flush_logs(self) -> None:
+        if not self._log_entries:
+            return
+        
+        entries, self._log_entries = self._log_entries, []
+        url = f"{self.backend_url}/api/sessions/{self.session_id}/log"
+        try:
+            async with self._get_http().post(url, json={"queries": entries}) as response:
+                if response.status == 200:
+                    return
+                logger.warning(f"⚠️ Query log failed: {response.status} - {await response.text()}")
+        except asyncio.CancelledError:
+            self._log_entries = entries + self._log_entries
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Query log failed: {e}")
+        
+        # Keep the batch for the next flush
+        self._log_entries = entries + self._log_entries
+    
+    async def close(self) -> None:
+        """Cancel pending prefetches, flush the query log and close the HTTP session"""
+        self._end_turn()
+        
+        if self._log_task is not None:
+            self._log_task.cancel()
+            # Let an interrupted flush put its batch back before the final flush
+            await asyncio.gather(self._log_task, return_exceptions=True)
+            self._log_task = None
+        await self._flush_logs()
+        
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
@@ -3,8 +3,14 @@ RAG Pipeline for document processing and retrieval
 Handles document loading, chunking, embedding, and vector search
 """
 
+import asyncio
+import hashlib
+import json
+import logging
 import os
-from typing import List, Dict, Optional
+import time
+import uuid
+from typing import List, Dict, Optional, Tuple
 import tempfile
 from pathlib import Path
 
@@ -12,18 +18,33 @@ from pathlib import Path
 from pypdf import PdfReader
 from docx import Document as DocxDocument
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 # Vector store
-import chromadb
-from chromadb.config import Settings
+from chromadb.errors import NotFoundError
 
 # FastAPI
 from fastapi import UploadFile
 from dotenv import load_dotenv
 
+import metrics
+from metrics import observe
+from tracing import span
+from index_profiles import collection_hnsw, hnsw_configuration, matches_profile, resolve_profile
+import dedup
+from vector_store import chroma_server_url, format_results, load_embeddings, open_chroma_client
+from plan_files import write_plan
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+UPLOAD_READ_BLOCK = 1024 * 1024  # bytes read from an upload at a time
+DEFAULT_CHUNK_SIZE = 1000  # characters, agents can override (Agent.chunk_size)
+DEFAULT_CHUNK_OVERLAP = 200
+DEDUP_QUERY_BATCH = 500  # chunks per LSH candidate lookup
+INDEX_REBUILD_BATCH = 1000  # chunks copied per get/add during an index rebuild
+SWITCHOVER_PLAN_DIR = os.getenv("SWITCHOVER_PLAN_DIR", "./switchover_plans")  # in-flight index switch-overs
+
 class RAGPipeline:
     """RAG Pipeline for document processing and retrieval"""
     
@@ -32,82 +53,45 @@ class RAGPipeline:
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
         self.use_local_embeddings = os.getenv("USE_LOCAL_EMBEDDINGS", "false").lower() == "true"
         
-        # Initialize ChromaDB client
-        self.chroma_client = chromadb.PersistentClient(
-            path=self.chroma_path,
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            )
-        )
+        # Initialize ChromaDB client (the shared Chroma server when CHROMA_SERVER_URL is set)
+        self.chroma_client = open_chroma_client(self.chroma_path)
+        self.chroma_local = chroma_server_url() is None  # False: the store's files live on the server, not in chroma_path
         
         # Initialize embeddings with fallback
         self.embeddings = self._initialize_embeddings()
         
-        # Text splitter configuration
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        # Text splitter configuration (agents with their own chunk settings get one from splitter())
+        self.text_splitter = self._make_splitter(DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP)
+        self._splitters: Dict[Tuple[int, int], RecursiveCharacterTextSplitter] = {}
+        
+        # Serializes writes to an agent's base collection with index rebuilds
+        self._agent_locks: Dict[str, asyncio.Lock] = {}
+        self.rebuilding: set = set()  # agent ids with a rebuild in progress
+        self.reindexing: set = set()  # agent ids with a re-index (re-extract and re-embed) in progress
+        self.switching: Dict[str, Dict] = {}  # agent_id -> plan of its switch-over in progress
+    
+    def agent_lock(self, agent_id: str) -> asyncio.Lock:
+        """Per-agent lock held while writing to or rebuilding the agent's base collection"""
+        if agent_id not in self._agent_locks:
+            self._agent_locks[agent_id] = asyncio.Lock()
+        return self._agent_locks[agent_id]
     
     def _initialize_embeddings(self):
         """Initialize embeddings with automatic fallback to local on quota errors"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        # Force local embeddings if configured
-        if self.use_local_embeddings:
-            logger.info("🏠 Using LOCAL embeddings (sentence-transformers/all-MiniLM-L6-v2)")
-            from langchain_community.embeddings import HuggingFaceEmbeddings
-            return HuggingFaceEmbeddings(
-                model_name="all-MiniLM-L6-v2",
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
-            )
-        
-        # Try Google embeddings first
-        if self.google_api_key:
-            try:
-                logger.info("☁️ Attempting to use GOOGLE embeddings (embedding-001)")
-                embeddings = GoogleGenerativeAIEmbeddings(
-                    model="models/embedding-001",
-                    google_api_key=self.google_api_key
-                )
-                # Test with a small embedding to check quota
-                test_text = "test"
-                embeddings.embed_query(test_text)
-                logger.info("✅ Google embeddings initialized successfully")
-                return embeddings
-            except Exception as e:
-                error_msg = str(e)
-                if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg or "Quota exceeded" in error_msg:
-                    logger.warning(f"⚠️ Google API quota exceeded, falling back to local embeddings")
-                    logger.warning(f"   Error: {error_msg[:200]}")
-                else:
-                    logger.warning(f"⚠️ Google embeddings failed, falling back to local: {error_msg[:200]}")
-        
-        # Fallback to local embeddings
-        logger.info("🏠 Using LOCAL embeddings (sentence-transformers/all-MiniLM-L6-v2)")
-        from langchain_community.embeddings import HuggingFaceEmbeddings
-        return HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        return load_embeddings(self.google_api_key, self.use_local_embeddings)
     
-    def extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF file"""
+    def extract_pages_from_pdf(self, file_path: str) -> List[str]:
+        """Extract the text of each PDF page"""
         try:
             reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            return [page.extract_text() or "" for page in reader.pages]
         except Exception as e:
             raise Exception(f"Error extracting PDF text: {str(e)}")
     
+    def extract_text_from_pdf(self, file_path: str) -> str:
+        """Extract text from PDF file"""
+        return "".join(page + "\n" for page in self.extract_pages_from_pdf(file_path))
+    
     def extract_text_from_docx(self, file_path: str) -> str:
         """Extract text from DOCX file"""
         try:
@@ -140,77 +124,242 @@ class RAGPipeline:
         else:
             raise ValueError(f"Unsupported file type: {extension}")
     
+    async def spool_upload(self, file: UploadFile) -> Dict:
+        """Stream an upload to a temporary file, hashing it on the way (caller removes the file)"""
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
+            try:
+                while True:
+                    block = await file.read(UPLOAD_READ_BLOCK)
+                    if not block:
+                        break
+                    digest.update(block)
+                    tmp_file.write(block)
+                    size += len(block)
+            except Exception:
+                tmp_file.close()
+                os.unlink(tmp_file.name)
+                raise
+        
+        return {"path": tmp_file.name, "size": size, "sha256": digest.hexdigest()}
+    
+    @staticmethod
+    def _make_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            separators=["\n\n", "\n", " ", ""]
+        )
+    
+    def splitter(self, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> RecursiveCharacterTextSplitter:
+        """Text splitter for an agent's chunk settings (None keeps the default)"""
+        if chunk_size is None and chunk_overlap is None:
+            return self.text_splitter
+        key = (chunk_size or DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap)
+        if key not in self._splitters:
+            self._splitters[key] = self._make_splitter(*key)
+        return self._splitters[key]
+    
+    def extract_chunks(
+        self,
+        file_path: str,
+        filename: str,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None
+    ) -> Tuple[List[str], int]:
+        """Extract a document's text and split it into chunks, returns (chunks, furniture lines removed)"""
+        furniture_lines = 0
+        
+        # Extract text (PDF page headers, footers and TOC lines are dropped)
+        with observe(metrics.INGEST_STAGE_LATENCY.labels("extract")), span("ingest.extract", filename=filename):
+            if Path(filename).suffix.lower() == '.pdf' and dedup.DEDUP_ENABLED:
+                text, furniture_lines = dedup.strip_page_furniture(self.extract_pages_from_pdf(file_path))
+            else:
+                text = self.extract_text(file_path, filename)
+        
+        # Chunk text
+        with observe(metrics.INGEST_STAGE_LATENCY.labels("chunk")), span("ingest.chunk"):
+            chunks = self.splitter(chunk_size, chunk_overlap).split_text(text)
+        
+        if not chunks:
+            raise ValueError("No text chunks extracted from document")
+        metrics.INGEST_FURNITURE_LINES.inc(furniture_lines)
+        return chunks, furniture_lines
+    
+    def suppress_duplicates(
+        self,
+        agent_id: str,
+        chunks: List[str],
+        exclude_doc_id: Optional[str] = None,
+        index: Optional[dedup.NearDuplicateIndex] = None,
+        stored: bool = True,
+        owner: Optional[str] = None,
+        sources: Optional[set] = None,
+        signatures: Optional[Dict] = None
+    ) -> Tuple[List[str], int]:
+        """Drop chunks that nearly duplicate an earlier chunk or one already stored for the agent
+        (pass the same index for several documents to also compare them with each other,
+        stored=False skips the agent's stored chunks). Kept chunks enter the index under owner,
+        the ids of other documents holding the copies of dropped chunks are added to sources and
+        the kept chunks' MinHash signatures to signatures (text -> signature, for chunk_records)."""
+        if not dedup.DEDUP_ENABLED:
+            return chunks, 0
+        
+        with observe(metrics.INGEST_STAGE_LATENCY.labels("dedup")), span("ingest.dedup", chunks=len(chunks)):
+            chunk_signatures = [dedup.minhash(chunk) for chunk in chunks]
+            if index is None:
+                index = dedup.NearDuplicateIndex()
+            for text, document_id in self._lsh_candidates(agent_id, chunk_signatures, exclude_doc_id) if stored else ():
+                index.add(dedup.minhash(text), document_id)
+            
+            kept = []
+            for chunk, signature in zip(chunks, chunk_signatures):
+                position = index.match(signature)
+                if position is not None:
+                    if sources is not None and index.owners[position] not in (None, owner):
+                        sources.add(index.owners[position])
+                    continue
+                index.add(signature, owner)
+                kept.append(chunk)
+                if signatures is not None:
+                    signatures[chunk] = signature
+        
+        suppressed = len(chunks) - len(kept)
+        metrics.INGEST_SUPPRESSED_CHUNKS.inc(suppressed)
+        return kept, suppressed
+    
+    def _lsh_candidates(self, agent_id: str, signatures: List, exclude_doc_id: Optional[str]) -> List[Tuple[str, str]]:
+        """(text, document id) of stored chunks sharing at least one LSH band with the given signatures"""
+        try:
+            collection = self.chroma_client.get_collection(f"agent_{agent_id}")
+        except Exception:
+            return []
+        
+        candidates = []
+        for start in range(0, len(signatures), DEDUP_QUERY_BATCH):
+            bands = [dedup.lsh_bands(signature) for signature in signatures[start:start + DEDUP_QUERY_BATCH]]
+            where = {"$or": [{key: {"$in": sorted({b[key] for b in bands})}} for key in dedup.LSH_KEYS]}
+            if exclude_doc_id:
+                where = {"$and": [{"document_id": {"$ne": exclude_doc_id}}, where]}
+            found = collection.get(where=where, include=['documents', 'metadatas'])
+            candidates.extend(
+                (text, (metadata or {}).get("document_id")) for text, metadata in zip(found['documents'], found['metadatas'])
+            )
+        return candidates
+    
+    def embed_chunks(self, chunks: List[str]) -> List[List[float]]:
+        with observe(metrics.INGEST_STAGE_LATENCY.labels("embed")), observe(metrics.EMBED_DOCUMENTS), span("ingest.embed", chunks=len(chunks)):
+            return self.embeddings.embed_documents(chunks)
+    
+    @staticmethod
+    def chunk_hash(chunk: str) -> str:
+        """Short content hash identifying a chunk's text"""
+        return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16]
+    
+    def chunk_records(
+        self,
+        doc_id: str,
+        filename: str,
+        chunks: List[str],
+        taken: Optional[set] = None,
+        signatures: Optional[Dict] = None
+    ):
+        """Chunk IDs ({doc_id}_{hash}_{n}) and metadata, n tells repeated chunks apart.
+        LSH bands come from the signatures suppress_duplicates collected, computed for chunks missing there."""
+        signatures = signatures or {}
+        taken = set(taken or ())
+        chunk_ids = []
+        metadatas = []
+        for i, chunk in enumerate(chunks):
+            digest = self.chunk_hash(chunk)
+            n = 0
+            while f"{doc_id}_{digest}_{n}" in taken:
+                n += 1
+            chunk_id = f"{doc_id}_{digest}_{n}"
+            taken.add(chunk_id)
+            chunk_ids.append(chunk_id)
+            metadatas.append({
+                "document_id": doc_id,
+                "filename": filename,
+                "chunk_index": i,
+                "total_chunks": len(chunks),
+                "chunk_hash": digest,
+                **dedup.lsh_bands(signatures[chunk] if chunk in signatures else dedup.minhash(chunk))
+            })
+        return chunk_ids, metadatas
+    
+    def agent_collection(self, agent_id: str, index_profile: Optional[str] = None, chunk_count: int = 0):
+        """Get or create an agent's base collection (call with the agent lock held)"""
+        collection_name = f"agent_{agent_id}"
+        try:
+            return self.chroma_client.get_collection(collection_name)
+        except Exception:
+            # Index profile picked from the first document
+            return self.chroma_client.create_collection(
+                name=collection_name,
+                metadata={"agent_id": agent_id},
+                configuration=hnsw_configuration(resolve_profile(index_profile, chunk_count))
+            )
+    
+    def add_chunks(self, agent_id: str, index_profile: Optional[str], **records) -> None:
+        """Add chunk records to the agent's base collection, creating it for the first document
+        (call with the agent lock held)"""
+        collection = self.agent_collection(agent_id, index_profile, len(records["ids"]))
+        collection.add(**records)
+    
     async def process_document(
         self, 
         agent_id: str, 
-        file: UploadFile,
-        doc_id: str
+        file_path: str,
+        filename: str,
+        doc_id: str,
+        index_profile: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None
     ) -> Dict:
-        """Process document: extract text, chunk, embed, and store in ChromaDB"""
-        
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-        
+        """Process a spooled document: extract text, chunk, embed, and store in ChromaDB
+        (the blocking steps run on worker threads, the event loop keeps serving other requests)"""
         try:
-            # Extract text
-            text = self.extract_text(tmp_file_path, file.filename)
-            
-            # Chunk text
-            chunks = self.text_splitter.split_text(text)
-            
-            if not chunks:
-                raise ValueError("No text chunks extracted from document")
-            
-            # Get or create collection for this agent
+            chunks, furniture_lines = await asyncio.to_thread(self.extract_chunks, file_path, filename, chunk_size, chunk_overlap)
+            suppressed_by, signatures = set(), {}
+            chunks, suppressed = await asyncio.to_thread(
+                self.suppress_duplicates, agent_id, chunks, None, None, True, doc_id, suppressed_by, signatures
+            )
             collection_name = f"agent_{agent_id}"
-            try:
-                collection = self.chroma_client.get_collection(collection_name)
-            except:
-                collection = self.chroma_client.create_collection(
-                    name=collection_name,
-                    metadata={"agent_id": agent_id}
-                )
-            
-            # Generate embeddings and store chunks
-            chunk_ids = []
-            documents = []
-            metadatas = []
-            
-            for i, chunk in enumerate(chunks):
-                chunk_id = f"{doc_id}_chunk_{i}"
-                chunk_ids.append(chunk_id)
-                documents.append(chunk)
-                metadatas.append({
-                    "document_id": doc_id,
-                    "filename": file.filename,
-                    "chunk_index": i,
-                    "total_chunks": len(chunks)
-                })
             
-            # Generate embeddings
-            embeddings_list = self.embeddings.embed_documents(documents)
+            # Generate embeddings and store chunks (none left if the whole document repeats stored content)
+            if chunks:
+                chunk_ids, metadatas = await asyncio.to_thread(self.chunk_records, doc_id, filename, chunks, None, signatures)
+                embeddings_list = await asyncio.to_thread(self.embed_chunks, chunks)
+                
+                # Add to ChromaDB (waits for an index switch-over of this agent)
+                async with self.agent_lock(agent_id):
+                    with observe(metrics.INGEST_STAGE_LATENCY.labels("store")), span("ingest.store"):
+                        await asyncio.to_thread(
+                            self.add_chunks, agent_id, index_profile,
+                            ids=chunk_ids, embeddings=embeddings_list, documents=chunks, metadatas=metadatas
+                        )
             
-            # Add to ChromaDB
-            collection.add(
-                ids=chunk_ids,
-                embeddings=embeddings_list,
-                documents=documents,
-                metadatas=metadatas
-            )
+            metrics.INGEST_DOCUMENTS.labels("success").inc()
+            metrics.INGEST_CHUNKS.inc(len(chunks))
+            file_size = os.path.getsize(file_path)
+            metrics.INGEST_BYTES.inc(file_size)
             
             return {
                 "status": "success",
                 "chunks_processed": len(chunks),
-                "file_size": len(content),
+                "chunks_suppressed": suppressed,
+                "furniture_lines_removed": furniture_lines,
+                "suppressed_by": sorted(suppressed_by),
+                "file_size": file_size,
                 "collection_name": collection_name
             }
-            
-        finally:
-            # Cleanup temporary file
-            os.unlink(tmp_file_path)
+        
+        except Exception:
+            metrics.INGEST_DOCUMENTS.labels("error").inc()
+            raise
     
     async def query_rag(
         self, 
@@ -220,7 +369,30 @@ class RAGPipeline:
         k: int = 5
     ) -> Dict:
         """Query RAG pipeline for relevant document chunks"""
-        
+        # Embedding and vector search are blocking, keep them off the event loop
+        # (the worker thread inherits the current trace context)
+        with span("rag.query_rag", agent_id=agent_id, k=k):
+            return await asyncio.to_thread(self.retrieve, agent_id, question, session_id, k)
+    
+    def retrieve(
+        self,
+        agent_id: str,
+        question: str,
+        session_id: Optional[str] = None,
+        k: int = 5
+    ) -> Dict:
+        """Synchronous retrieval (read-only), also used in-process by the voice worker"""
+        with observe(metrics.RETRIEVAL_LATENCY), span("rag.retrieve", session_collection=bool(session_id)):
+            return self._retrieve(agent_id, question, session_id, k)
+    
+    def _retrieve(
+        self,
+        agent_id: str,
+        question: str,
+        session_id: Optional[str],
+        k: int,
+        retried: bool = False
+    ) -> Dict:
         # Determine collection name (session-specific or base)
         if session_id:
             collection_name = f"agent_{agent_id}_session_{session_id}"
@@ -228,8 +400,12 @@ class RAGPipeline:
             collection_name = f"agent_{agent_id}"
         
         try:
-            collection = self.chroma_client.get_collection(collection_name)
-        except Exception as e:
+            if session_id:
+                collection = self.chroma_client.get_collection(collection_name)
+            else:
+                collection = self._base_collection(agent_id)
+        except Exception:
+            metrics.RETRIEVAL_NO_COLLECTION.inc()
             return {
                 "context": "",
                 "sources": [],
@@ -237,39 +413,46 @@ class RAGPipeline:
             }
         
         # Generate embedding for question
-        question_embedding = self.embeddings.embed_query(question)
+        with observe(metrics.EMBED_QUERY), span("rag.embed_query"):
+            question_embedding = self.embeddings.embed_query(question)
         
         # Search ChromaDB
-        results = collection.query(
-            query_embeddings=[question_embedding],
-            n_results=min(k, collection.count())
-        )
-        
-        if not results['documents'] or not results['documents'][0]:
-            return {
-                "context": "",
-                "sources": []
-            }
-        
-        # Format context from retrieved chunks
-        chunks = results['documents'][0]
-        metadatas = results['metadatas'][0]
-        
-        # Build context string
-        context_parts = []
-        sources = set()
-        
-        for chunk, metadata in zip(chunks, metadatas):
-            context_parts.append(chunk)
-            sources.add(metadata['filename'])
-        
-        context = "\n\n".join(context_parts)
+        try:
+            with observe(metrics.VECTOR_QUERY_LATENCY), span("rag.vector_search", k=k):
+                results = collection.query(
+                    query_embeddings=[question_embedding],
+                    n_results=min(k, collection.count())
+                )
+        except NotFoundError:
+            if session_id or retried:
+                raise
+            # An index rebuild retired this collection between lookup and search, look it up again
+            return self._retrieve(agent_id, question, session_id, k, retried=True)
         
-        return {
-            "context": context,
-            "sources": list(sources),
-            "num_chunks": len(chunks)
-        }
+        data = format_results(results)
+        if data["sources"]:
+            metrics.RETRIEVAL_HIT.inc()
+        else:
+            metrics.RETRIEVAL_EMPTY.inc()
+        return data
+    
+    def _base_collection(self, agent_id: str):
+        """The agent's live collection, or between the renames of a switch-over whichever of
+        its retired and staging collections (both complete) still exists"""
+        name = f"agent_{agent_id}"
+        try:
+            return self.chroma_client.get_collection(name)
+        except NotFoundError:
+            plan = self.switching.get(agent_id)
+            if plan is None:
+                raise
+        # The renames go live -> retired, then staging -> live: at least one of these exists
+        for candidate in (plan["retired"], plan["staging"], name):
+            try:
+                return self.chroma_client.get_collection(candidate)
+            except NotFoundError:
+                continue
+        raise NotFoundError(f"Collection {name} does not exist.")
     
     def create_session_collection(self, agent_id: str, session_id: str) -> None:
         """Create a session-specific collection by copying agent's base collection"""
@@ -277,35 +460,43 @@ class RAGPipeline:
         session_collection_name = f"agent_{agent_id}_session_{session_id}"
         
         try:
-            # Check if base collection exists, create if it doesn't (for agents without documents)
-            try:
-                base_collection = self.chroma_client.get_collection(base_collection_name)
-            except Exception:
-                # Base collection doesn't exist (agent created without documents)
-                # Create an empty base collection for this agent
-                base_collection = self.chroma_client.create_collection(
-                    name=base_collection_name,
-                    metadata={"agent_id": agent_id}
-                )
-            
-            # Get all documents from base collection (may be empty)
-            all_data = base_collection.get(include=['embeddings', 'documents', 'metadatas'])
-            
-            # Create session collection
-            session_collection = self.chroma_client.create_collection(
-                name=session_collection_name,
-                metadata={"agent_id": agent_id, "session_id": session_id}
-            )
-            
-            # Copy data to session collection (if any exists)
-            if all_data['ids'] and len(all_data['ids']) > 0:
-                session_collection.add(
-                    ids=all_data['ids'],
-                    embeddings=all_data['embeddings'],
-                    documents=all_data['documents'],
-                    metadatas=all_data['metadatas']
+            with observe(metrics.SESSION_COLLECTION_LATENCY), span("rag.session_collection_copy"):
+                # Check if base collection exists, create if it doesn't (for agents without documents)
+                try:
+                    base_collection = self.chroma_client.get_collection(base_collection_name)
+                except Exception:
+                    # Base collection doesn't exist (agent created without documents)
+                    # Create an empty base collection for this agent
+                    base_collection = self.chroma_client.create_collection(
+                        name=base_collection_name,
+                        metadata={"agent_id": agent_id},
+                        configuration=hnsw_configuration(resolve_profile(None, 0))
+                    )
+                
+                # Get all documents from base collection (may be empty)
+                all_data = base_collection.get(include=['embeddings', 'documents', 'metadatas'])
+                
+                # Create session collection with the same index settings as the base
+                session_collection = self.chroma_client.create_collection(
+                    name=session_collection_name,
+                    metadata={"agent_id": agent_id, "session_id": session_id},
+                    configuration={"hnsw": {key: value for key, value in collection_hnsw(base_collection).items() if value is not None}}
                 )
-            # If no documents, session collection is created but empty (which is fine)
+                
+                # Copy data to session collection (if any exists), without the LSH bands only ingestion reads
+                if all_data['ids'] and len(all_data['ids']) > 0:
+                    lsh_keys = set(dedup.LSH_KEYS)
+                    session_collection.add(
+                        ids=all_data['ids'],
+                        embeddings=all_data['embeddings'],
+                        documents=all_data['documents'],
+                        metadatas=[
+                            {key: value for key, value in (metadata or {}).items() if key not in lsh_keys} or None
+                            for metadata in all_data['metadatas']
+                        ]
+                    )
+                    metrics.SESSION_COLLECTION_CHUNKS.inc(len(all_data['ids']))
+                # If no documents, session collection is created but empty (which is fine)
             
         except Exception as e:
             raise Exception(f"Error creating session collection: {str(e)}")
@@ -327,6 +518,27 @@ class RAGPipeline:
         except Exception as e:
             print(f"Warning: Could not delete collection {collection_name}: {str(e)}")
     
+    def list_collection_names(self) -> List[str]:
+        """Names of all collections in the store"""
+        return [collection.name for collection in self.chroma_client.list_collections()]
+    
+    def delete_collections(self, names: List[str]) -> List[str]:
+        """Delete many collections in one pass, returns the names actually deleted"""
+        deleted = []
+        for name in names:
+            try:
+                self.chroma_client.delete_collection(name)
+                deleted.append(name)
+            except Exception as e:
+                print(f"Warning: Could not delete collection {name}: {str(e)}")
+        return deleted
+    
+    def delete_agent_collections(self, agent_id: str) -> List[str]:
+        """Delete an agent's base collection, its session collections and any rebuild leftovers"""
+        prefix = f"agent_{agent_id}_"
+        names = [name for name in self.list_collection_names() if name == f"agent_{agent_id}" or name.startswith(prefix)]
+        return self.delete_collections(names)
+    
     def delete_document_chunks(self, agent_id: str, doc_id: str) -> None:
         """Delete all chunks for a specific document"""
         collection_name = f"agent_{agent_id}"
@@ -343,6 +555,279 @@ class RAGPipeline:
                 
         except Exception as e:
             print(f"Warning: Could not delete document chunks: {str(e)}")
+    
+    def warm_collection(self, agent_id: str, embedding: List[float]) -> bool:
+        """Load an agent's collection into memory with a throwaway search, False if it has none"""
+        try:
+            collection = self.chroma_client.get_collection(f"agent_{agent_id}")
+            collection.query(query_embeddings=[embedding], n_results=1, include=[])
+            return True
+        except Exception as e:
+            print(f"Warning: Could not warm collection for agent {agent_id}: {str(e)}")
+            return False
+    
+    def document_chunks(self, agent_id: str, doc_id: str) -> Dict:
+        """Stored chunk IDs, texts and metadata of one document"""
+        try:
+            collection = self.chroma_client.get_collection(f"agent_{agent_id}")
+        except Exception:
+            return {"ids": [], "documents": [], "metadatas": []}
+        return collection.get(where={"document_id": doc_id}, include=['documents', 'metadatas'])
+    
+    def apply_chunk_changes(
+        self,
+        agent_id: str,
+        add: Optional[Dict] = None,
+        update: Optional[Dict] = None,
+        delete_ids: Optional[List[str]] = None,
+        index_profile: Optional[str] = None
+    ) -> None:
+        """Add, re-label and delete chunks of an agent's collection (call with the agent lock held)"""
+        collection = self.agent_collection(agent_id, index_profile, len(add['ids']) if add else 0)
+        if add and add['ids']:
+            collection.upsert(**add)
+        if update and update['ids']:
+            collection.update(**update)
+        if delete_ids:
+            collection.delete(ids=delete_ids)
+    
+    def create_staging_collection(self, agent_id: str, profile: str):
+        """Empty collection to build a new index of the agent in, switched to by promote_collection"""
+        return self.chroma_client.create_collection(
+            name=f"agent_{agent_id}_rebuild_{uuid.uuid4().hex[:8]}",
+            metadata={"agent_id": agent_id},
+            configuration=hnsw_configuration(profile)
+        )
+    
+    @staticmethod
+    def _switchover_plan_path(agent_id: str) -> str:
+        return os.path.join(SWITCHOVER_PLAN_DIR, f"agent_{agent_id}.json")
+    
+    def promote_collection(self, agent_id: str, staging) -> None:
+        """Switch-over (call with the agent lock held): retire the live collection,
+        rename the staging one to the agent's name, then drop the retired one
+        
+        Chroma cannot swap two names at once, so the switch-over is recorded in a plan file
+        first; a process dying between the renames leaves the plan for recover_switchovers().
+        """
+        name = f"agent_{agent_id}"
+        plan = {
+            "agent_id": agent_id,
+            "live": name,
+            "staging": staging.name,
+            "retired": f"{name}_retired_{staging.name.rsplit('_', 1)[-1]}",
+            "created_at": time.time(),
+        }
+        try:
+            source = self.chroma_client.get_collection(name)
+        except NotFoundError:
+            source = None  # no document stored yet
+        
+        plan_path = self._switchover_plan_path(agent_id)
+        write_plan(plan_path, plan)
+        self.switching[agent_id] = plan
+        promoted = False
+        try:
+            if source is not None:
+                source.modify(name=plan["retired"])
+            staging.modify(name=name)
+            promoted = True
+        finally:
+            # Drop the retired collection, or undo a half-done switch-over
+            try:
+                self._settle_switchover(plan, forward=promoted)
+                os.unlink(plan_path)
+            except Exception as e:
+                logger.error(f"❌ Could not settle index switch-over of agent {agent_id}, left for recovery: {e}")
+            self.switching.pop(agent_id, None)
+    
+    def _settle_switchover(self, plan: Dict, forward: bool) -> None:
+        """Leave exactly one of a switch-over's collections under the live name: staging if
+        forward (the switch-over completes), else the retired one (it is undone)"""
+        names = set(self.list_collection_names())
+        live, staging, retired = plan["live"], plan["staging"], plan["retired"]
+        if live not in names:
+            candidates = (staging, retired) if forward else (retired, staging)
+            restore = next((candidate for candidate in candidates if candidate in names), None)
+            if restore is not None:
+                self.chroma_client.get_collection(restore).modify(name=live)
+                names.discard(restore)
+        # The live name is taken, whatever is left of the other two goes
+        self.delete_collections([candidate for candidate in (staging, retired) if candidate in names])
+    
+    def recover_switchovers(self) -> int:
+        """Finish index switch-overs interrupted by a crash, returns how many plans were resolved
+        (promote_collection is only called with a complete staging collection)"""
+        if not os.path.isdir(SWITCHOVER_PLAN_DIR):
+            return 0
+        
+        resolved = 0
+        for name in sorted(os.listdir(SWITCHOVER_PLAN_DIR)):
+            path = os.path.join(SWITCHOVER_PLAN_DIR, name)
+            if name.endswith(".json.tmp"):
+                os.unlink(path)  # never became a plan
+                continue
+            if not name.endswith(".json"):
+                continue
+            
+            with open(path, "r", encoding="utf-8") as f:
+                plan = json.load(f)
+            self._settle_switchover(plan, forward=True)
+            logger.info(f"🩹 Finished interrupted index switch-over of agent {plan['agent_id']}")
+            os.unlink(path)
+            resolved += 1
+        return resolved
+    
+    def copy_document_chunks(self, agent_id: str, target, doc_ids: List[str]) -> int:
+        """Copy the stored chunks of some documents from the agent's live collection into target"""
+        try:
+            source = self.chroma_client.get_collection(f"agent_{agent_id}")
+        except NotFoundError:
+            return 0
+        
+        copied = 0
+        for start in range(0, len(doc_ids), INDEX_REBUILD_BATCH):
+            page = source.get(
+                where={"document_id": {"$in": doc_ids[start:start + INDEX_REBUILD_BATCH]}},
+                include=['embeddings', 'documents', 'metadatas']
+            )
+            if page['ids']:
+                target.add(
+                    ids=page['ids'],
+                    embeddings=page['embeddings'],
+                    documents=page['documents'],
+                    metadatas=page['metadatas']
+                )
+                copied += len(page['ids'])
+        return copied
+    
+    def stored_document_ids(self, agent_id: str, exclude: List[str] = ()) -> set:
+        """IDs of the documents with chunks in the agent's live collection, other than exclude"""
+        try:
+            collection = self.chroma_client.get_collection(f"agent_{agent_id}")
+        except NotFoundError:
+            return set()
+        where = {"document_id": {"$nin": list(exclude)}} if exclude else None
+        metadatas = collection.get(where=where, include=['metadatas'])['metadatas']
+        return {metadata["document_id"] for metadata in metadatas if metadata and "document_id" in metadata}
+    
+    def index_status(self, agent_id: str, index_profile: Optional[str] = None) -> Dict:
+        """Current index settings of an agent's base collection versus its configured profile"""
+        try:
+            collection = self.chroma_client.get_collection(f"agent_{agent_id}")
+        except Exception:
+            collection = None
+        
+        chunk_count = collection.count() if collection is not None else 0
+        target = resolve_profile(index_profile, chunk_count)
+        return {
+            "profile": index_profile,
+            "target_profile": target,
+            "chunk_count": chunk_count,
+            "hnsw": collection_hnsw(collection) if collection is not None else None,
+            "needs_rebuild": collection is not None and not matches_profile(collection, target),
+            "rebuilding": agent_id in self.rebuilding,
+            "reindexing": agent_id in self.reindexing,
+        }
+    
+    async def rebuild_agent_index(self, agent_id: str, index_profile: Optional[str] = None) -> Dict:
+        """Rebuild an agent's base collection with its index profile and switch over to it
+        
+        The copy is built without the agent lock, so retrieval, uploads and deletes carry on
+        against the current collection; the lock is only held at switch-over, to bring the
+        copy up to date with the writes made meanwhile and promote it.
+        """
+        self.rebuilding.add(agent_id)
+        started = time.perf_counter()
+        try:
+            with span("rag.index_rebuild", agent_id=agent_id):
+                staging, profile = await asyncio.to_thread(self._build_staging, agent_id, index_profile)
+                promoted = False
+                try:
+                    async with self.agent_lock(agent_id):
+                        carried = await asyncio.to_thread(self._sync_staging, agent_id, staging)
+                        await asyncio.to_thread(self.promote_collection, agent_id, staging)
+                        promoted = True
+                finally:
+                    if not promoted:
+                        await asyncio.to_thread(self.delete_collections, [staging.name])
+                chunks = await asyncio.to_thread(staging.count)
+        finally:
+            self.rebuilding.discard(agent_id)
+        
+        duration = time.perf_counter() - started
+        logger.info(
+            f"🔁 Rebuilt index for agent {agent_id}: {chunks} chunks ({carried} from writes during the rebuild), "
+            f"profile '{profile}', {duration:.1f}s"
+        )
+        
+        return {
+            "status": "success",
+            "profile": profile,
+            "chunks": chunks,
+            "hnsw": collection_hnsw(staging),
+            "duration_ms": round(duration * 1000, 1),
+        }
+    
+    def _build_staging(self, agent_id: str, index_profile: Optional[str]) -> Tuple:
+        """Copy the agent's live collection into a new staging collection, returns (staging, profile)"""
+        source = self.chroma_client.get_collection(f"agent_{agent_id}")
+        total = source.count()
+        profile = resolve_profile(index_profile, total)
+        
+        target = self.create_staging_collection(agent_id, profile)
+        try:
+            copied = 0
+            while copied < total:
+                page = source.get(
+                    limit=INDEX_REBUILD_BATCH,
+                    offset=copied,
+                    include=['embeddings', 'documents', 'metadatas']
+                )
+                if not page['ids']:
+                    break
+                # Writes shift the pages under us: a chunk may come twice (upsert) or be missed (_sync_staging)
+                target.upsert(
+                    ids=page['ids'],
+                    embeddings=page['embeddings'],
+                    documents=page['documents'],
+                    metadatas=page['metadatas']
+                )
+                copied += len(page['ids'])
+        except Exception:
+            self.delete_collections([target.name])
+            raise
+        return target, profile
+    
+    def _sync_staging(self, agent_id: str, staging) -> int:
+        """Make staging match the live collection again after writes made during a rebuild
+        (call with the agent lock held), returns how many chunks were added, changed or removed"""
+        try:
+            live = self.chroma_client.get_collection(f"agent_{agent_id}")
+            current = live.get(include=['metadatas'])
+        except NotFoundError:
+            live, current = None, {"ids": [], "metadatas": []}
+        built = staging.get(include=['metadatas'])
+        built_metadatas = dict(zip(built['ids'], built['metadatas']))
+        
+        current_ids = set(current['ids'])
+        removed = [chunk_id for chunk_id in built['ids'] if chunk_id not in current_ids]
+        changed = [
+            chunk_id for chunk_id, metadata in zip(current['ids'], current['metadatas'])
+            if chunk_id not in built_metadatas or built_metadatas[chunk_id] != metadata
+        ]
+        
+        for start in range(0, len(removed), INDEX_REBUILD_BATCH):
+            staging.delete(ids=removed[start:start + INDEX_REBUILD_BATCH])
+        for start in range(0, len(changed), INDEX_REBUILD_BATCH):
+            page = live.get(ids=changed[start:start + INDEX_REBUILD_BATCH], include=['embeddings', 'documents', 'metadatas'])
+            staging.upsert(
+                ids=page['ids'],
+                embeddings=page['embeddings'],
+                documents=page['documents'],
+                metadatas=page['metadatas']
+            )
+        return len(removed) + len(changed)
 
 # Singleton instance
 rag_pipeline = RAGPipeline()
@@ -0,0 +1,270 @@
+"""
+Full re-index from the original files
+Rebuilds agents' knowledge bases from the originals kept in the blob store, so a new
+embedding model, chunking or extraction logic applies to existing documents without
+uploading them again. Every document is extracted, chunked and embedded into a staging
+collection while retrieval keeps serving the live one. Right before the switch-over,
+under the agent lock (the only time uploads for the agent wait), documents uploaded,
+replaced or deleted meanwhile are reconciled by copying their chunks from the live
+collection. Documents without a stored original keep their current chunks. Agents are
+re-indexed REINDEX_CONCURRENCY at a time.
+
+Usage:
+    python reindex.py --agent <agent_id> [--agent <agent_id> ...]
+    python reindex.py --all [--concurrency 4]
+
+The command asks the running backend (BACKEND_URL) to do the work, so the switch-over
+happens in the process serving retrieval; --local runs it in this process instead,
+only while the backend is stopped.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import urllib.request
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+import dedup
+from blob_store import blob_store
+from database import AsyncSessionLocal
+from document_updates import replacement_in_progress
+from index_profiles import resolve_profile
+from models import Agent, Document
+from rag_pipeline import rag_pipeline
+
+logger = logging.getLogger(__name__)
+
+REINDEX_CONCURRENCY = int(os.getenv("REINDEX_CONCURRENCY", "4"))  # agents re-indexed at once
+
+
+class ReindexInProgress(Exception):
+    """The agent is already being re-indexed"""
+
+
+class Reindexer:
+    """Re-extracts and re-embeds agents' documents into new collections and swaps them in"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self.progress: Dict[str, Dict] = {}  # agent_id -> state of its latest re-index
+
+    async def reindex_agents(self, agent_ids: List[str], concurrency: int = REINDEX_CONCURRENCY) -> Dict[str, Dict]:
+        """Re-index several agents, at most concurrency at a time, returns each agent's outcome"""
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        for agent_id in agent_ids:
+            if agent_id not in rag_pipeline.reindexing:
+                self.progress[agent_id] = {"status": "queued"}
+
+        async def run(agent_id: str) -> Dict:
+            async with semaphore:
+                try:
+                    return await self.reindex_agent(agent_id)
+                except Exception as e:
+                    return {"status": "error", "detail": str(e)}
+
+        results = await asyncio.gather(*(run(agent_id) for agent_id in agent_ids))
+        return dict(zip(agent_ids, results))
+
+    async def reindex_agent(self, agent_id: str) -> Dict:
+        """Re-index one agent's knowledge base, returns its final progress record"""
+        if agent_id in rag_pipeline.reindexing:
+            raise ReindexInProgress(f"Agent {agent_id} is already being re-indexed")
+        rag_pipeline.reindexing.add(agent_id)  # also keeps the reaper off the staging collection
+
+        progress = {"status": "running", "documents": 0, "documents_done": 0, "started_at": datetime.utcnow().isoformat()}
+        self.progress[agent_id] = progress
+        started = time.perf_counter()
+        try:
+            progress.update(await self._reindex(agent_id, progress))
+        except Exception as e:
+            progress.update(status="error", detail=str(e), finished_at=datetime.utcnow().isoformat())
+            logger.error(f"❌ Re-index of agent {agent_id} failed: {e}")
+            raise
+        finally:
+            rag_pipeline.reindexing.discard(agent_id)
+
+        progress.update(
+            status="success",
+            duration_ms=round((time.perf_counter() - started) * 1000, 1),
+            finished_at=datetime.utcnow().isoformat()
+        )
+        logger.info(
+            f"🔁 Re-indexed agent {agent_id}: {progress['documents_reindexed']} documents re-embedded, "
+            f"{progress['documents_carried_over']} carried over, {progress['chunks']} chunks"
+        )
+        return progress
+
+    async def _reindex(self, agent_id: str, progress: Dict) -> Dict:
+        async with self.session_factory() as db:
+            agent = await db.get(Agent, agent_id)
+            if agent is None:
+                raise ValueError("Agent not found")
+            index_profile = agent.index_profile
+            chunking = (agent.chunk_size, agent.chunk_overlap)
+            result = await db.execute(select(Document).where(Document.agent_id == agent_id))
+            documents = result.scalars().all()
+
+        snapshot = {document.id: document.content_hash for document in documents}
+        progress["documents"] = len(documents)
+        profile = resolve_profile(index_profile, sum(document.chunk_count or 0 for document in documents))
+        staging = await asyncio.to_thread(rag_pipeline.create_staging_collection, agent_id, profile)
+
+        promoted = False
+        try:
+            chunk_counts, suppressed_by, carried = await self._embed_documents(agent_id, documents, chunking, staging, progress)
+
+            async with rag_pipeline.agent_lock(agent_id):
+                reconciled = await self._reconcile(agent_id, staging, snapshot)
+                await asyncio.to_thread(rag_pipeline.promote_collection, agent_id, staging)
+                promoted = True
+
+                # Chunk counts of the re-embedded versions (documents replaced meanwhile keep theirs)
+                async with self.session_factory() as db:
+                    for doc_id, count in chunk_counts.items():
+                        if doc_id not in reconciled:
+                            await db.execute(
+                                update(Document)
+                                .where(Document.id == doc_id, Document.content_hash == snapshot[doc_id])
+                                .values(chunk_count=count, suppressed_by=suppressed_by[doc_id] or None)
+                            )
+                    await db.commit()
+        except Exception:
+            if not promoted:
+                await asyncio.to_thread(rag_pipeline.delete_collections, [staging.name])
+            raise
+
+        return {
+            "profile": profile,
+            "documents_reindexed": len(chunk_counts),
+            "documents_carried_over": len(carried),
+            "documents_reconciled": len(reconciled),
+            "chunks": await asyncio.to_thread(staging.count),
+        }
+
+    async def _embed_documents(self, agent_id: str, documents: List[Document], chunking: Tuple, staging, progress: Dict):
+        """Re-embed documents from their originals into staging, returns (chunk counts, suppressed_by, carried-over ids)"""
+        index = dedup.NearDuplicateIndex()  # near-duplicates across the agent's documents
+        chunk_counts: Dict[str, int] = {}
+        suppressed_by: Dict[str, List[str]] = {}
+        carried: List[str] = []
+        for document in documents:
+            if not blob_store.exists(document.blob_key):
+                carried.append(document.id)
+                progress["documents_done"] += 1
+                continue
+            try:
+                path = blob_store.path(document.blob_key)
+                chunks, _ = await asyncio.to_thread(rag_pipeline.extract_chunks, path, document.filename, *chunking)
+                sources, signatures = set(), {}
+                chunks, _ = await asyncio.to_thread(
+                    rag_pipeline.suppress_duplicates, agent_id, chunks, None, index, False, document.id, sources, signatures
+                )
+                if chunks:
+                    chunk_ids, metadatas = rag_pipeline.chunk_records(document.id, document.filename, chunks, None, signatures)
+                    embeddings = await asyncio.to_thread(rag_pipeline.embed_chunks, chunks)
+                    await asyncio.to_thread(
+                        staging.add, ids=chunk_ids, embeddings=embeddings, documents=chunks, metadatas=metadatas
+                    )
+                chunk_counts[document.id] = len(chunks)
+                suppressed_by[document.id] = sorted(sources)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not re-index document {document.id}, keeping its current chunks: {e}")
+                carried.append(document.id)
+            progress["documents_done"] += 1
+
+        if carried:
+            await asyncio.to_thread(rag_pipeline.copy_document_chunks, agent_id, staging, carried)
+        return chunk_counts, suppressed_by, carried
+
+    async def _reconcile(self, agent_id: str, staging, snapshot: Dict[str, Optional[str]]) -> set:
+        """Bring staging up to date with writes made during the build (call with the agent lock held)
+
+        Documents deleted, replaced (or mid-replacement) or added since the snapshot take
+        their chunks from the live collection, which is current for them.
+        """
+        async with self.session_factory() as db:
+            result = await db.execute(select(Document.id, Document.content_hash).where(Document.agent_id == agent_id))
+            current = dict(result.all())
+
+        touched = {doc_id for doc_id, content_hash in snapshot.items() if current.get(doc_id, "") != content_hash}
+        touched.update(doc_id for doc_id in snapshot if replacement_in_progress(doc_id))
+        # Uploads whose chunks are stored but whose row may not be committed yet
+        touched.update(await asyncio.to_thread(rag_pipeline.stored_document_ids, agent_id, list(snapshot)))
+
+        if touched:
+            doc_ids = sorted(touched)
+            await asyncio.to_thread(staging.delete, where={"document_id": {"$in": doc_ids}})
+            await asyncio.to_thread(rag_pipeline.copy_document_chunks, agent_id, staging, doc_ids)
+        return touched
+
+
+# Singleton instance
+reindexer = Reindexer()
+
+
+def _request(method: str, url: str, body: Optional[Dict] = None) -> Dict:
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def _run_remote(api_url: str, agent_ids: Optional[List[str]], concurrency: int, poll: float) -> bool:
+    """Start the re-index on the running backend and follow it until every agent finished"""
+    started = _request("POST", f"{api_url}/api/agents/reindex", {"agent_ids": agent_ids, "concurrency": concurrency})
+    pending = list(started["agent_ids"])
+    print(f"🔁 Re-indexing {len(pending)} agents on {api_url}")
+
+    failed = False
+    while pending:
+        time.sleep(poll)
+        for agent_id in list(pending):
+            state = _request("GET", f"{api_url}/api/agents/{agent_id}/index").get("reindex") or {}
+            if state.get("status") in ("success", "error"):
+                pending.remove(agent_id)
+                failed = failed or state["status"] == "error"
+                detail = state.get("detail") or f"{state.get('documents_reindexed')} documents, {state.get('chunks')} chunks"
+                print(f"{'✅' if state['status'] == 'success' else '❌'} {agent_id}: {detail}")
+            elif state.get("status") == "running":
+                print(f"   {agent_id}: {state.get('documents_done')}/{state.get('documents')} documents")
+    return not failed
+
+
+async def _run_local(agent_ids: Optional[List[str]], concurrency: int) -> bool:
+    if not agent_ids:
+        async with AsyncSessionLocal() as db:
+            agent_ids = list((await db.execute(select(Agent.id))).scalars())
+    print(f"🔁 Re-indexing {len(agent_ids)} agents locally")
+    results = await reindexer.reindex_agents(agent_ids, concurrency)
+    for agent_id, state in results.items():
+        print(f"{'✅' if state['status'] == 'success' else '❌'} {agent_id}: {state.get('detail') or state.get('chunks')}")
+    return all(state["status"] == "success" for state in results.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-extract and re-embed agents' documents from their stored originals")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--agent", action="append", help="agent id to re-index (repeatable)")
+    target.add_argument("--all", action="store_true", help="re-index every agent")
+    parser.add_argument("--concurrency", type=int, default=REINDEX_CONCURRENCY, help="agents re-indexed at once")
+    parser.add_argument("--api-url", default=os.getenv("BACKEND_URL", "http://localhost:8000"))
+    parser.add_argument("--poll", type=float, default=2.0, help="seconds between progress checks")
+    parser.add_argument("--local", action="store_true", help="run in this process (only while the backend is stopped)")
+    args = parser.parse_args()
+
+    if args.local:
+        ok = asyncio.run(_run_local(args.agent, args.concurrency))
+    else:
+        ok = _run_remote(args.api_url.rstrip("/"), args.agent, args.concurrency, args.poll)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
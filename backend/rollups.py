@@ -0,0 +1,114 @@
+"""
+Incrementally maintained activity rollups
+Hourly and daily session/query counts per agent, updated in the same transaction
+as the rows they count, so time-series analytics never scan raw history
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import ActivityRollup, Query, Session as SessionModel
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ("hour", "day")
+
+# (bucket, bucket_start, agent_id) -> [session_count, query_count]
+RollupDeltas = Dict[Tuple[str, datetime, str], list]
+
+
+def bucket_start(timestamp: datetime, bucket: str) -> datetime:
+    """Truncate a UTC timestamp to the start of its hour or day"""
+    if bucket == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown bucket: {bucket}")
+
+
+def collect_deltas(events: Iterable[Tuple[str, datetime, int, int]]) -> RollupDeltas:
+    """Merge (agent_id, timestamp, sessions, queries) events into per-bucket increments"""
+    deltas: RollupDeltas = defaultdict(lambda: [0, 0])
+    for agent_id, timestamp, sessions, queries in events:
+        for bucket in BUCKETS:
+            delta = deltas[(bucket, bucket_start(timestamp, bucket), agent_id)]
+            delta[0] += sessions
+            delta[1] += queries
+    return deltas
+
+
+async def apply_deltas(db: AsyncSession, deltas: RollupDeltas) -> None:
+    """Upsert rollup increments (caller commits)"""
+    if not deltas:
+        return
+    
+    insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    for (bucket, start, agent_id), (sessions, queries) in deltas.items():
+        stmt = insert(ActivityRollup).values(
+            bucket=bucket,
+            bucket_start=start,
+            agent_id=agent_id,
+            session_count=sessions,
+            query_count=queries,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["bucket", "bucket_start", "agent_id"],
+            set_={
+                "session_count": ActivityRollup.session_count + stmt.excluded.session_count,
+                "query_count": ActivityRollup.query_count + stmt.excluded.query_count,
+            },
+        )
+        await db.execute(stmt)
+
+
+async def record_activity(db: AsyncSession, agent_id: str, timestamp: datetime, sessions: int = 0, queries: int = 0) -> None:
+    """Count a single event in its hour and day buckets (caller commits)"""
+    await apply_deltas(db, collect_deltas([(agent_id, timestamp, sessions, queries)]))
+
+
+async def backfill_rollups(db: AsyncSession) -> int:
+    """
+    Build rollups from existing sessions and queries when the table is empty
+    (first start after upgrading). Returns the number of events counted.
+    """
+    if await db.scalar(select(func.count()).select_from(ActivityRollup)):
+        return 0
+    
+    # Group per hour in SQL, days are derived from the hourly groups in Python
+    if db.bind.dialect.name == "postgresql":
+        def hour_of(column):
+            return func.date_trunc("hour", column)
+    else:
+        def hour_of(column):
+            return func.strftime("%Y-%m-%d %H:00:00", column)
+    
+    events = []
+    for model, time_column, is_session in (
+        (SessionModel, SessionModel.started_at, True),
+        (Query, Query.timestamp, False),
+    ):
+        hour = hour_of(time_column).label("hour")
+        result = await db.execute(
+            select(model.agent_id, hour, func.count())
+            .where(time_column.is_not(None))
+            .group_by(model.agent_id, hour)
+        )
+        for agent_id, hour_value, count in result:
+            if isinstance(hour_value, str):
+                hour_value = datetime.strptime(hour_value, "%Y-%m-%d %H:%M:%S")
+            events.append((agent_id, hour_value, count if is_session else 0, 0 if is_session else count))
+    
+    await apply_deltas(db, collect_deltas(events))
+    await db.commit()
+    
+    total = sum(sessions + queries for _, _, sessions, queries in events)
+    if total:
+        logger.info(f"📈 Backfilled activity rollups from {total} sessions/queries")
+    return total
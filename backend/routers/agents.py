@@ -1,17 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional, Union
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import datetime, timezone
+import asyncio
+import hashlib
+import logging
 import uuid
-from datetime import datetime
 
-from database import get_db
+from database import get_async_db
 from models import Agent, Document
-from schemas import AgentCreate, AgentUpdate, AgentResponse, DocumentResponse
+from schemas import AgentCreate, AgentUpdate, AgentResponse, AgentSummary, DocumentResponse, IndexRebuildRequest, ReindexRequest
 from templates import get_template, list_templates
-from rag_pipeline import rag_pipeline
+from rag_pipeline import rag_pipeline, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+from index_profiles import INDEX_PROFILES, is_valid_profile
+import document_updates
+import bulk_ingest
+from blob_store import blob_store
+from reindex import reindexer, REINDEX_CONCURRENCY
+from pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER
+from metrics import cache_result
 import os
 
 router = APIRouter(prefix="/api/agents", tags=["agents"])
+logger = logging.getLogger(__name__)
+
+MAX_LIST_LIMIT = 200
+ALLOWED_EXTENSIONS = ['.pdf', '.docx', '.txt']
+
+def _check_file_type(filename: str):
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Unsupported file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+
+def _effective_chunking(chunk_size: Optional[int], chunk_overlap: Optional[int]):
+    """Chunk settings the pipeline applies, None standing for its default"""
+    return (
+        chunk_size if chunk_size is not None else DEFAULT_CHUNK_SIZE,
+        chunk_overlap if chunk_overlap is not None else DEFAULT_CHUNK_OVERLAP,
+    )
+
+def _check_chunking(chunk_size: Optional[int], chunk_overlap: Optional[int]):
+    size, overlap = _effective_chunking(chunk_size, chunk_overlap)
+    if overlap >= size:
+        raise HTTPException(status_code=400, detail="chunk_overlap must be smaller than chunk_size")
+
+def _check_index_profile(name: Optional[str]):
+    if name is not None and not is_valid_profile(name):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown index profile. Allowed: auto, {', '.join(INDEX_PROFILES)}"
+        )
+
+async def _rebuild_index(agent_id: str, index_profile: Optional[str]):
+    """Background index rebuild, a failure leaves the current collection in place"""
+    try:
+        await rag_pipeline.rebuild_agent_index(agent_id, index_profile)
+    except Exception as e:
+        logger.error(f"❌ Index rebuild failed for agent {agent_id}: {e}")
+
+async def _reindex(agent_id: str):
+    """Background re-index, a failure leaves the current collection in place"""
+    try:
+        await reindexer.reindex_agent(agent_id)
+    except Exception as e:
+        logger.error(f"❌ Re-index failed for agent {agent_id}: {e}")
+
+async def _schedule_rebuild_if_needed(background_tasks: BackgroundTasks, agent: Agent):
+    """Rebuild in the background when the collection no longer matches the agent's profile"""
+    if agent.id in rag_pipeline.rebuilding or agent.id in rag_pipeline.reindexing:
+        return
+    status = await asyncio.to_thread(rag_pipeline.index_status, agent.id, agent.index_profile)
+    if status["needs_rebuild"]:
+        background_tasks.add_task(_rebuild_index, agent.id, agent.index_profile)
 
 @router.get("/templates")
 async def get_templates():
@@ -30,11 +98,13 @@ async def get_templates():
     }
 
 @router.post("/create", response_model=AgentResponse)
-async def create_agent(agent_data: AgentCreate, db: Session = Depends(get_db)):
+async def create_agent(agent_data: AgentCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new agent from template"""
     template = get_template(agent_data.template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
+    _check_index_profile(agent_data.index_profile)
+    _check_chunking(agent_data.chunk_size, agent_data.chunk_overlap)
     
     # Use template defaults if not provided
     agent = Agent(
@@ -46,36 +116,133 @@ async def create_agent(agent_data: AgentCreate, db: Session = Depends(get_db)):
         color=template["color"],
         avatar_id=agent_data.avatar_id,  # Store selected avatar ID
         mcp_config=agent_data.mcp_config,  # Store MCP server configuration
+        rag_mode=agent_data.rag_mode,
+        index_profile=agent_data.index_profile,
+        chunk_size=agent_data.chunk_size,
+        chunk_overlap=agent_data.chunk_overlap,
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
     
     db.add(agent)
-    db.commit()
-    db.refresh(agent)
+    await db.commit()
+    await db.refresh(agent)
     
     return agent
 
-@router.get("/list", response_model=List[AgentResponse])
-async def list_agents(db: Session = Depends(get_db)):
-    """List all agents"""
-    agents = db.query(Agent).order_by(Agent.created_at.desc()).all()
-    return agents
+async def _list_validators(db: AsyncSession, variant: str):
+    """
+    ETag and Last-Modified for the agent list from one aggregate query.
+    updated_at covers edits and creations, the row count covers deletions, and
+    query_count / last_used cover the counters the query log bumps in place.
+    """
+    count, max_updated, max_used, total_queries = (await db.execute(select(
+        func.count(),
+        func.max(Agent.updated_at),
+        func.max(Agent.last_used),
+        func.coalesce(func.sum(Agent.query_count), 0),
+    ).select_from(Agent))).one()
+    
+    digest = hashlib.sha1(f"{variant}|{count}|{max_updated}|{max_used}|{total_queries}".encode("utf-8")).hexdigest()
+    last_modified = max((ts for ts in (max_updated, max_used) if ts is not None), default=None)
+    return f'W/"{digest[:32]}"', last_modified
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against the current validators"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).astimezone(timezone.utc).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+@router.get("/list", response_model=List[Union[AgentResponse, AgentSummary]])
+async def list_agents(
+    request: Request,
+    fields: Literal["full", "summary"] = "full",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    List agents, newest first.
+    
+    - fields=summary: omit system_prompt and mcp_config (dashboard cards)
+    - limit / cursor: page through agents; the next page's cursor is in X-Next-Cursor.
+      Without a limit every agent is returned.
+    - Supports If-None-Match / If-Modified-Since, answering 304 when nothing changed
+    """
+    if limit is not None:
+        limit = max(1, min(limit, MAX_LIST_LIMIT))
+    
+    etag, last_modified = await _list_validators(db, f"{fields}|{limit}|{cursor}")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    
+    not_modified = _not_modified(request, etag, last_modified)
+    cache_result("agent_list", not_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    
+    schema = AgentSummary if fields == "summary" else AgentResponse
+    columns = [getattr(Agent, name) for name in schema.model_fields]
+    stmt = select(*columns).order_by(Agent.created_at.desc(), Agent.id.desc())
+    if cursor:
+        stmt = stmt.where(tuple_(Agent.created_at, Agent.id) < tuple_(*decode_cursor(cursor)))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    
+    # Only the projected columns are read, the large text / JSON fields stay in the database
+    rows = (await db.execute(stmt)).mappings().all()
+    agents = [schema.model_validate(dict(row)) for row in rows]
+    
+    if limit is not None and len(rows) == limit:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    
+    return JSONResponse(content=jsonable_encoder(agents), headers=headers)
 
 @router.get("/{agent_id}", response_model=AgentResponse)
-async def get_agent(agent_id: str, db: Session = Depends(get_db)):
+async def get_agent(agent_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get agent details"""
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    agent = await db.get(Agent, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     return agent
 
 @router.put("/{agent_id}", response_model=AgentResponse)
-async def update_agent(agent_id: str, agent_data: AgentUpdate, db: Session = Depends(get_db)):
+async def update_agent(
+    agent_id: str,
+    agent_data: AgentUpdate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
     """Update agent configuration"""
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    agent = await db.get(Agent, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
+    _check_index_profile(agent_data.index_profile)
+    if agent_data.reset_chunking:
+        if agent_data.chunk_size is not None or agent_data.chunk_overlap is not None:
+            raise HTTPException(status_code=400, detail="reset_chunking cannot be combined with chunk_size or chunk_overlap")
+        chunking = (None, None)
+    else:
+        chunking = (
+            agent_data.chunk_size if agent_data.chunk_size is not None else agent.chunk_size,
+            agent_data.chunk_overlap if agent_data.chunk_overlap is not None else agent.chunk_overlap,
+        )
+    _check_chunking(*chunking)
+    rechunk = _effective_chunking(*chunking) != _effective_chunking(agent.chunk_size, agent.chunk_overlap)
+    if rechunk and agent_id in rag_pipeline.reindexing:
+        # The running re-index chunks with the settings it started from and would not pick these up
+        raise HTTPException(status_code=409, detail="Re-index in progress, change the chunk settings once it has finished")
     
     if agent_data.name is not None:
         agent.name = agent_data.name
@@ -83,113 +250,319 @@ async def update_agent(agent_id: str, agent_data: AgentUpdate, db: Session = Dep
         agent.description = agent_data.description
     if agent_data.system_prompt is not None:
         agent.system_prompt = agent_data.system_prompt
+    if agent_data.rag_mode is not None:
+        agent.rag_mode = agent_data.rag_mode
+    if agent_data.index_profile is not None:
+        agent.index_profile = agent_data.index_profile
+    agent.chunk_size, agent.chunk_overlap = chunking
     
     agent.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(agent)
+    await db.commit()
+    await db.refresh(agent)
+    
+    # New chunk settings apply to existing documents through a re-index (which also applies the profile)
+    if rechunk and agent.document_count:
+        background_tasks.add_task(_reindex, agent_id)
+    elif agent_data.index_profile is not None:
+        await _schedule_rebuild_if_needed(background_tasks, agent)
     
     return agent
 
 @router.delete("/{agent_id}")
-async def delete_agent(agent_id: str, db: Session = Depends(get_db)):
+async def delete_agent(agent_id: str, db: AsyncSession = Depends(get_async_db)):
     """Delete agent and cleanup vectors"""
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    agent = await db.get(Agent, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    # Cleanup ChromaDB collection
-    rag_pipeline.delete_agent_collection(agent_id)
+    # Cleanup ChromaDB collections (knowledge base and any leftover session copies)
+    await asyncio.to_thread(rag_pipeline.delete_agent_collections, agent_id)
     
-    db.delete(agent)
-    db.commit()
+    await db.delete(agent)
+    await db.commit()
     
     return {"status": "success", "message": "Agent deleted"}
 
+async def _find_duplicate(db: AsyncSession, agent_id: str, content_hash: str) -> Optional[Document]:
+    """Document of this agent with identical content (unique index on agent_id, content_hash)"""
+    result = await db.execute(
+        select(Document).where(Document.agent_id == agent_id, Document.content_hash == content_hash)
+    )
+    return result.scalar_one_or_none()
+
+def _duplicate_response(existing: Document) -> dict:
+    return {
+        "status": "duplicate",
+        "document": DocumentResponse.model_validate(existing),
+        "chunks_processed": 0,
+        "duplicate_of": existing.id
+    }
+
 @router.post("/{agent_id}/upload")
 async def upload_document(
     agent_id: str,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload and process a document for an agent"""
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    agent = await db.get(Agent, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
     # Validate file type
-    allowed_extensions = ['.pdf', '.docx', '.txt']
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in allowed_extensions:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}"
-        )
-    
-    # Create document record
-    doc_id = str(uuid.uuid4())
-    document = Document(
-        id=doc_id,
-        agent_id=agent_id,
-        filename=file.filename,
-        file_size=0,  # Will be updated after processing
-        chunk_count=0,
-        uploaded_at=datetime.utcnow()
-    )
+    _check_file_type(file.filename)
     
+    # Stream to disk, hashing as it arrives
+    spooled = await rag_pipeline.spool_upload(file)
     try:
-        # Process document through RAG pipeline
-        result = await rag_pipeline.process_document(agent_id, file, doc_id)
+        # Exact re-upload: one indexed lookup, no extraction or embedding
+        existing = await _find_duplicate(db, agent_id, spooled["sha256"])
+        if existing:
+            return _duplicate_response(existing)
         
-        # Update document record
-        document.file_size = result['file_size']
-        document.chunk_count = result['chunks_processed']
+        # Create document record
+        doc_id = str(uuid.uuid4())
+        document = Document(
+            id=doc_id,
+            agent_id=agent_id,
+            filename=file.filename,
+            file_size=0,  # Will be updated after processing
+            chunk_count=0,
+            content_hash=spooled["sha256"],
+            uploaded_at=datetime.utcnow()
+        )
         
-        # Update agent document count
-        agent.document_count += 1
+        try:
+            # Process document through RAG pipeline
+            result = await rag_pipeline.process_document(
+                agent_id, spooled["path"], file.filename, doc_id,
+                agent.index_profile, agent.chunk_size, agent.chunk_overlap
+            )
+            
+            # Update document record, keeping the original for re-indexing
+            document.file_size = result['file_size']
+            document.chunk_count = result['chunks_processed']
+            document.blob_key = await blob_store.put(spooled["path"], spooled["sha256"])
+            document.suppressed_by = result['suppressed_by'] or None
+            
+            # Update agent document count
+            agent.document_count += 1
+            agent.updated_at = datetime.utcnow()
+            
+            db.add(document)
+            await db.commit()
+            await db.refresh(document)
+            
+            # "auto" agents move to a bigger index tier as their knowledge base grows
+            await _schedule_rebuild_if_needed(background_tasks, agent)
+            
+            return {
+                "status": "success",
+                "document": DocumentResponse.model_validate(document),
+                "chunks_processed": result['chunks_processed'],
+                "chunks_suppressed": result['chunks_suppressed'],
+                "furniture_lines_removed": result['furniture_lines_removed']
+            }
         
-        db.add(document)
-        db.commit()
-        db.refresh(document)
+        except IntegrityError:
+            # A concurrent upload of the same file committed first, drop our copy of the vectors
+            await db.rollback()
+            async with rag_pipeline.agent_lock(agent_id):
+                await asyncio.to_thread(rag_pipeline.delete_document_chunks, agent_id, doc_id)
+            existing = await _find_duplicate(db, agent_id, spooled["sha256"])
+            if existing:
+                return _duplicate_response(existing)
+            raise HTTPException(status_code=500, detail="Error processing document: conflicting upload")
         
-        return {
-            "status": "success",
-            "document": DocumentResponse.model_validate(document),
-            "chunks_processed": result['chunks_processed']
-        }
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
+    
+    finally:
+        os.unlink(spooled["path"])
+
+@router.post("/{agent_id}/upload/bulk")
+async def upload_documents_bulk(
+    agent_id: str,
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Upload many documents (or zip archives of them) in one request, with a status per file"""
+    agent = await db.get(Agent, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    entries = []
+    try:
+        try:
+            await bulk_ingest.spool_files(files, ALLOWED_EXTENSIONS, entries)
+        except bulk_ingest.BulkLimitExceeded as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
+        result = await bulk_ingest.ingest_files(db, agent, entries)
+        
+        # "auto" agents move to a bigger index tier as their knowledge base grows
+        await _schedule_rebuild_if_needed(background_tasks, agent)
+        return result
+    
+    finally:
+        bulk_ingest.remove_spooled(entries)
 
 @router.get("/{agent_id}/documents", response_model=List[DocumentResponse])
-async def list_documents(agent_id: str, db: Session = Depends(get_db)):
+async def list_documents(agent_id: str, db: AsyncSession = Depends(get_async_db)):
     """List all documents for an agent"""
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    agent = await db.get(Agent, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    documents = db.query(Document).filter(Document.agent_id == agent_id).all()
-    return documents
+    result = await db.execute(select(Document).where(Document.agent_id == agent_id))
+    return result.scalars().all()
+
+@router.get("/{agent_id}/index")
+async def get_index_status(agent_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Vector index settings of the agent's knowledge base versus its index profile"""
+    agent = await db.get(Agent, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    status = await asyncio.to_thread(rag_pipeline.index_status, agent_id, agent.index_profile)
+    status["reindex"] = reindexer.progress.get(agent_id)
+    return status
+
+@router.post("/{agent_id}/index/rebuild", status_code=202)
+async def rebuild_index(
+    agent_id: str,
+    background_tasks: BackgroundTasks,
+    request: Optional[IndexRebuildRequest] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Rebuild the knowledge base index online (optionally with a new profile), then switch over"""
+    agent = await db.get(Agent, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if agent_id in rag_pipeline.rebuilding or agent_id in rag_pipeline.reindexing:
+        raise HTTPException(status_code=409, detail="Index rebuild already in progress")
+    
+    status = await asyncio.to_thread(rag_pipeline.index_status, agent_id, agent.index_profile)
+    if status["hnsw"] is None:
+        raise HTTPException(status_code=404, detail="Agent has no knowledge base yet")
+    
+    if request is not None and request.profile is not None:
+        _check_index_profile(request.profile)
+        agent.index_profile = request.profile
+        agent.updated_at = datetime.utcnow()
+        await db.commit()
+    
+    background_tasks.add_task(_rebuild_index, agent_id, agent.index_profile)
+    return {"status": "rebuilding", "profile": agent.index_profile, "chunk_count": status["chunk_count"]}
+
+@router.post("/reindex", status_code=202)
+async def reindex_agents(
+    request: ReindexRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Re-extract and re-embed the documents of some or all agents from their stored originals"""
+    if request.agent_ids is None:
+        agent_ids = list((await db.execute(select(Agent.id))).scalars())
+    else:
+        agent_ids = list(dict.fromkeys(request.agent_ids))
+        result = await db.execute(select(Agent.id).where(Agent.id.in_(agent_ids)))
+        missing = set(agent_ids) - set(result.scalars())
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Agents not found: {', '.join(sorted(missing))}")
+    
+    background_tasks.add_task(reindexer.reindex_agents, agent_ids, request.concurrency or REINDEX_CONCURRENCY)
+    return {"status": "reindexing", "agent_ids": agent_ids}
+
+@router.post("/{agent_id}/reindex", status_code=202)
+async def reindex_agent(
+    agent_id: str,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Re-extract and re-embed an agent's documents into a new collection, then switch over"""
+    agent = await db.get(Agent, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if agent_id in rag_pipeline.reindexing:
+        raise HTTPException(status_code=409, detail="Re-index already in progress")
+    
+    background_tasks.add_task(_reindex, agent_id)
+    return {"status": "reindexing", "agent_id": agent_id, "document_count": agent.document_count}
+
+@router.put("/documents/{doc_id}")
+async def replace_document(
+    doc_id: str,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Replace a document with a new version, re-embedding only the chunks that changed"""
+    document = await db.get(Document, doc_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    agent = await db.get(Agent, document.agent_id)
+    _check_file_type(file.filename)
+    
+    spooled = await rag_pipeline.spool_upload(file)
+    try:
+        if spooled["sha256"] == document.content_hash:
+            return {
+                "status": "unchanged",
+                "document": DocumentResponse.model_validate(document),
+                "chunks_processed": 0
+            }
+        
+        try:
+            result = await document_updates.replace_document(db, agent, document, spooled, file.filename)
+        except document_updates.ReplaceInProgress as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except document_updates.DuplicateContent as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error replacing document: {str(e)}")
+        
+        # Other documents may have dropped near duplicates of the chunks that went
+        if result["chunks_removed"]:
+            background_tasks.add_task(document_updates.restore_dependents, agent.id, doc_id)
+        
+        await db.refresh(document)
+        return {
+            "status": "success",
+            "document": DocumentResponse.model_validate(document),
+            **result
+        }
+    
+    finally:
+        os.unlink(spooled["path"])
 
 @router.delete("/documents/{doc_id}")
-async def delete_document(doc_id: str, db: Session = Depends(get_db)):
+async def delete_document(doc_id: str, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
     """Remove a document from an agent"""
-    document = db.query(Document).filter(Document.id == doc_id).first()
+    document = await db.get(Document, doc_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     agent_id = document.agent_id
     
-    # Remove vectors from ChromaDB
-    rag_pipeline.delete_document_chunks(agent_id, doc_id)
+    # Remove vectors from ChromaDB (waits for an index switch-over)
+    async with rag_pipeline.agent_lock(agent_id):
+        await asyncio.to_thread(rag_pipeline.delete_document_chunks, agent_id, doc_id)
     
-    db.delete(document)
+    await db.delete(document)
     
     # Update agent document count
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    agent = await db.get(Agent, agent_id)
     if agent:
         agent.document_count = max(0, agent.document_count - 1)
+        agent.updated_at = datetime.utcnow()
+    
+    await db.commit()
     
-    db.commit()
+    # Chunks other documents dropped as near duplicates of this one's are stored again
+    background_tasks.add_task(document_updates.restore_dependents, agent_id, doc_id)
     
     return {"status": "success", "message": "Document deleted"}
@@ -1,47 +1,152 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from datetime import datetime, timedelta, timezone
+from typing import List, Literal, Optional
 
-from database import get_db
-from models import Agent, Document, Session as SessionModel, Query
-from schemas import AnalyticsOverview, AgentAnalytics
+from database import get_async_db
+from models import Agent, Session as SessionModel, ActivityRollup
+from schemas import AnalyticsOverview, AgentAnalytics, TimeSeriesPoint, AgentActivity
+from rollups import bucket_start
 
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 
+# Default look-back per bucket size
+DEFAULT_WINDOWS = {"hour": timedelta(hours=24), "day": timedelta(days=30)}
+MAX_POINTS = 2000
+
+def _rollup_total(column, agent_id: Optional[str] = None):
+    """All-time sum of a rollup counter over the daily buckets, platform-wide or for one agent"""
+    stmt = select(func.coalesce(func.sum(column), 0)).where(ActivityRollup.bucket == "day")
+    if agent_id is not None:
+        stmt = stmt.where(ActivityRollup.agent_id == agent_id)
+    return stmt.scalar_subquery()
+
 @router.get("/overview", response_model=AnalyticsOverview)
-async def get_overview(db: Session = Depends(get_db)):
+async def get_overview(db: AsyncSession = Depends(get_async_db)):
     """Get overall platform statistics"""
-    total_agents = db.query(Agent).count()
-    total_queries = db.query(Query).count()
-    total_documents = db.query(Document).count()
-    total_sessions = db.query(SessionModel).count()
+    # Stored counters only: the agents table is small and carries its document count,
+    # session and query totals are the sum of the daily rollups (kept for deleted agents)
+    row = (await db.execute(select(
+        select(func.count()).select_from(Agent).scalar_subquery(),
+        select(func.coalesce(func.sum(Agent.document_count), 0)).scalar_subquery(),
+        _rollup_total(ActivityRollup.session_count),
+        _rollup_total(ActivityRollup.query_count),
+    ))).one()
     
     return AnalyticsOverview(
-        total_agents=total_agents,
-        total_queries=total_queries,
-        total_documents=total_documents,
-        total_sessions=total_sessions
+        total_agents=row[0],
+        total_queries=row[3],
+        total_documents=row[1],
+        total_sessions=row[2]
     )
 
 @router.get("/agents/{agent_id}", response_model=AgentAnalytics)
-async def get_agent_analytics(agent_id: str, db: Session = Depends(get_db)):
+async def get_agent_analytics(agent_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get agent-specific analytics"""
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    agent = await db.get(Agent, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
-    sessions = db.query(SessionModel).filter(SessionModel.agent_id == agent_id).all()
-    queries = db.query(Query).filter(Query.agent_id == agent_id).all()
-    
-    last_used = None
-    if sessions:
-        last_session = max(sessions, key=lambda s: s.started_at)
-        last_used = last_session.started_at
+    # Counts from the agent's daily rollups, the last session is one index seek
+    row = (await db.execute(select(
+        _rollup_total(ActivityRollup.session_count, agent_id),
+        select(func.max(SessionModel.started_at)).where(SessionModel.agent_id == agent_id).scalar_subquery(),
+        _rollup_total(ActivityRollup.query_count, agent_id),
+    ))).one()
     
     return AgentAnalytics(
         agent_name=agent.name,
-        total_sessions=len(sessions),
-        total_queries=len(queries),
+        total_sessions=row[0],
+        total_queries=row[2],
         documents_indexed=agent.document_count,
-        last_used=last_used
+        last_used=row[1]
+    )
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Rollup buckets are naive UTC; convert timezone-aware query parameters to match"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _window(bucket: str, start: Optional[datetime], end: Optional[datetime]):
+    """Resolve the [start, end] range of bucket starts to return"""
+    start, end = _naive_utc(start), _naive_utc(end)
+    end = end or datetime.utcnow()
+    start = start or end - DEFAULT_WINDOWS[bucket]
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    step = timedelta(hours=1) if bucket == "hour" else timedelta(days=1)
+    if (end - start) / step > MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"Range too large, at most {MAX_POINTS} {bucket} buckets")
+    return bucket_start(start, bucket), end
+
+@router.get("/timeseries", response_model=List[TimeSeriesPoint])
+async def get_timeseries(
+    bucket: Literal["hour", "day"] = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    agent_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Sessions and queries per hour or day (platform-wide, or for one agent)"""
+    start, end = _window(bucket, start, end)
+    
+    stmt = (
+        select(
+            ActivityRollup.bucket_start,
+            func.sum(ActivityRollup.session_count),
+            func.sum(ActivityRollup.query_count),
+        )
+        .where(
+            ActivityRollup.bucket == bucket,
+            ActivityRollup.bucket_start >= start,
+            ActivityRollup.bucket_start <= end,
+        )
+        .group_by(ActivityRollup.bucket_start)
+        .order_by(ActivityRollup.bucket_start)
+    )
+    if agent_id:
+        stmt = stmt.where(ActivityRollup.agent_id == agent_id)
+    
+    result = await db.execute(stmt)
+    return [
+        TimeSeriesPoint(bucket_start=row[0], sessions=row[1] or 0, queries=row[2] or 0)
+        for row in result
+    ]
+
+@router.get("/agents-activity", response_model=List[AgentActivity])
+async def get_agents_activity(
+    bucket: Literal["hour", "day"] = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Most active agents within a time window"""
+    start, end = _window(bucket, start, end)
+    limit = max(1, min(limit, 200))
+    
+    queries_total = func.sum(ActivityRollup.query_count).label("queries")
+    result = await db.execute(
+        select(
+            ActivityRollup.agent_id,
+            Agent.name,
+            func.sum(ActivityRollup.session_count),
+            queries_total,
+        )
+        .outerjoin(Agent, Agent.id == ActivityRollup.agent_id)
+        .where(
+            ActivityRollup.bucket == bucket,
+            ActivityRollup.bucket_start >= start,
+            ActivityRollup.bucket_start <= end,
+        )
+        .group_by(ActivityRollup.agent_id, Agent.name)
+        .order_by(queries_total.desc())
+        .limit(limit)
     )
+    return [
+        AgentActivity(agent_id=row[0], agent_name=row[1] or "Deleted agent", sessions=row[2] or 0, queries=row[3] or 0)
+        for row in result
+    ]
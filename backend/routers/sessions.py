@@ -1,45 +1,109 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+from typing import Optional
+import asyncio
+import json
+import logging
 import uuid
-import os
 from livekit import api
 
-from database import get_db
+from database import get_async_db
 from models import Session as SessionModel, Agent, Query
-from schemas import SessionStartRequest, SessionStartResponse, SessionEndResponse, QueryRequest, QueryResponse
+from schemas import SessionStartRequest, SessionStartResponse, SessionEndResponse, QueryRequest, QueryResponse, QueryLogRequest
 from rag_pipeline import rag_pipeline
+from query_log import query_log
+from rollups import record_activity
+from pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER, LATEST_CURSOR_HEADER
+from livekit_client import livekit_client
+from collection_reaper import collection_reaper
+from tracing import span
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
-
-# LiveKit API client
-livekit_url = os.getenv("LIVEKIT_URL", "ws://localhost:7880")
-livekit_api_key = os.getenv("LIVEKIT_API_KEY")
-livekit_api_secret = os.getenv("LIVEKIT_API_SECRET")
+logger = logging.getLogger(__name__)
 
 @router.get("/recent", response_model=list)
-async def get_recent_activities(limit: int = 20, db: Session = Depends(get_db)):
-    """Get recent query activities for dashboard activity feed"""
-    queries = db.query(Query).order_by(Query.timestamp.desc()).limit(limit).all()
-    
-    activities = []
-    for query in queries:
-        agent = db.query(Agent).filter(Agent.id == query.agent_id).first()
-        activities.append({
-            "id": query.id,
-            "agent_id": query.agent_id,
-            "agent_name": agent.name if agent else "Unknown",
-            "query": query.question,
+async def get_recent_activities(
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get recent query activities for dashboard activity feed (newest first).
+    
+    - cursor: page through older activity (value of the X-Next-Cursor header)
+    - since: only activity newer than this cursor (value of X-Latest-Cursor), for polling
+    
+    Rows are committed in batches, up to the query log's settle window after their
+    timestamp and by several processes. So that a poll never moves past rows still to be
+    flushed, polls return only rows older than that window and X-Latest-Cursor never points
+    into it; the first poll may repeat rows the plain listing already showed (same id).
+    """
+    limit = max(1, min(limit, 100))
+    sort_key = tuple_(Query.timestamp, Query.id)
+    settled = datetime.utcnow() - query_log.settle_window
+    
+    # Single joined query over the (timestamp, id) index instead of one agent lookup per row
+    stmt = (
+        select(Query.id, Query.agent_id, Query.question, Query.timestamp, Agent.name)
+        .outerjoin(Agent, Agent.id == Query.agent_id)
+        .limit(limit)
+    )
+    
+    if since:
+        # Oldest new rows first so nothing is skipped when more than `limit` arrived
+        stmt = (
+            stmt.where(sort_key > tuple_(*decode_cursor(since)), Query.timestamp <= settled)
+            .order_by(Query.timestamp.asc(), Query.id.asc())
+        )
+        rows = list(reversed((await db.execute(stmt)).all()))
+    else:
+        if cursor:
+            stmt = stmt.where(sort_key < tuple_(*decode_cursor(cursor)))
+        stmt = stmt.order_by(Query.timestamp.desc(), Query.id.desc())
+        rows = (await db.execute(stmt)).all()
+    
+    activities = [
+        {
+            "id": query_id,
+            "agent_id": agent_id,
+            "agent_name": agent_name or "Unknown",
+            "query": question,
             "status": "success",  # Could be enhanced based on query result
-            "timestamp": query.timestamp.isoformat()
-        })
+            "timestamp": timestamp.isoformat()
+        }
+        for query_id, agent_id, question, timestamp, agent_name in rows
+    ]
+    
+    if rows:
+        newest, oldest = rows[0], rows[-1]
+        if newest[3] <= settled:
+            response.headers[LATEST_CURSOR_HEADER] = encode_cursor(newest[3], newest[0])
+        else:
+            response.headers[LATEST_CURSOR_HEADER] = encode_cursor(settled, "")
+        if len(rows) == limit and not since:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(oldest[3], oldest[0])
+    elif since:
+        response.headers[LATEST_CURSOR_HEADER] = since
     
     return activities
 
+@router.post("/reap")
+async def reap_session_collections(dry_run: bool = False):
+    """
+    Delete stale session collections now (also runs periodically in the background):
+    collections of unknown or completed sessions, of sessions active for longer than
+    SESSION_MAX_AGE_HOURS, and base collections of deleted agents
+    """
+    return await collection_reaper.run_once(dry_run=dry_run)
+
 @router.get("/{session_id}")
-async def get_session(session_id: str, db: Session = Depends(get_db)):
+async def get_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get session details by ID"""
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -53,9 +117,9 @@ async def get_session(session_id: str, db: Session = Depends(get_db)):
     }
 
 @router.post("/start", response_model=SessionStartResponse)
-async def start_session(data: SessionStartRequest, db: Session = Depends(get_db)):
+async def start_session(data: SessionStartRequest, db: AsyncSession = Depends(get_async_db)):
     """Create a new session and return LiveKit room token"""
-    agent = db.query(Agent).filter(Agent.id == data.agent_id).first()
+    agent = await db.get(Agent, data.agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
@@ -71,99 +135,122 @@ async def start_session(data: SessionStartRequest, db: Session = Depends(get_db)
         status='active'
     )
     db.add(session)
-    db.commit()
+    await record_activity(db, data.agent_id, session.started_at, sessions=1)
+    await db.commit()
+    
+    # Create room with metadata containing agent_id, session_id, and system_prompt
+    room_metadata_dict = {
+        "agent_id": data.agent_id,
+        "session_id": session_id,
+        "agent_name": agent.name,
+        "system_prompt": agent.system_prompt,  # ✅ Pass custom prompt to worker
+        "template_id": agent.template_id
+    }
     
+    # LOG: Show what we're sending
+    logger.info(f"📤 Creating LiveKit room with metadata:")
+    logger.info(f"   Agent ID: {data.agent_id}")
+    logger.info(f"   Session ID: {session_id}")
+    logger.info(f"   Agent Name: {agent.name}")
+    logger.info(f"   System Prompt: {(agent.system_prompt or '')[:100]}...")
+    logger.info(f"   Template ID: {agent.template_id}")
+    
+    # The pooled client is created on first use and its constructor raises on missing
+    # credentials, so resolve it before starting any step
     try:
-        # Create session-specific ChromaDB collection
-        rag_pipeline.create_session_collection(data.agent_id, session_id)
-        
-        # Generate LiveKit access token
-        token = api.AccessToken(livekit_api_key, livekit_api_secret)
-        token.with_identity(f"user_{session_id}")
-        token.with_name("User")
-        token.with_grants(api.VideoGrants(
-            room_join=True,
-            room=room_name,
-        ))
-        
-        # Create room with agent metadata
-        lk_api = api.LiveKitAPI(
-            url=livekit_url,
-            api_key=livekit_api_key,
-            api_secret=livekit_api_secret
-        )
-        
-        # Create room with metadata containing agent_id, session_id, and system_prompt
-        import json
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        room_metadata_dict = {
-            "agent_id": data.agent_id,
-            "session_id": session_id,
-            "agent_name": agent.name,
-            "system_prompt": agent.system_prompt,  # ✅ Pass custom prompt to worker
-            "template_id": agent.template_id
-        }
-        
-        # LOG: Show what we're sending
-        logger.info(f"📤 Creating LiveKit room with metadata:")
-        logger.info(f"   Agent ID: {data.agent_id}")
-        logger.info(f"   Session ID: {session_id}")
-        logger.info(f"   Agent Name: {agent.name}")
-        logger.info(f"   System Prompt: {agent.system_prompt[:100]}...")
-        logger.info(f"   Template ID: {agent.template_id}")
-        
-        room_metadata = json.dumps(room_metadata_dict)
-        
-        await lk_api.room.create_room(
+        rooms = livekit_client.api.room
+    except Exception as e:
+        await _abort_session_start(db, session, delete_collection=False, delete_room=False)
+        raise HTTPException(status_code=500, detail=f"Error creating session: {str(e)}")
+    
+    # Independent steps run concurrently: the collection copy (ChromaDB, in a thread)
+    # and the room creation (LiveKit HTTP call on the pooled client)
+    collection_result, room_result = await asyncio.gather(
+        asyncio.to_thread(rag_pipeline.create_session_collection, data.agent_id, session_id),
+        rooms.create_room(
             api.CreateRoomRequest(
                 name=room_name,
-                metadata=room_metadata
+                metadata=json.dumps(room_metadata_dict)
             )
+        ),
+        return_exceptions=True
+    )
+    
+    error = next((r for r in (collection_result, room_result) if isinstance(r, BaseException)), None)
+    if error is not None:
+        # Undo whichever step succeeded
+        await _abort_session_start(
+            db,
+            session,
+            delete_collection=not isinstance(collection_result, BaseException),
+            delete_room=not isinstance(room_result, BaseException)
         )
-        
-        # Generate JWT token
-        jwt_token = token.to_jwt()
-        
-        return SessionStartResponse(
-            session_id=session_id,
-            room_name=room_name,
-            token=jwt_token
-        )
+        raise HTTPException(status_code=500, detail=f"Error creating session: {str(error)}")
     
-    except Exception as e:
-        # Rollback session creation if something fails
-        db.delete(session)
-        db.commit()
-        raise HTTPException(status_code=500, detail=f"Error creating session: {str(e)}")
+    # Generate LiveKit access token (local JWT signing, no I/O)
+    token = livekit_client.access_token()
+    token.with_identity(f"user_{session_id}")
+    token.with_name("User")
+    token.with_grants(api.VideoGrants(
+        room_join=True,
+        room=room_name,
+    ))
+    
+    return SessionStartResponse(
+        session_id=session_id,
+        room_name=room_name,
+        token=token.to_jwt()
+    )
+
+async def _abort_session_start(db: AsyncSession, session: SessionModel, delete_collection: bool, delete_room: bool) -> None:
+    """Roll back a session whose start failed: its resources, row and rollup count"""
+    await _cleanup_session(
+        session.agent_id,
+        session.id,
+        session.livekit_room_name,
+        delete_collection=delete_collection,
+        delete_room=delete_room
+    )
+    await db.delete(session)
+    await record_activity(db, session.agent_id, session.started_at, sessions=-1)
+    await db.commit()
+
+async def _cleanup_session(
+    agent_id: str,
+    session_id: str,
+    room_name: str,
+    delete_collection: bool = True,
+    delete_room: bool = True
+) -> None:
+    """Delete a session's ChromaDB collection and LiveKit room concurrently"""
+    steps = []
+    if delete_collection:
+        steps.append(asyncio.to_thread(rag_pipeline.delete_session_collection, agent_id, session_id))
+    if delete_room:
+        steps.append(_delete_room(room_name))
+    
+    for result in await asyncio.gather(*steps, return_exceptions=True):
+        if isinstance(result, BaseException):
+            # Room might already be deleted, just log the error
+            logger.warning(f"⚠️ Session cleanup step failed for {session_id}: {result}")
+
+async def _delete_room(room_name: str) -> None:
+    # Resolving the client inside the step keeps a construction error in gather's results
+    await livekit_client.api.room.delete_room(api.DeleteRoomRequest(room=room_name))
 
 @router.post("/{session_id}/end", response_model=SessionEndResponse)
-async def end_session(session_id: str, db: Session = Depends(get_db)):
-    """End session and cleanup ChromaDB collection"""
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+async def end_session(session_id: str, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)):
+    """End session; the ChromaDB collection and LiveKit room are cleaned up after the response"""
+    session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Delete ChromaDB collection
-    rag_pipeline.delete_session_collection(session.agent_id, session_id)
-    
     # Update session status
     session.ended_at = datetime.utcnow()
     session.status = 'completed'
-    db.commit()
+    await db.commit()
     
-    # Optionally delete the LiveKit room
-    try:
-        lk_api = api.LiveKitAPI(
-            url=livekit_url,
-            api_key=livekit_api_key,
-            api_secret=livekit_api_secret
-        )
-        await lk_api.room.delete_room(api.DeleteRoomRequest(room=session.livekit_room_name))
-    except Exception as e:
-        # Room might already be deleted, just log the error
-        print(f"Warning: Could not delete LiveKit room: {str(e)}")
+    background_tasks.add_task(_cleanup_session, session.agent_id, session_id, session.livekit_room_name)
     
     return SessionEndResponse(
         status="session_ended",
@@ -171,9 +258,10 @@ async def end_session(session_id: str, db: Session = Depends(get_db)):
     )
 
 @router.post("/{session_id}/query", response_model=QueryResponse)
-async def query_session(session_id: str, query_data: QueryRequest, db: Session = Depends(get_db)):
+async def query_session(session_id: str, query_data: QueryRequest, db: AsyncSession = Depends(get_async_db)):
     """Manual query endpoint for testing RAG pipeline"""
-    session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+    with span("query_session.lookup"):
+        session = await db.get(SessionModel, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -184,30 +272,43 @@ async def query_session(session_id: str, query_data: QueryRequest, db: Session =
         session_id=session_id
     )
     
-    # Log query to database
-    query_record = Query(
-        id=str(uuid.uuid4()),
-        session_id=session_id,
-        agent_id=session.agent_id,
-        question=query_data.question,
-        answer=result.get('context', ''),
-        sources=result.get('sources', []),
-        timestamp=datetime.utcnow()
-    )
-    
-    session.query_count += 1
-    
-    # Update agent query count and last_used
-    agent = db.query(Agent).filter(Agent.id == session.agent_id).first()
-    if agent:
-        agent.query_count += 1
-        agent.last_used = datetime.utcnow()  # NEW: Track last usage
-    
-    db.add(query_record)
-    db.commit()
+    # Speculative prefetches are only logged if the worker ends up using them (see /log)
+    if not query_data.speculative:
+        _record_queries(session, [
+            (query_data.question, result.get('context', ''), result.get('sources', []))
+        ])
     
     return QueryResponse(
         answer=result.get('context', ''),
         sources=result.get('sources', []),
         context=result.get('context', '')
     )
+
+@router.post("/{session_id}/log")
+async def log_queries(session_id: str, log_data: QueryLogRequest, db: AsyncSession = Depends(get_async_db)):
+    """Record queries answered from results the worker already retrieved (e.g. speculative prefetch)"""
+    session = await db.get(SessionModel, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    _record_queries(session, [
+        (entry.question, entry.context, entry.sources) for entry in log_data.queries
+    ])
+    
+    return {"status": "success", "logged": len(log_data.queries)}
+
+def _record_queries(session: SessionModel, entries: list) -> None:
+    """
+    Log (question, context, sources) entries through the write-behind query log,
+    which also updates session/agent query counts and agent last_used on flush
+    """
+    now = datetime.utcnow()
+    for question, context, sources in entries:
+        query_log.record(
+            session_id=session.id,
+            agent_id=session.agent_id,
+            question=question,
+            answer=context,
+            sources=sources,
+            timestamp=now
+        )
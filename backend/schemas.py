@@ -21,6 +21,10 @@ class AgentCreate(BaseModel):
     system_prompt: Optional[str] = None
     avatar_id: Optional[str] = None  # Beyond Presence avatar ID
     mcp_config: Optional[Dict] = None  # MCP server configuration
+    rag_mode: Literal["tool", "proactive"] = "tool"  # Knowledge base retrieval mode
+    index_profile: str = "auto"  # Vector index profile (index_profiles.py)
+    chunk_size: Optional[int] = Field(None, ge=100, le=8000)  # Characters per chunk, None uses the default
+    chunk_overlap: Optional[int] = Field(None, ge=0, le=4000)  # Characters shared by neighbouring chunks
 
 class AgentUpdate(BaseModel):
     name: Optional[str] = None
@@ -28,6 +32,11 @@ class AgentUpdate(BaseModel):
     system_prompt: Optional[str] = None
     avatar_id: Optional[str] = None  # Beyond Presence avatar ID
     mcp_config: Optional[Dict] = None  # MCP server configuration
+    rag_mode: Optional[Literal["tool", "proactive"]] = None  # Knowledge base retrieval mode
+    index_profile: Optional[str] = None  # Vector index profile, applied by an index rebuild
+    chunk_size: Optional[int] = Field(None, ge=100, le=8000)  # Applied to existing documents by a re-index
+    chunk_overlap: Optional[int] = Field(None, ge=0, le=4000)
+    reset_chunking: bool = False  # Back to the pipeline defaults (None above leaves the settings unchanged)
 
 class AgentResponse(BaseModel):
     id: str
@@ -44,10 +53,40 @@ class AgentResponse(BaseModel):
     last_used: Optional[datetime]  # NEW: Tracks last query timestamp
     avatar_id: Optional[str]  # Beyond Presence avatar ID
     mcp_config: Optional[Dict] = None  # MCP server configuration
+    rag_mode: Optional[str] = 'tool'  # Knowledge base retrieval mode
+    index_profile: Optional[str] = 'auto'  # Vector index profile
+    chunk_size: Optional[int] = None  # None: pipeline default
+    chunk_overlap: Optional[int] = None
     
     class Config:
         from_attributes = True
 
+class AgentSummary(BaseModel):
+    """Agent list entry without the large configuration fields (system_prompt, mcp_config)"""
+    id: str
+    name: str
+    description: Optional[str]
+    template_id: str
+    color: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    query_count: int
+    document_count: int
+    status: str
+    last_used: Optional[datetime]
+    avatar_id: Optional[str]
+    rag_mode: Optional[str] = 'tool'
+    
+    class Config:
+        from_attributes = True
+
+class IndexRebuildRequest(BaseModel):
+    profile: Optional[str] = None  # Also stored as the agent's index_profile
+
+class ReindexRequest(BaseModel):
+    agent_ids: Optional[List[str]] = None  # None re-indexes every agent
+    concurrency: Optional[int] = Field(None, ge=1, le=32)  # agents at once, default REINDEX_CONCURRENCY
+
 # Document Schemas
 class DocumentResponse(BaseModel):
     id: str
@@ -55,6 +94,9 @@ class DocumentResponse(BaseModel):
     filename: str
     file_size: int
     chunk_count: int
+    content_hash: Optional[str] = None  # sha256 of the file
+    blob_key: Optional[str] = None  # set when the original is kept for re-indexing
+    suppressed_by: Optional[List[str]] = None  # documents holding the kept copies of its near-duplicate chunks
     uploaded_at: datetime
     
     class Config:
@@ -77,6 +119,15 @@ class SessionEndResponse(BaseModel):
 class QueryRequest(BaseModel):
     question: str
     session_id: Optional[str] = None
+    speculative: bool = False  # Prefetch on an interim transcript, not logged
+
+class QueryLogEntry(BaseModel):
+    question: str
+    context: str = ""
+    sources: List[str] = []
+
+class QueryLogRequest(BaseModel):
+    queries: List[QueryLogEntry]
 
 class QueryResponse(BaseModel):
     answer: str
@@ -97,6 +148,17 @@ class AgentAnalytics(BaseModel):
     documents_indexed: int
     last_used: Optional[datetime]
 
+class TimeSeriesPoint(BaseModel):
+    bucket_start: datetime
+    sessions: int
+    queries: int
+
+class AgentActivity(BaseModel):
+    agent_id: str
+    agent_name: str
+    sessions: int
+    queries: int
+
 # Template Schemas
 class TemplateResponse(BaseModel):
     id: str
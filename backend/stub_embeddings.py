@@ -0,0 +1,44 @@
+"""
+Deterministic local embedding stub
+Hashed bag-of-words vectors: no model download, no API key, identical output on
+every machine, and texts sharing words still land close together. Used by load
+tests and benchmarks (USE_STUB_EMBEDDINGS=true), never for real agents.
+"""
+
+import math
+import os
+import re
+import time
+import zlib
+from typing import List
+
+STUB_EMBEDDING_DIM = int(os.getenv("STUB_EMBEDDING_DIM", "384"))
+STUB_EMBEDDING_LATENCY_MS = float(os.getenv("STUB_EMBEDDING_LATENCY_MS", "0"))  # simulated model time per call
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class StubEmbeddings:
+    """langchain-compatible embeddings (embed_documents / embed_query)"""
+    
+    def __init__(self, dim: int = STUB_EMBEDDING_DIM, latency_ms: float = STUB_EMBEDDING_LATENCY_MS):
+        self.dim = dim
+        self.latency = latency_ms / 1000
+    
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in _TOKEN.findall(text.lower()):
+            h = zlib.crc32(token.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
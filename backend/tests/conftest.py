@@ -0,0 +1,97 @@
+"""
+Backend test harness
+Backend modules read their configuration (database, ChromaDB path, plan and blob
+directories) at import time and a ChromaDB directory can only be opened by one process,
+so each scenario runs the backend in a fresh subprocess against a per-test temporary
+environment. That also lets a scenario die mid-operation (os._exit) like a real crash.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+from typing import Dict, Optional
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+CRASH_EXIT = 17  # exit status of a scenario that crashed on purpose
+
+# Scenario scripts define `async def scenario(client)`; with the app, client is an
+# httpx client for it (startup and shutdown handlers run around the scenario)
+_PRELUDE = """
+import asyncio, json, os, sys
+ARGS = json.loads({args!r})
+CRASH_EXIT = {crash_exit}
+"""
+
+_WITH_APP = """
+async def _main():
+    import httpx
+    from main import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            result = await scenario(client)
+    print(json.dumps(result))
+"""
+
+_WITHOUT_APP = """
+async def _main():
+    from database import init_db, async_engine
+    init_db()
+    try:
+        result = await scenario(None)
+    finally:
+        await async_engine.dispose()
+    print(json.dumps(result))
+"""
+
+
+class Backend:
+    """Runs scenario scripts in backend subprocesses sharing one temporary environment"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.env = {
+            key: value for key, value in os.environ.items()
+            if key not in ("CHROMA_SERVER_URL", "TRACING_EXPORTER", "RAG_RETRIEVAL_MODE")
+        }
+        self.env.update({
+            "PYTHONPATH": str(BACKEND_DIR),
+            "DATABASE_URL": f"sqlite:///{root / 'test.db'}",
+            "CHROMADB_PATH": str(root / "chroma"),
+            "BLOB_STORE_DIR": str(root / "blobs"),
+            "REPLACE_PLAN_DIR": str(root / "replace_plans"),
+            "SWITCHOVER_PLAN_DIR": str(root / "switchover_plans"),
+            "USE_STUB_EMBEDDINGS": "true",
+            "REAPER_ENABLED": "false",
+            "WARMUP_ENABLED": "false",
+            "LIVEKIT_API_KEY": "test",
+            "LIVEKIT_API_SECRET": "test-secret-test-secret-test-secret",
+        })
+
+    def run(self, body: str, args: Optional[Dict] = None, app: bool = True, crash: bool = False):
+        """Run a scenario, returns what it returned (None when it crashed as expected)"""
+        script = (
+            _PRELUDE.format(args=json.dumps(args or {}), crash_exit=CRASH_EXIT)
+            + textwrap.dedent(body)
+            + (_WITH_APP if app else _WITHOUT_APP)
+            + "\nasyncio.run(_main())\n"
+        )
+        proc = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=self.root, env=self.env, capture_output=True, text=True, timeout=600
+        )
+        expected = CRASH_EXIT if crash else 0
+        assert proc.returncode == expected, f"exit {proc.returncode}\n{proc.stdout[-2000:]}\n{proc.stderr[-4000:]}"
+        if crash:
+            return None
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+@pytest.fixture
+def backend(tmp_path) -> Backend:
+    return Backend(tmp_path)
@@ -0,0 +1,68 @@
+"""
+Scenario snippets shared by the tests (run through the backend fixture, see conftest.py)
+"""
+
+import hashlib
+import random
+
+# Creates an agent with ARGS["agent"] settings and uploads ARGS["documents"] ([filename, text] pairs)
+CREATE_AGENT = """
+async def scenario(client):
+    response = await client.post("/api/agents/create", json={"template_id": "general", **ARGS["agent"]})
+    assert response.status_code == 200, response.text
+    agent_id = response.json()["id"]
+    doc_ids = []
+    for filename, text in ARGS["documents"]:
+        response = await client.post(
+            f"/api/agents/{agent_id}/upload", files={"file": (filename, text.encode(), "text/plain")}
+        )
+        assert response.status_code == 200, response.text
+        doc_ids.append(response.json()["document"]["id"])
+    return {"agent_id": agent_id, "doc_ids": doc_ids}
+"""
+
+# Document rows and stored chunks of agent ARGS["agent_id"], after recover_replacements() if ARGS["recover"]
+INDEX_STATE = """
+async def scenario(client):
+    from sqlalchemy import select
+    from chromadb.errors import NotFoundError
+    from database import AsyncSessionLocal
+    from document_updates import REPLACE_PLAN_DIR, recover_replacements
+    from models import Document
+    from rag_pipeline import rag_pipeline
+
+    recovered = await recover_replacements() if ARGS.get("recover") else 0
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Document).where(Document.agent_id == ARGS["agent_id"]))
+        documents = {
+            document.id: {"filename": document.filename, "chunk_count": document.chunk_count, "content_hash": document.content_hash}
+            for document in result.scalars()
+        }
+    try:
+        stored = rag_pipeline.chroma_client.get_collection(f"agent_{ARGS['agent_id']}").get(include=["documents", "metadatas"])
+    except NotFoundError:
+        stored = {"ids": [], "documents": [], "metadatas": []}
+    vectors = {}
+    for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+        vectors.setdefault(metadata["document_id"], []).append(
+            {"id": chunk_id, "text": text, "chunk_index": metadata.get("chunk_index"), "filename": metadata.get("filename")}
+        )
+    plans = sorted(os.listdir(REPLACE_PLAN_DIR)) if os.path.isdir(REPLACE_PLAN_DIR) else []
+    return {"recovered": recovered, "documents": documents, "vectors": vectors, "plans": plans}
+"""
+
+_WORDS = (
+    "leave policy salary review laptop travel expense badge office parking onboarding mentor "
+    "holiday benefit pension insurance training budget project client invoice contract security "
+    "password vpn printer kitchen meeting calendar manager team quarterly goal feedback promotion"
+).split()
+
+
+def paragraphs(count: int, seed: int, words: int = 16):
+    """Distinct pseudo-random paragraphs of under 200 characters (near-duplicate suppression leaves them alone)"""
+    rng = random.Random(seed)
+    return [f"Section {seed}-{n}: " + " ".join(rng.choice(_WORDS) for _ in range(words)) + "." for n in range(count)]
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
@@ -0,0 +1,46 @@
+"""
+Activity feed polling (GET /api/sessions/recent?since=...)
+Query rows are stamped when recorded but committed later, in batches, by each process's
+write-behind buffer; a poller following X-Latest-Cursor must still see a row that was
+recorded before a newer one but flushed after it.
+"""
+
+# Two write-behind buffers (two processes): A is recorded first but flushed after B
+# has been flushed and polled
+INTERLEAVED = """
+from query_log import QueryLogWriter, query_log
+
+async def scenario(client):
+    await query_log.stop()  # flushes are driven by hand below
+    first, second = (QueryLogWriter(flush_interval=0.2, settle_margin=0.3) for _ in range(2))
+    query_log.flush_interval, query_log.settle_margin = 0.2, 0.3
+
+    async def poll(**params):
+        response = await client.get("/api/sessions/recent", params=params)
+        assert response.status_code == 200, response.text
+        return [row["query"] for row in response.json()], response.headers.get("X-Latest-Cursor")
+
+    first.record("session-1", "agent-1", "question A", "", [])
+    await asyncio.sleep(0.05)
+    second.record("session-2", "agent-1", "question B", "", [])
+    await second.flush()
+
+    listed, cursor = await poll()
+    await first.flush()
+
+    polls = []
+    for _ in range(2):
+        await asyncio.sleep(0.6)  # past the settle window
+        rows, cursor = await poll(since=cursor)
+        polls.append(rows)
+    return {"listed": listed, "polls": polls}
+"""
+
+
+def test_poll_sees_rows_flushed_after_a_newer_row(backend):
+    result = backend.run(INTERLEAVED)
+
+    assert result["listed"] == ["question B"]
+    # A comes through, B again (it was newer than the settle window when listed), then nothing
+    assert result["polls"][0] == ["question B", "question A"]
+    assert result["polls"][1] == []
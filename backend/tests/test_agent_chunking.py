@@ -0,0 +1,65 @@
+"""
+Agent chunk settings (PUT /api/agents/{agent_id})
+Changing them re-indexes the agent's documents; the change is refused while a re-index
+is running, and reset_chunking returns them to the pipeline defaults.
+"""
+
+from scenarios import CREATE_AGENT, INDEX_STATE, paragraphs
+
+TEXT = "\n\n".join(paragraphs(8, seed=21))
+
+UPDATE = """
+async def scenario(client):
+    from rag_pipeline import rag_pipeline
+
+    if ARGS.get("reindexing"):
+        rag_pipeline.reindexing.add(ARGS["agent_id"])
+    results = []
+    for update in ARGS["updates"]:
+        response = await client.put(f"/api/agents/{ARGS['agent_id']}", json=update)
+        results.append({"status": response.status_code, "body": response.json()})
+    return results
+"""
+
+
+def _setup(backend):
+    created = backend.run(CREATE_AGENT, {
+        "agent": {"name": "Chunks", "chunk_size": 200, "chunk_overlap": 0},
+        "documents": [["notes.txt", TEXT]],
+    })
+    return created["agent_id"], created["doc_ids"][0]
+
+
+def test_chunk_change_refused_while_reindexing(backend):
+    agent_id, _ = _setup(backend)
+
+    renamed, rechunked, reset = backend.run(UPDATE, {
+        "agent_id": agent_id,
+        "reindexing": True,
+        "updates": [{"name": "Renamed"}, {"chunk_size": 400}, {"reset_chunking": True}],
+    })
+    assert renamed["status"] == 200
+    assert rechunked["status"] == 409
+    assert reset["status"] == 409
+
+    [agent] = backend.run(UPDATE, {"agent_id": agent_id, "updates": [{}]})
+    assert agent["body"]["name"] == "Renamed"
+    assert (agent["body"]["chunk_size"], agent["body"]["chunk_overlap"]) == (200, 0)
+
+
+def test_reset_chunking_restores_defaults_and_reindexes(backend):
+    agent_id, doc_id = _setup(backend)
+    assert backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)["documents"][doc_id]["chunk_count"] == 8
+
+    [conflicting, reset] = backend.run(UPDATE, {
+        "agent_id": agent_id,
+        "updates": [{"reset_chunking": True, "chunk_size": 300}, {"reset_chunking": True}],
+    })
+    assert conflicting["status"] == 400
+    assert reset["status"] == 200
+    assert reset["body"]["chunk_size"] is None and reset["body"]["chunk_overlap"] is None
+
+    # At the default chunk size the whole text fits in far fewer chunks
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    assert state["documents"][doc_id]["chunk_count"] < 8
+    assert state["documents"][doc_id]["chunk_count"] == len(state["vectors"][doc_id])
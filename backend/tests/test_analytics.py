@@ -0,0 +1,63 @@
+"""
+Analytics totals (GET /api/analytics/overview, /api/analytics/agents/{agent_id})
+Read from stored counters and the activity rollups rather than counting raw rows, and
+must still agree with the rows they stand for.
+"""
+
+from scenarios import CREATE_AGENT, paragraphs
+
+# Starts ARGS["sessions"] sessions per agent (as start_session records them), logs two
+# queries per session, then deletes the last agent; returns the endpoints next to raw counts
+ACTIVITY = """
+import uuid
+from datetime import datetime
+from sqlalchemy import func, select
+from database import AsyncSessionLocal
+from models import Document, Query, Session as SessionModel
+from query_log import query_log
+from rollups import record_activity
+
+async def scenario(client):
+    for agent_id, sessions in zip(ARGS["agent_ids"], ARGS["sessions"]):
+        for _ in range(sessions):
+            async with AsyncSessionLocal() as db:
+                session = SessionModel(id=str(uuid.uuid4()), agent_id=agent_id, started_at=datetime.utcnow(), status="active")
+                db.add(session)
+                await record_activity(db, agent_id, session.started_at, sessions=1)
+                await db.commit()
+            for n in range(2):
+                query_log.record(session.id, agent_id, f"question {n}", "answer", [])
+    await query_log.flush()
+    response = await client.delete(f"/api/agents/{ARGS['agent_ids'][-1]}")
+    assert response.status_code == 200, response.text
+
+    overview = (await client.get("/api/analytics/overview")).json()
+    agent = (await client.get(f"/api/analytics/agents/{ARGS['agent_ids'][0]}")).json()
+    async with AsyncSessionLocal() as db:
+        counted = {
+            "sessions": await db.scalar(select(func.count()).select_from(SessionModel)),
+            "queries": await db.scalar(select(func.count()).select_from(Query)),
+            "documents": await db.scalar(select(func.count()).select_from(Document)),
+            "agent_sessions": await db.scalar(select(func.count()).where(SessionModel.agent_id == ARGS["agent_ids"][0])),
+            "agent_queries": await db.scalar(select(func.count()).where(Query.agent_id == ARGS["agent_ids"][0])),
+        }
+    return {"overview": overview, "agent": agent, "counted": counted}
+"""
+
+
+def test_totals_match_the_rows_they_count(backend):
+    agent_ids = [
+        backend.run(CREATE_AGENT, {"agent": {"name": f"Agent {n}"}, "documents": [[f"{n}.txt", "\n\n".join(paragraphs(2, seed=50 + n))]]})["agent_id"]
+        for n in range(2)
+    ]
+
+    result = backend.run(ACTIVITY, {"agent_ids": agent_ids, "sessions": [3, 2]})
+    overview, agent, counted = result["overview"], result["agent"], result["counted"]
+
+    assert overview == {"total_agents": 1, "total_sessions": 5, "total_queries": 10, "total_documents": 1}
+    assert (overview["total_sessions"], overview["total_queries"], overview["total_documents"]) == (
+        counted["sessions"], counted["queries"], counted["documents"]
+    )
+    assert (agent["total_sessions"], agent["total_queries"]) == (counted["agent_sessions"], counted["agent_queries"]) == (3, 6)
+    assert agent["documents_indexed"] == 1
+    assert agent["last_used"] is not None
@@ -0,0 +1,71 @@
+"""
+Bulk ingestion (bulk_ingest.py)
+A file repeating chunks of an earlier file of the same upload must keep them when
+that earlier file fails to store.
+"""
+
+from scenarios import CREATE_AGENT, INDEX_STATE, paragraphs, sha256
+
+SHARED = paragraphs(3, seed=11)
+FIRST_TEXT = "\n\n".join(SHARED + paragraphs(2, seed=12))
+SECOND_TEXT = "\n\n".join(paragraphs(2, seed=13) + SHARED)
+
+# Bulk upload of ARGS["files"]; storing the original of the file hashed ARGS["fail_sha256"] fails
+BULK_UPLOAD = """
+import bulk_ingest
+
+real_put = bulk_ingest.blob_store.put
+
+async def failing_put(path, key):
+    if key == ARGS["fail_sha256"]:
+        raise OSError("disk full")
+    return await real_put(path, key)
+
+bulk_ingest.blob_store.put = failing_put
+
+async def scenario(client):
+    response = await client.post(
+        f"/api/agents/{ARGS['agent_id']}/upload/bulk",
+        files=[("files", (filename, text.encode(), "text/plain")) for filename, text in ARGS["files"]]
+    )
+    return {"status": response.status_code, "body": response.json()}
+"""
+
+
+def _upload(backend, fail_sha256=None):
+    agent_id = backend.run(CREATE_AGENT, {"agent": {"name": "Bulk", "chunk_size": 200, "chunk_overlap": 0}, "documents": []})["agent_id"]
+    result = backend.run(BULK_UPLOAD, {
+        "agent_id": agent_id,
+        "files": [["first.txt", FIRST_TEXT], ["second.txt", SECOND_TEXT]],
+        "fail_sha256": fail_sha256,
+    })
+    assert result["status"] == 200, result["body"]
+    files = {file["filename"]: file for file in result["body"]["files"]}
+    return agent_id, files, backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+
+
+def test_repeats_of_an_earlier_file_are_suppressed(backend):
+    agent_id, files, state = _upload(backend)
+
+    first, second = files["first.txt"], files["second.txt"]
+    assert first["status"] == second["status"] == "success"
+    assert second["chunks_processed"] == 2
+    assert second["chunks_suppressed"] == 3
+    assert second["document"]["suppressed_by"] == [first["document"]["id"]]
+    assert len(state["vectors"][second["document"]["id"]]) == 2
+
+
+def test_failed_file_does_not_take_repeated_chunks_with_it(backend):
+    agent_id, files, state = _upload(backend, fail_sha256=sha256(FIRST_TEXT))
+
+    assert files["first.txt"]["status"] == "error"
+    second = files["second.txt"]
+    assert second["status"] == "success"
+    assert second["chunks_processed"] == 5
+    assert second["chunks_suppressed"] == 0
+    assert second["document"]["suppressed_by"] is None
+
+    doc_id = second["document"]["id"]
+    assert list(state["vectors"]) == [doc_id]
+    assert sorted(v["text"] for v in state["vectors"][doc_id]) == sorted(SECOND_TEXT.split("\n\n"))
+    assert state["documents"][doc_id]["chunk_count"] == 5
@@ -0,0 +1,37 @@
+"""
+Collection reaper (collection_reaper.py)
+The segment-file sweep and size report only apply to an in-process store: with a Chroma
+server (CHROMA_SERVER_URL) the local directory is not the server's and is left alone.
+"""
+
+import pytest
+
+# Plants an unreferenced, old segment directory and runs one reaper pass
+REAP = """
+import uuid
+from collection_reaper import collection_reaper
+from rag_pipeline import rag_pipeline
+
+async def scenario(client):
+    rag_pipeline.chroma_local = ARGS["local"]
+    rag_pipeline.chroma_client.get_or_create_collection("probe")  # creates chroma.sqlite3
+    stray = os.path.join(rag_pipeline.chroma_path, str(uuid.uuid4()))
+    os.makedirs(stray)
+    with open(os.path.join(stray, "data_level0.bin"), "wb") as f:
+        f.write(b"x" * 4096)
+    os.utime(stray, (0, 0))
+    report = await collection_reaper.run_once()
+    return {"stray_left": os.path.exists(stray), "bytes_before": report["bytes_before"], "bytes_reclaimed": report["bytes_reclaimed"]}
+"""
+
+
+@pytest.mark.parametrize("local", [True, False], ids=["local", "server"])
+def test_segment_sweep_only_for_a_local_store(backend, local):
+    result = backend.run(REAP, {"local": local})
+
+    if local:
+        assert not result["stray_left"]
+        assert result["bytes_reclaimed"] >= 4096
+    else:
+        assert result["stray_left"]
+        assert result["bytes_before"] is None and result["bytes_reclaimed"] is None
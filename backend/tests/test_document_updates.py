@@ -0,0 +1,163 @@
+"""
+Incremental document replacement and its crash recovery (document_updates.py)
+The process is killed between step 1 (vectors added / re-labelled) and the commit of
+the Document row, and between that commit and step 3 (removed chunks deleted);
+recover_replacements() must leave the vectors and Document.chunk_count in agreement.
+"""
+
+import pytest
+
+from scenarios import CREATE_AGENT, INDEX_STATE, paragraphs, sha256
+
+# Kills the process right before or right after the replacement's commit
+REPLACE_WITH_CRASH = """
+from sqlalchemy.ext.asyncio import AsyncSession
+
+real_commit = AsyncSession.commit
+armed = False
+
+async def crashing_commit(self):
+    if armed and ARGS["crash"] == "before_commit":
+        os._exit(CRASH_EXIT)
+    await real_commit(self)
+    if armed and ARGS["crash"] == "after_commit":
+        os._exit(CRASH_EXIT)
+
+AsyncSession.commit = crashing_commit
+
+async def scenario(client):
+    global armed
+    armed = ARGS["crash"] is not None
+    response = await client.put(
+        f"/api/agents/documents/{ARGS['doc_id']}", files={"file": ("policy.txt", ARGS["text"].encode(), "text/plain")}
+    )
+    return {"status": response.status_code, "body": response.json()}
+"""
+
+OLD = paragraphs(12, seed=1)
+# Three paragraphs dropped, three rewritten, two added: every kind of chunk change
+NEW = OLD[:3] + paragraphs(3, seed=2) + OLD[6:9] + paragraphs(2, seed=3)
+OLD_TEXT = "\n\n".join(OLD)
+NEW_TEXT = "\n\n".join(NEW)
+assert max(len(paragraph) for paragraph in OLD + NEW) < 200  # one chunk per paragraph at chunk_size 200
+
+
+def _setup(backend):
+    created = backend.run(CREATE_AGENT, {
+        "agent": {"name": "Handbook", "chunk_size": 200, "chunk_overlap": 0},
+        "documents": [["policy.txt", OLD_TEXT], ["other.txt", "\n\n".join(paragraphs(4, seed=9))]],
+    })
+    return created["agent_id"], created["doc_ids"][0], created["doc_ids"][1]
+
+
+def _assert_consistent(state, doc_id, text):
+    """Vectors of the document agree with its row and all come from the given version"""
+    document = state["documents"][doc_id]
+    vectors = state["vectors"].get(doc_id, [])
+    assert document["content_hash"] == sha256(text)
+    assert document["chunk_count"] == len(vectors)
+    assert sorted(vector["chunk_index"] for vector in vectors) == list(range(len(vectors)))
+    assert len({vector["id"] for vector in vectors}) == len(vectors)
+    assert all(vector["text"] in text for vector in vectors)
+    assert "".join(sorted(vector["text"] for vector in vectors)) == "".join(sorted(text.split("\n\n")))
+    assert state["plans"] == []
+
+
+def test_replace_reuses_unchanged_chunks(backend):
+    agent_id, doc_id, other_id = _setup(backend)
+
+    result = backend.run(REPLACE_WITH_CRASH, {"doc_id": doc_id, "text": NEW_TEXT, "crash": None})
+    assert result["status"] == 200, result["body"]
+    assert result["body"]["chunks_unchanged"] == 6
+    assert result["body"]["chunks_added"] == 5
+    assert result["body"]["chunks_removed"] == 6
+
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    _assert_consistent(state, doc_id, NEW_TEXT)
+    assert state["documents"][other_id]["chunk_count"] == len(state["vectors"][other_id])
+
+
+@pytest.mark.parametrize("crash, survivor", [("before_commit", OLD_TEXT), ("after_commit", NEW_TEXT)], ids=["before_commit", "after_commit"])
+def test_recovery_after_crash(backend, crash, survivor):
+    agent_id, doc_id, other_id = _setup(backend)
+    other_before = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)["vectors"][other_id]
+
+    backend.run(REPLACE_WITH_CRASH, {"doc_id": doc_id, "text": NEW_TEXT, "crash": crash}, crash=True)
+
+    # The crash left both versions' chunks side by side, with the plan file
+    crashed = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    assert crashed["plans"] == [f"{doc_id}.json"]
+    assert len(crashed["vectors"][doc_id]) == 17
+    assert crashed["documents"][doc_id]["chunk_count"] != 17
+
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id, "recover": True}, app=False)
+    assert state["recovered"] == 1
+    _assert_consistent(state, doc_id, survivor)
+    # Other documents of the agent are untouched
+    assert sorted(v["id"] for v in state["vectors"][other_id]) == sorted(v["id"] for v in other_before)
+
+
+def test_replace_after_recovery(backend):
+    """A recovered document can be replaced again (the plan file no longer blocks it)"""
+    agent_id, doc_id, _ = _setup(backend)
+    backend.run(REPLACE_WITH_CRASH, {"doc_id": doc_id, "text": NEW_TEXT, "crash": "before_commit"}, crash=True)
+    backend.run(INDEX_STATE, {"agent_id": agent_id, "recover": True}, app=False)
+
+    result = backend.run(REPLACE_WITH_CRASH, {"doc_id": doc_id, "text": NEW_TEXT, "crash": None})
+    assert result["status"] == 200, result["body"]
+
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    _assert_consistent(state, doc_id, NEW_TEXT)
+
+
+# Restores ARGS["dependent"] after its suppressing document ARGS["source"] is gone, crashing around the commit
+RESTORE_WITH_CRASH = """
+from sqlalchemy.ext.asyncio import AsyncSession
+import document_updates
+
+real_commit = AsyncSession.commit
+armed = False
+
+async def crashing_commit(self):
+    if armed and ARGS["crash"] == "before_commit":
+        os._exit(CRASH_EXIT)
+    await real_commit(self)
+    if armed and ARGS["crash"] == "after_commit":
+        os._exit(CRASH_EXIT)
+
+AsyncSession.commit = crashing_commit
+real_restore = document_updates.restore_dependents
+
+async def scenario(client):
+    global armed
+    document_updates.restore_dependents = lambda *args: asyncio.sleep(0)  # not from the delete itself
+    response = await client.delete(f"/api/agents/documents/{ARGS['source']}")
+    assert response.status_code == 200, response.text
+    armed = True
+    return await real_restore(ARGS["agent_id"], ARGS["source"])
+"""
+
+SHARED = paragraphs(3, seed=14)
+HANDBOOK_TEXT = "\n\n".join(SHARED + paragraphs(2, seed=15))
+POLICY_TEXT = "\n\n".join(paragraphs(2, seed=16) + SHARED)
+
+
+@pytest.mark.parametrize("crash, chunks", [("before_commit", 2), ("after_commit", 5)], ids=["before_commit", "after_commit"])
+def test_recovery_after_crash_in_restore(backend, crash, chunks):
+    """A restore re-stores the same file: recovery must not mistake an uncommitted one for committed"""
+    created = backend.run(CREATE_AGENT, {
+        "agent": {"name": "Handbook", "chunk_size": 200, "chunk_overlap": 0},
+        "documents": [["handbook.txt", HANDBOOK_TEXT], ["policy.txt", POLICY_TEXT]],
+    })
+    agent_id, (handbook_id, policy_id) = created["agent_id"], created["doc_ids"]
+
+    backend.run(RESTORE_WITH_CRASH, {"agent_id": agent_id, "source": handbook_id, "crash": crash}, crash=True)
+    crashed = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    assert crashed["plans"] == [f"{policy_id}.json"]
+    assert len(crashed["vectors"][policy_id]) == 5
+
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id, "recover": True}, app=False)
+    assert state["recovered"] == 1
+    assert state["plans"] == []
+    assert len(state["vectors"][policy_id]) == chunks
+    assert state["documents"][policy_id]["chunk_count"] == chunks
@@ -0,0 +1,116 @@
+"""
+Online index rebuild (rag_pipeline.rebuild_agent_index)
+Writes made while the copy is built must not wait for it and must reach the rebuilt
+collection; a process dying between the two renames of the switch-over is repaired
+by recover_switchovers() on the next start.
+"""
+
+from scenarios import CREATE_AGENT, INDEX_STATE, paragraphs
+
+# Rebuilds with profile "large", uploading ARGS["upload"] and deleting ARGS["delete"] while the copy is paused
+REBUILD_WITH_WRITES = """
+import threading
+from rag_pipeline import rag_pipeline
+
+copied = threading.Event()
+resume = threading.Event()
+real_build = rag_pipeline._build_staging
+
+def paused_build(agent_id, index_profile):
+    staging = real_build(agent_id, index_profile)
+    copied.set()
+    resume.wait(60)
+    return staging
+
+rag_pipeline._build_staging = paused_build
+
+async def scenario(client):
+    rebuild = asyncio.create_task(rag_pipeline.rebuild_agent_index(ARGS["agent_id"], "large"))
+    await asyncio.to_thread(copied.wait, 60)
+    filename, text = ARGS["upload"]
+    upload = await asyncio.wait_for(
+        client.post(f"/api/agents/{ARGS['agent_id']}/upload", files={"file": (filename, text.encode(), "text/plain")}),
+        timeout=30
+    )
+    delete = await asyncio.wait_for(client.delete(f"/api/agents/documents/{ARGS['delete']}"), timeout=30)
+    resume.set()
+    result = await rebuild
+    return {"upload": upload.status_code, "doc_id": upload.json()["document"]["id"], "delete": delete.status_code, "result": result}
+"""
+
+# Kills the process between the switch-over's renames (live moved aside, staging not yet renamed)
+REBUILD_WITH_CRASH = """
+from chromadb.api.models.Collection import Collection
+from rag_pipeline import rag_pipeline
+
+real_modify = Collection.modify
+
+def crashing_modify(self, *args, **kwargs):
+    if kwargs.get("name") == f"agent_{ARGS['agent_id']}":
+        os._exit(CRASH_EXIT)
+    return real_modify(self, *args, **kwargs)
+
+Collection.modify = crashing_modify
+
+async def scenario(client):
+    await rag_pipeline.rebuild_agent_index(ARGS["agent_id"], "large")
+"""
+
+RECOVER = """
+async def scenario(client):
+    from index_profiles import collection_hnsw
+    from rag_pipeline import rag_pipeline, SWITCHOVER_PLAN_DIR
+
+    before = rag_pipeline.list_collection_names()
+    resolved = rag_pipeline.recover_switchovers()
+    live = rag_pipeline.chroma_client.get_collection(f"agent_{ARGS['agent_id']}")
+    return {
+        "before": before,
+        "resolved": resolved,
+        "after": rag_pipeline.list_collection_names(),
+        "hnsw": collection_hnsw(live),
+        "plans": os.listdir(SWITCHOVER_PLAN_DIR),
+    }
+"""
+
+
+def _setup(backend):
+    created = backend.run(CREATE_AGENT, {
+        "agent": {"name": "Rebuild", "chunk_size": 200, "chunk_overlap": 0},
+        "documents": [["a.txt", "\n\n".join(paragraphs(6, seed=31))], ["b.txt", "\n\n".join(paragraphs(4, seed=32))]],
+    })
+    return created["agent_id"], created["doc_ids"]
+
+
+def test_writes_during_rebuild_reach_the_rebuilt_collection(backend):
+    agent_id, (kept_id, deleted_id) = _setup(backend)
+    upload_text = "\n\n".join(paragraphs(3, seed=33))
+
+    run = backend.run(REBUILD_WITH_WRITES, {"agent_id": agent_id, "upload": ["c.txt", upload_text], "delete": deleted_id})
+    assert run["upload"] == 200 and run["delete"] == 200
+    assert run["result"]["profile"] == "large"
+    assert run["result"]["hnsw"]["max_neighbors"] == 32
+    assert run["result"]["chunks"] == 9
+
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    assert sorted(state["vectors"]) == sorted([kept_id, run["doc_id"]])
+    assert len(state["vectors"][run["doc_id"]]) == 3
+
+
+def test_switchover_interrupted_between_renames_is_finished_on_start(backend):
+    agent_id, doc_ids = _setup(backend)
+    before = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)["vectors"]
+
+    backend.run(REBUILD_WITH_CRASH, {"agent_id": agent_id}, crash=True)
+
+    recovered = backend.run(RECOVER, {"agent_id": agent_id}, app=False)
+    assert f"agent_{agent_id}" not in recovered["before"]  # the crash left the agent without a live collection
+    assert recovered["resolved"] == 1
+    assert recovered["after"] == [f"agent_{agent_id}"]
+    assert recovered["hnsw"]["max_neighbors"] == 32
+    assert recovered["plans"] == []
+
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    assert {doc_id: sorted(v["id"] for v in vectors) for doc_id, vectors in state["vectors"].items()} == {
+        doc_id: sorted(v["id"] for v in vectors) for doc_id, vectors in before.items()
+    }
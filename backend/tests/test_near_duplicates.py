@@ -0,0 +1,124 @@
+"""
+Near-duplicate suppression across documents (rag_pipeline.suppress_duplicates)
+A document whose chunks were dropped against another document's records it in
+Document.suppressed_by; deleting or replacing that other document must store the
+dropped chunks again (document_updates.restore_dependents).
+"""
+
+from scenarios import CREATE_AGENT, INDEX_STATE, paragraphs
+
+SHARED = paragraphs(3, seed=4)
+HANDBOOK_TEXT = "\n\n".join(SHARED + paragraphs(3, seed=5))
+# Repeats the handbook's shared paragraphs, which are dropped from it at upload
+POLICY_TEXT = "\n\n".join(paragraphs(2, seed=6) + SHARED)
+
+DOCUMENTS = """
+async def scenario(client):
+    response = await client.get(f"/api/agents/{ARGS['agent_id']}/documents")
+    return {document["id"]: document for document in response.json()}
+"""
+
+DELETE = """
+async def scenario(client):
+    response = await client.delete(f"/api/agents/documents/{ARGS['doc_id']}")
+    return {"status": response.status_code}
+"""
+
+REPLACE = """
+async def scenario(client):
+    response = await client.put(
+        f"/api/agents/documents/{ARGS['doc_id']}", files={"file": ("handbook.txt", ARGS["text"].encode(), "text/plain")}
+    )
+    return {"status": response.status_code, "body": response.json()}
+"""
+
+
+def _setup(backend):
+    created = backend.run(CREATE_AGENT, {
+        "agent": {"name": "Handbook", "chunk_size": 200, "chunk_overlap": 0},
+        "documents": [["handbook.txt", HANDBOOK_TEXT], ["policy.txt", POLICY_TEXT]],
+    })
+    handbook_id, policy_id = created["doc_ids"]
+    documents = backend.run(DOCUMENTS, {"agent_id": created["agent_id"]})
+    assert documents[policy_id]["chunk_count"] == 2
+    assert documents[policy_id]["suppressed_by"] == [handbook_id]
+    assert documents[handbook_id]["suppressed_by"] is None
+    return created["agent_id"], handbook_id, policy_id
+
+
+def _assert_restored(backend, agent_id, policy_id):
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    texts = sorted(vector["text"] for vector in state["vectors"][policy_id])
+    assert texts == sorted(POLICY_TEXT.split("\n\n"))
+    assert state["documents"][policy_id]["chunk_count"] == len(texts)
+    assert backend.run(DOCUMENTS, {"agent_id": agent_id})[policy_id]["suppressed_by"] is None
+
+
+def test_delete_restores_suppressed_chunks(backend):
+    agent_id, handbook_id, policy_id = _setup(backend)
+
+    assert backend.run(DELETE, {"doc_id": handbook_id})["status"] == 200
+
+    _assert_restored(backend, agent_id, policy_id)
+
+
+def test_replace_restores_suppressed_chunks(backend):
+    agent_id, handbook_id, policy_id = _setup(backend)
+
+    result = backend.run(REPLACE, {"doc_id": handbook_id, "text": "\n\n".join(paragraphs(4, seed=7))})
+    assert result["status"] == 200, result["body"]
+
+    _assert_restored(backend, agent_id, policy_id)
+
+
+def test_replace_keeping_shared_content_changes_nothing(backend):
+    agent_id, handbook_id, policy_id = _setup(backend)
+    before = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)["vectors"][policy_id]
+
+    result = backend.run(REPLACE, {"doc_id": handbook_id, "text": "\n\n".join(SHARED + paragraphs(1, seed=8))})
+    assert result["status"] == 200, result["body"]
+
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    assert sorted(v["id"] for v in state["vectors"][policy_id]) == sorted(v["id"] for v in before)
+    assert backend.run(DOCUMENTS, {"agent_id": agent_id})[policy_id]["suppressed_by"] == [handbook_id]
+
+
+# Uploads ARGS["text"] to a new agent counting MinHash computations, then copies it into a session collection
+SIGNATURES = """
+import dedup
+from rag_pipeline import rag_pipeline
+
+calls = []
+real_minhash = dedup.minhash
+
+def counting_minhash(text):
+    calls.append(text)
+    return real_minhash(text)
+
+dedup.minhash = counting_minhash
+
+async def scenario(client):
+    response = await client.post("/api/agents/create", json={"template_id": "general", "name": "Sessions", "chunk_size": 200, "chunk_overlap": 0})
+    agent_id = response.json()["id"]
+    response = await client.post(f"/api/agents/{agent_id}/upload", files={"file": ("notes.txt", ARGS["text"].encode(), "text/plain")})
+    assert response.status_code == 200, response.text
+    rag_pipeline.create_session_collection(agent_id, "00000000-0000-0000-0000-000000000001")
+    base = rag_pipeline.chroma_client.get_collection(f"agent_{agent_id}").get(include=["metadatas"])
+    session = rag_pipeline.chroma_client.get_collection(f"agent_{agent_id}_session_00000000-0000-0000-0000-000000000001").get(include=["metadatas"])
+    return {
+        "chunks": response.json()["chunks_processed"],
+        "minhash_calls": len(calls),
+        "base_keys": sorted(set().union(*(metadata.keys() for metadata in base["metadatas"]))),
+        "session_keys": sorted(set().union(*(metadata.keys() for metadata in session["metadatas"]))),
+    }
+"""
+
+
+def test_signatures_computed_once_and_kept_out_of_sessions(backend):
+    result = backend.run(SIGNATURES, {"text": "\n\n".join(paragraphs(5, seed=9))})
+
+    assert result["chunks"] == 5
+    assert result["minhash_calls"] == 5
+    assert "lsh_0" in result["base_keys"]
+    assert not [key for key in result["session_keys"] if key.startswith("lsh_")]
+    assert {"document_id", "filename", "chunk_index"} <= set(result["session_keys"])
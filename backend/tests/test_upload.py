@@ -0,0 +1,51 @@
+"""
+Single-document upload (POST /api/agents/{agent_id}/upload)
+Extraction, de-duplication, embedding and the Chroma write run off the event loop,
+so a slow upload does not hold up other requests.
+"""
+
+from scenarios import CREATE_AGENT, INDEX_STATE, paragraphs
+
+# Uploads with embedding slowed down by ARGS["embed_delay"] seconds, measuring the event loop's longest stall
+SLOW_UPLOAD = """
+import time
+from rag_pipeline import rag_pipeline
+
+real_embed = rag_pipeline.embed_chunks
+
+def slow_embed(chunks):
+    time.sleep(ARGS["embed_delay"])
+    return real_embed(chunks)
+
+rag_pipeline.embed_chunks = slow_embed
+
+async def scenario(client):
+    stalls = []
+    uploading = True
+
+    async def ticker():
+        while uploading:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append(time.perf_counter() - started - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    response = await client.post(
+        f"/api/agents/{ARGS['agent_id']}/upload", files={"file": ("slow.txt", ARGS["text"].encode(), "text/plain")}
+    )
+    uploading = False
+    await tick
+    return {"status": response.status_code, "body": response.json(), "max_stall": max(stalls)}
+"""
+
+
+def test_upload_does_not_block_the_event_loop(backend):
+    agent_id = backend.run(CREATE_AGENT, {"agent": {"name": "Upload", "chunk_size": 200, "chunk_overlap": 0}, "documents": []})["agent_id"]
+
+    result = backend.run(SLOW_UPLOAD, {"agent_id": agent_id, "text": "\n\n".join(paragraphs(5, seed=41)), "embed_delay": 1.0})
+    assert result["status"] == 200, result["body"]
+    assert result["body"]["chunks_processed"] == 5
+    assert result["max_stall"] < 0.5
+
+    state = backend.run(INDEX_STATE, {"agent_id": agent_id}, app=False)
+    assert len(state["vectors"][result["body"]["document"]["id"]]) == 5
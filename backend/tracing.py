@@ -0,0 +1,165 @@
+"""
+Distributed tracing (OpenTelemetry, optional)
+Shared by the voice worker and the backend so one trace covers a voice question end
+to end: worker tool call -> HTTP hop -> query_session -> DB / embedding / Chroma.
+
+Disabled unless TRACING_EXPORTER is set and the opentelemetry SDK is installed; when
+disabled every helper is a no-op. Sampling is parent-based: the worker samples a
+TRACING_SAMPLE_RATIO fraction of questions and the backend follows its decision
+(carried in the W3C traceparent header).
+"""
+
+import contextlib
+import logging
+import os
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()  # none | file | otlp | console
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "0.1"))
+
+_tracer = None
+_provider = None
+_NOOP = contextlib.nullcontext()
+
+
+def setup_tracing(service_name: str) -> bool:
+    """Configure the tracer provider for this process, returns True if tracing is active"""
+    global _tracer, _provider
+    if _tracer is not None:
+        return True
+    if TRACING_EXPORTER in ("", "none"):
+        return False
+    
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        logger.warning("⚠️ TRACING_EXPORTER is set but opentelemetry-sdk is not installed, tracing disabled")
+        return False
+    
+    if TRACING_EXPORTER == "otlp":
+        # Endpoint / headers from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    elif TRACING_EXPORTER == "file":
+        # One JSON span per line, appended (worker job processes share the file)
+        exporter = ConsoleSpanExporter(
+            out=open(TRACING_FILE, "a", buffering=1),
+            formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    else:
+        exporter = ConsoleSpanExporter()
+    
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    # Spans are exported from a background thread, never on the request path
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    _tracer = trace.get_tracer(service_name)
+    
+    logger.info(f"✅ Tracing enabled for {service_name} ({TRACING_EXPORTER}, sample ratio {TRACING_SAMPLE_RATIO})")
+    return True
+
+
+def span(name: str, **attributes):
+    """Context manager for a child span of the current one (no-op when tracing is off)"""
+    if _tracer is None:
+        return _NOOP
+    return _tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+def set_attributes(**attributes) -> None:
+    """Add attributes to the current span"""
+    if _tracer is None:
+        return
+    from opentelemetry import trace
+    trace.get_current_span().set_attributes(attributes)
+
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Add the current trace context (traceparent) to outgoing HTTP headers"""
+    headers = headers if headers is not None else {}
+    if _tracer is not None:
+        from opentelemetry.propagate import inject
+        inject(headers)
+    return headers
+
+
+async def flush() -> None:
+    """Export buffered spans (worker job shutdown)"""
+    if _provider is not None:
+        _provider.force_flush()
+
+
+def instrument_engine(sync_engine) -> None:
+    """DB spans for every statement on an engine (pass async_engine.sync_engine for async engines)"""
+    if _tracer is None:
+        return
+    from sqlalchemy import event
+    
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span_cm = _tracer.start_as_current_span(
+            "db." + statement.split(None, 1)[0].lower(),
+            attributes={"db.system": sync_engine.dialect.name, "db.statement": statement[:500]},
+        )
+        span_cm.__enter__()
+        context._trace_span = span_cm
+    
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span_cm = getattr(context, "_trace_span", None)
+        if span_cm is not None:
+            span_cm.__exit__(None, None, None)
+            context._trace_span = None
+    
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        context = exception_context.execution_context
+        span_cm = getattr(context, "_trace_span", None) if context is not None else None
+        if span_cm is not None:
+            error = exception_context.original_exception
+            span_cm.__exit__(type(error), error, error.__traceback__)
+            context._trace_span = None
+
+
+class TracingMiddleware:
+    """ASGI middleware continuing the caller's trace (traceparent) with a server span per request"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if _tracer is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        from opentelemetry import trace
+        from opentelemetry.propagate import extract
+        
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.get_current_span().set_attribute("http.status_code", message["status"])
+            await send(message)
+        
+        with _tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            context=extract(carrier),
+            kind=trace.SpanKind.SERVER,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        ) as server_span:
+            await self.app(scope, receive, send_wrapper)
+            # Name by route template once routing has happened
+            route = scope.get("route")
+            if route is not None:
+                server_span.update_name(f"{scope['method']} {route.path}")
@@ -0,0 +1,68 @@
+"""
+Turn latency tracking for the voice worker
+Measures time-to-first-audio: from the end of user speech to the agent starting to speak
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Optional JSONL file that collects one record per turn (used by benchmarks/compare_rag_modes.py)
+TURN_LATENCY_LOG = os.getenv("TURN_LATENCY_LOG")
+
+
+class TurnLatencyTracker:
+    """Records time-to-first-audio per conversational turn for one session"""
+    
+    def __init__(self, agent_id: str, session_id: str, rag_mode: str):
+        self.agent_id = agent_id
+        self.session_id = session_id
+        self.rag_mode = rag_mode
+        self._user_stopped_at: Optional[float] = None
+        self.turns = 0
+    
+    def attach(self, session) -> None:
+        """Subscribe to AgentSession state changes"""
+        session.on("user_state_changed", self._on_user_state_changed)
+        session.on("agent_state_changed", self._on_agent_state_changed)
+    
+    def _on_user_state_changed(self, event) -> None:
+        if event.old_state == "speaking" and event.new_state == "listening":
+            self._user_stopped_at = time.perf_counter()
+        elif event.new_state == "speaking":
+            # User started (or resumed) talking, previous end-of-speech no longer applies
+            self._user_stopped_at = None
+    
+    def _on_agent_state_changed(self, event) -> None:
+        if event.new_state != "speaking" or self._user_stopped_at is None:
+            return
+        
+        ttfa_ms = (time.perf_counter() - self._user_stopped_at) * 1000
+        self._user_stopped_at = None
+        self.turns += 1
+        self.record(ttfa_ms)
+    
+    def record(self, ttfa_ms: float) -> None:
+        """Log a turn and append it to TURN_LATENCY_LOG when configured"""
+        logger.info(f"⏱️ Time to first audio: {ttfa_ms:.0f} ms (rag_mode={self.rag_mode}, turn={self.turns})")
+        
+        if not TURN_LATENCY_LOG:
+            return
+        
+        record = {
+            "agent_id": self.agent_id,
+            "session_id": self.session_id,
+            "rag_mode": self.rag_mode,
+            "turn": self.turns,
+            "ttfa_ms": round(ttfa_ms, 1),
+            "timestamp": time.time(),
+        }
+        try:
+            with open(TURN_LATENCY_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write turn latency record: {e}")
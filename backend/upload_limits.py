@@ -0,0 +1,114 @@
+"""
+Upload size and memory limits
+Multipart bodies are parsed by Starlette, which spools file parts to disk past 1MB, and
+spool_upload copies them on in 1MB blocks, so an upload never sits in memory whole.
+This middleware bounds the rest: a per-request cap (MAX_UPLOAD_MB, MAX_BULK_UPLOAD_MB for
+bulk uploads) rejected from the Content-Length header before any of the body is read (or
+mid-stream for chunked bodies), and a global budget of upload bytes being received at
+once (UPLOAD_MAX_INFLIGHT_MB).
+"""
+
+import json
+import os
+
+from fastapi import HTTPException
+
+import metrics
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+MAX_BULK_UPLOAD_BYTES = int(float(os.getenv("MAX_BULK_UPLOAD_MB", "500")) * 1024 * 1024)
+MAX_INFLIGHT_BYTES = int(float(os.getenv("UPLOAD_MAX_INFLIGHT_MB", "256")) * 1024 * 1024)
+UPLOAD_RETRY_AFTER = os.getenv("UPLOAD_RETRY_AFTER_SECONDS", "5")
+
+
+def _header(scope, name: bytes):
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class UploadLimitMiddleware:
+    """ASGI middleware enforcing per-request and global limits on multipart uploads"""
+
+    def __init__(
+        self,
+        app,
+        max_upload_bytes: int = MAX_UPLOAD_BYTES,
+        max_bulk_upload_bytes: int = MAX_BULK_UPLOAD_BYTES,
+        max_inflight_bytes: int = MAX_INFLIGHT_BYTES
+    ):
+        self.app = app
+        self.max_upload_bytes = max_upload_bytes
+        self.max_bulk_upload_bytes = max_bulk_upload_bytes
+        self.max_inflight_bytes = max_inflight_bytes
+        self.inflight_bytes = 0
+
+    async def __call__(self, scope, receive, send):
+        content_type = _header(scope, b"content-type") if scope["type"] == "http" else None
+        if not content_type or not content_type.startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        cap = self.max_bulk_upload_bytes if scope["path"].endswith("/upload/bulk") else self.max_upload_bytes
+        length = _header(scope, b"content-length")
+        try:
+            length = int(length) if length is not None else None
+        except ValueError:
+            length = None
+
+        # Over the cap: answer before reading a byte of the body
+        if length is not None and length > cap:
+            metrics.UPLOADS_REJECTED.labels("too_large").inc()
+            await self._reject(send, 413, self._too_large_detail(cap))
+            return
+
+        # Bodies of unknown length reserve the full per-request cap
+        reserved = length if length is not None else cap
+        if self.inflight_bytes and self.inflight_bytes + reserved > self.max_inflight_bytes:
+            metrics.UPLOADS_REJECTED.labels("busy").inc()
+            await self._reject(
+                send, 503, "Too many uploads in progress, retry shortly",
+                [(b"retry-after", UPLOAD_RETRY_AFTER.encode())],
+            )
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > cap:
+                    # Content-Length was missing or understated; FastAPI re-raises HTTPException from body parsing
+                    metrics.UPLOADS_REJECTED.labels("too_large").inc()
+                    raise HTTPException(status_code=413, detail=self._too_large_detail(cap))
+            return message
+
+        self.inflight_bytes += reserved
+        metrics.UPLOAD_INFLIGHT_BYTES.set(self.inflight_bytes)
+        try:
+            await self.app(scope, limited_receive, send)
+        finally:
+            self.inflight_bytes -= reserved
+            metrics.UPLOAD_INFLIGHT_BYTES.set(self.inflight_bytes)
+
+    @staticmethod
+    def _too_large_detail(cap: int) -> str:
+        return f"Upload exceeds the {cap // (1024 * 1024)}MB limit"
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, headers=()):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+                *headers,
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
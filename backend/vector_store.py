@@ -0,0 +1,119 @@
+"""
+Vector store and embedding setup shared by the backend and the voice worker
+Importing this module opens nothing. A ChromaDB persistent directory must only be opened
+by one process, so when the worker reads collections itself (RAG_RETRIEVAL_MODE=local)
+both processes talk to one Chroma server (CHROMA_SERVER_URL, started with
+`chroma run --path <CHROMADB_PATH>`) instead of each opening the directory.
+"""
+
+import logging
+import os
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import chromadb
+from chromadb.config import Settings
+
+logger = logging.getLogger(__name__)
+
+
+def chroma_server_url() -> Optional[str]:
+    """Chroma server shared by the backend and the worker, None to open CHROMADB_PATH in-process"""
+    return os.getenv("CHROMA_SERVER_URL") or None
+
+
+def open_chroma_client(path: str):
+    """Client for the Chroma server if one is configured, else the persistent directory at path"""
+    server_url = chroma_server_url()
+    if server_url:
+        url = urlparse(server_url)
+        ssl = url.scheme == "https"
+        return chromadb.HttpClient(
+            host=url.hostname,
+            port=url.port or (443 if ssl else 8000),
+            ssl=ssl,
+            settings=Settings(anonymized_telemetry=False)
+        )
+    return chromadb.PersistentClient(
+        path=path,
+        settings=Settings(
+            anonymized_telemetry=False,
+            allow_reset=True
+        )
+    )
+
+
+def dir_size(path: str) -> int:
+    """Total size in bytes of the files under a directory, e.g. a persistent Chroma store or one of its segments"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def load_embeddings(google_api_key: Optional[str] = None, use_local: bool = False):
+    """Embedding model for chunks and questions, with automatic fallback to local on quota errors"""
+    # Deterministic stub for load tests and benchmarks
+    if os.getenv("USE_STUB_EMBEDDINGS", "false").lower() == "true":
+        logger.info("🧪 Using STUB embeddings (hashed bag-of-words, benchmarks only)")
+        from stub_embeddings import StubEmbeddings
+        return StubEmbeddings()
+
+    # Force local embeddings if configured
+    if use_local:
+        return _local_embeddings()
+
+    # Try Google embeddings first
+    if google_api_key:
+        try:
+            logger.info("☁️ Attempting to use GOOGLE embeddings (embedding-001)")
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            embeddings = GoogleGenerativeAIEmbeddings(
+                model="models/embedding-001",
+                google_api_key=google_api_key
+            )
+            # Test with a small embedding to check quota
+            embeddings.embed_query("test")
+            logger.info("✅ Google embeddings initialized successfully")
+            return embeddings
+        except Exception as e:
+            error_msg = str(e)
+            if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg or "Quota exceeded" in error_msg:
+                logger.warning(f"⚠️ Google API quota exceeded, falling back to local embeddings")
+                logger.warning(f"   Error: {error_msg[:200]}")
+            else:
+                logger.warning(f"⚠️ Google embeddings failed, falling back to local: {error_msg[:200]}")
+
+    # Fallback to local embeddings
+    return _local_embeddings()
+
+
+def _local_embeddings():
+    logger.info("🏠 Using LOCAL embeddings (sentence-transformers/all-MiniLM-L6-v2)")
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name="all-MiniLM-L6-v2",
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+
+def format_results(results: Dict) -> Dict:
+    """Context and sources from a collection.query() result for one question"""
+    if not results['documents'] or not results['documents'][0]:
+        return {
+            "context": "",
+            "sources": []
+        }
+
+    chunks = results['documents'][0]
+    sources = {metadata['filename'] for metadata in results['metadatas'][0]}
+    return {
+        "context": "\n\n".join(chunks),
+        "sources": list(sources),
+        "num_chunks": len(chunks)
+    }
@@ -0,0 +1,169 @@
+"""
+Startup warm-up of hot agent indexes
+After a restart the first query for an agent pays ChromaDB's segment load and HNSW
+deserialization, which shows up as a slow first voice answer. In the background,
+the warm-up ranks agents by recent use and query volume and runs one throwaway
+search per collection (which also initializes the embedding model) until the
+estimated index memory reaches WARMUP_MEMORY_BUDGET_MB. Progress is part of the
+readiness signal (GET /health/ready).
+
+The probes load segments where the index lives: in this process, or in the Chroma
+server when CHROMA_SERVER_URL is set, which the worker's local retrieval reads as well
+(the worker warms its own embedding model in prewarm). A server's segment files are not
+on this disk, so their memory is estimated from the chunk count alone. RAGClient's prefetch cache is
+per session and has nothing to preload.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import Agent
+from rag_pipeline import rag_pipeline
+from vector_store import dir_size
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_MAX_AGENTS = int(os.getenv("WARMUP_MAX_AGENTS", "20"))
+WARMUP_MEMORY_BUDGET_MB = float(os.getenv("WARMUP_MEMORY_BUDGET_MB", "512"))
+WARMUP_GATES_READINESS = os.getenv("WARMUP_GATES_READINESS", "true").lower() == "true"  # not ready until done
+
+
+def vector_segment_bytes(chroma_path: str, collection_id: str) -> int:
+    """On-disk size of a collection's HNSW segment, roughly what loading it costs in memory"""
+    db_file = os.path.join(chroma_path, "chroma.sqlite3")
+    try:
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'", (collection_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+    return sum(dir_size(os.path.join(chroma_path, row[0])) for row in rows)
+
+
+def collection_footprint(agent_id: str, dim: int) -> Optional[Dict]:
+    """Chunk count and estimated memory of an agent's base collection, None if it has none"""
+    try:
+        collection = rag_pipeline.chroma_client.get_collection(f"agent_{agent_id}")
+    except Exception:
+        return None
+    chunks = collection.count()
+    # Small collections live in Chroma's brute-force buffer until the first HNSW flush
+    raw_vectors = chunks * dim * 4
+    if not rag_pipeline.chroma_local:
+        return {"chunks": chunks, "bytes": raw_vectors}
+    return {"chunks": chunks, "bytes": max(raw_vectors, vector_segment_bytes(rag_pipeline.chroma_path, str(collection.id)))}
+
+
+class IndexWarmup:
+    """Background preload of the most active agents' collections"""
+    
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_agents: int = WARMUP_MAX_AGENTS,
+        memory_budget_mb: float = WARMUP_MEMORY_BUDGET_MB,
+        enabled: bool = WARMUP_ENABLED
+    ):
+        self.session_factory = session_factory
+        self.max_agents = max_agents
+        self.budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+        self.progress = {"state": "pending" if enabled else "disabled"}
+    
+    @property
+    def done(self) -> bool:
+        return self.progress["state"] in ("done", "failed", "disabled")
+    
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def hot_agents(self) -> List[str]:
+        """Agents with a knowledge base, most recently used first, then by query volume"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Agent.id)
+                .where(Agent.document_count > 0)
+                .order_by(Agent.last_used.is_(None), Agent.last_used.desc(), Agent.query_count.desc())
+                .limit(self.max_agents)
+            )
+            return list(result.scalars())
+    
+    async def _run(self) -> None:
+        started = time.perf_counter()
+        try:
+            agent_ids = await self.hot_agents()
+            self.progress = {
+                "state": "running",
+                "agents_total": len(agent_ids),
+                "agents_warmed": 0,
+                "agents_skipped": 0,
+                "chunks_loaded": 0,
+                "bytes_loaded": 0,
+                "budget_bytes": self.budget_bytes,
+                "started_at": datetime.utcnow().isoformat(),
+            }
+            if agent_ids:
+                logger.info(f"🔥 Warming up {len(agent_ids)} agent indexes (budget {self.budget_bytes // (1024 * 1024)} MB)")
+            
+            # One embedding for all probes, computing it also initializes the embedding model
+            embedding = await asyncio.to_thread(rag_pipeline.embeddings.embed_query, "warm up") if agent_ids else None
+            
+            for agent_id in agent_ids:
+                info = await asyncio.to_thread(collection_footprint, agent_id, len(embedding))
+                if info is None or info["chunks"] == 0:
+                    self.progress["agents_skipped"] += 1
+                    continue
+                if self.progress["bytes_loaded"] + info["bytes"] > self.budget_bytes:
+                    # Colder agents may still fit, keep going
+                    self.progress["agents_skipped"] += 1
+                    continue
+                
+                if not await asyncio.to_thread(rag_pipeline.warm_collection, agent_id, embedding):
+                    self.progress["agents_skipped"] += 1
+                    continue
+                self.progress["agents_warmed"] += 1
+                self.progress["chunks_loaded"] += info["chunks"]
+                self.progress["bytes_loaded"] += info["bytes"]
+            
+            self.progress["state"] = "done"
+            self.progress["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if agent_ids:
+                logger.info(
+                    f"🔥 Warm-up done: {self.progress['agents_warmed']} agents, "
+                    f"{self.progress['bytes_loaded'] / 1e6:.1f} MB, {self.progress['duration_ms'] / 1000:.1f}s"
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Warm-up is an optimization, never keep the backend from serving
+            self.progress["state"] = "failed"
+            self.progress["error"] = str(e)
+            logger.error(f"❌ Index warm-up failed: {e}")
+
+
+# Singleton instance
+index_warmup = IndexWarmup()
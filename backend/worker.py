@@ -14,7 +14,10 @@ from dotenv import load_dotenv
 from livekit.agents import (
     Agent,
     AutoSubscribe,
+    ChatContext,
+    ChatMessage,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
     function_tool,
@@ -25,6 +28,11 @@ from livekit.agents.voice import AgentSession
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 from livekit.plugins import google, bey
 
+from rag_client import RAG_RETRIEVAL_MODE, RAGClient, format_rag_result, load_local_retriever
+from turn_latency import TurnLatencyTracker
+from worker_load import WORKER_LOAD_THRESHOLD, WorkerLoadMonitor, report_loop_lag
+import tracing
+
 # Load environment variables
 load_dotenv()
 
@@ -38,6 +46,19 @@ LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
 LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
 LIVEKIT_URL = os.getenv("LIVEKIT_URL", "ws://localhost:7880")
 BEY_API_KEY = os.getenv("BEY_API_KEY")  # Beyond Presence avatar API key
+# Max time proactive mode waits for retrieval before letting the model answer without context
+PROACTIVE_RAG_TIMEOUT = float(os.getenv("PROACTIVE_RAG_TIMEOUT", "2.0"))
+
+
+def prewarm(proc: JobProcess):
+    """Per job process setup: tracing, and the local RAG retriever (local retrieval mode only)"""
+    tracing.setup_tracing("xebia-voice-worker")
+    
+    if RAG_RETRIEVAL_MODE == "local":
+        try:
+            load_local_retriever().warm()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not preload local RAG retriever, will use backend API: {e}")
 
 
 async def entrypoint(ctx: JobContext):
@@ -86,15 +107,18 @@ async def entrypoint(ctx: JobContext):
                 agent_name = agent_data.get("name", "AI Assistant")
                 base_system_prompt = agent_data.get("system_prompt", "You are a helpful AI assistant.")
                 template_id = agent_data.get("template_id", "general")
+                rag_mode = agent_data.get("rag_mode") or "tool"
                 
                 logger.info(f"✅ Loaded agent config from backend API")
     except Exception as e:
         logger.error(f"❌ Failed to fetch agent config from backend: {e}")
         # Fallback to defaults
+        agent_data = {}
         agent_id = "default"
         agent_name = "AI Assistant"
         base_system_prompt = "You are a helpful AI assistant."
         template_id = "general"
+        rag_mode = "tool"
     
     # LOG: Show what we extracted
     logger.info(f"📋 Final Configuration:")
@@ -103,6 +127,7 @@ async def entrypoint(ctx: JobContext):
     logger.info(f"  - Agent Name: {agent_name}")
     logger.info(f"  - Base System Prompt (first 200 chars): {base_system_prompt[:200]}...")
     logger.info(f"  - Template ID: {template_id}")
+    logger.info(f"  - RAG Mode: {rag_mode}")
     
     # Initialize MCP servers if configured
     logger.info("=" * 80)
@@ -166,7 +191,16 @@ async def entrypoint(ctx: JobContext):
     logger.info("=" * 80)
     
     # Enhance system prompt with RAG instructions
-    system_prompt = f"""{base_system_prompt}
+    if rag_mode == "proactive":
+        system_prompt = f"""{base_system_prompt}
+
+IMPORTANT INSTRUCTIONS FOR KNOWLEDGE BASE:
+- Relevant excerpts from the knowledge base are added to the conversation automatically before you answer each user message
+- Base your answers primarily on these excerpts when they are relevant to the question
+- If the excerpts don't contain relevant information, you can use your general knowledge
+- Always cite sources when using information from the documents"""
+    else:
+        system_prompt = f"""{base_system_prompt}
 
 IMPORTANT INSTRUCTIONS FOR KNOWLEDGE BASE:
 - You have access to a knowledge base through the 'query_documents' function
@@ -202,6 +236,19 @@ IMPORTANT FOR MCP TOOL USAGE:
     
     logger.info(f"🎯 Final Enhanced System Prompt: {system_prompt[:200]}...")
     
+    # One RAG client per session, shared by the tool and the proactive turn hook
+    rag_client = RAGClient(BACKEND_URL, session_id, agent_id=agent_id)
+    ctx.add_shutdown_callback(rag_client.close)
+    ctx.add_shutdown_callback(tracing.flush)
+    
+    # This job's event-loop lag feeds the worker's load value (see worker_load.py)
+    lag_reporter = asyncio.create_task(report_loop_lag())
+    
+    async def stop_lag_reporter():
+        lag_reporter.cancel()
+    
+    ctx.add_shutdown_callback(stop_lag_reporter)
+    
     # Define RAG function tool (following official LiveKit Agents 1.0 pattern)
     @function_tool()
     async def query_documents(
@@ -229,32 +276,15 @@ IMPORTANT FOR MCP TOOL USAGE:
         
         try:
             logger.info(f"📚 Querying backend RAG API...")
-            
-            # Call backend RAG API
-            async with aiohttp.ClientSession() as http_session:
-                url = f"{BACKEND_URL}/api/sessions/{session_id}/query"
-                payload = {"question": question}
-                
-                async with http_session.post(url, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        context_text = data.get("context", "")
-                        sources = data.get("sources", [])
-                        
-                        # Format response with sources
-                        if sources:
-                            source_list = ", ".join(sources[:3])  # Top 3 sources
-                            result = f"{context_text}\n\nSources: {source_list}"
-                        else:
-                            result = context_text
-                        
-                        logger.info(f"RAG returned {len(context_text)} chars, {len(sources)} sources")
-                        return result
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"RAG API error: {response.status} - {error_text}")
-                        return f"I couldn't access the documents right now. I can still help with general questions."
-                        
+            # Root of the trace for this question (worker -> backend -> DB / embedding / Chroma)
+            with tracing.span("worker.query_documents", session_id=session_id, agent_id=agent_id):
+                data = await rag_client.get(question)
+            return format_rag_result(data)
+        
+        except RuntimeError as e:
+            logger.error(str(e))
+            return f"I couldn't access the documents right now. I can still help with general questions."
+        
         except Exception as e:
             logger.error(f"Error querying documents: {str(e)}")
             return "I encountered an error while searching the documents. Let me try to help with general knowledge."
@@ -263,8 +293,13 @@ IMPORTANT FOR MCP TOOL USAGE:
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
     
     # LOG: Tool registration
-    logger.info(f"🔧 Registering RAG tool: query_documents")
-    logger.info(f"🔧 Tool description: {query_documents.__doc__[:100]}...")
+    if rag_mode == "proactive":
+        logger.info(f"🔧 Proactive RAG mode: context injected on user turn completion (no tool round trip)")
+        agent_tools = []
+    else:
+        logger.info(f"🔧 Registering RAG tool: query_documents")
+        logger.info(f"🔧 Tool description: {query_documents.__doc__[:100]}...")
+        agent_tools = [query_documents]
     
     # Create custom agent class (following official LiveKit Agents 1.0 pattern)
     class XebiaVoiceAgent(Agent):
@@ -273,15 +308,43 @@ IMPORTANT FOR MCP TOOL USAGE:
         def __init__(self):
             logger.info(f"🤖 Initializing XebiaVoiceAgent with:")
             logger.info(f"   Instructions (first 200 chars): {system_prompt[:200]}...")
-            logger.info(f"   Tools: [query_documents]")
+            logger.info(f"   Tools: {'[query_documents]' if agent_tools else '[] (proactive RAG)'}")
             
             super().__init__(
                 instructions=system_prompt,  # Pass the enhanced system prompt
-                tools=[query_documents],  # Attach RAG tool
+                tools=agent_tools,  # Attach RAG tool (tool mode only)
             )
             
             logger.info(f"✅ XebiaVoiceAgent initialized successfully")
         
+        async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage) -> None:
+            """Proactive mode: retrieve context for the finished user turn and inject it before generation"""
+            if rag_mode != "proactive":
+                return
+            
+            question = new_message.text_content
+            if not question:
+                return
+            
+            try:
+                with tracing.span("worker.proactive_rag", session_id=session_id, agent_id=agent_id):
+                    data = await asyncio.wait_for(rag_client.get(question), timeout=PROACTIVE_RAG_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Proactive RAG timed out after {PROACTIVE_RAG_TIMEOUT}s, answering without context")
+                return
+            except Exception as e:
+                logger.error(f"Error retrieving proactive RAG context: {str(e)}")
+                return
+            
+            if not data.get("context"):
+                return
+            
+            turn_ctx.add_message(
+                role="assistant",
+                content=f"Relevant information from the knowledge base for the user's message:\n\n{format_rag_result(data)}"
+            )
+            logger.info(f"📚 Injected RAG context with {len(data.get('sources', []))} sources")
+        
         async def on_enter(self) -> None:
             """Called when agent enters the session - send initial greeting"""
             greeting = f"Hello! I'm {agent_name}. How can I help you today?"
@@ -302,9 +365,17 @@ IMPORTANT FOR MCP TOOL USAGE:
     )
     
     if mcp_servers_list:
-        logger.info(f"✅ Agent initialized with Gemini Realtime API, 1 RAG tool, and {len(mcp_servers_list)} MCP server(s)")
+        logger.info(f"✅ Agent initialized with Gemini Realtime API, {len(agent_tools)} RAG tool(s), and {len(mcp_servers_list)} MCP server(s)")
     else:
-        logger.info(f"Agent initialized with Gemini Realtime API and 1 tool")
+        logger.info(f"Agent initialized with Gemini Realtime API and {len(agent_tools)} tool(s)")
+    
+    # Track time-to-first-audio per turn so RAG modes can be compared
+    TurnLatencyTracker(agent_id, session_id, rag_mode).attach(session)
+    
+    # Speculatively retrieve while the user is still talking; the final turn reuses the closest result
+    @session.on("user_input_transcribed")
+    def _on_user_input_transcribed(event):
+        rag_client.prefetch(event.transcript)
     
     # Initialize Beyond Presence Avatar (if API key is configured)
     logger.info("=" * 80)
@@ -400,10 +471,19 @@ if __name__ == "__main__":
     logger.info("Starting LiveKit Voice Agent Worker (Gemini Realtime)...")
     logger.info(f"Backend URL: {BACKEND_URL}")
     logger.info(f"LiveKit URL: {LIVEKIT_URL}")
+    logger.info(f"RAG retrieval mode: {RAG_RETRIEVAL_MODE}")
     logger.info("Using Gemini 2.5 Flash Realtime API for ultra-low latency")
     
+    # Stop taking new rooms before CPU, session count or event-loop lag degrade running sessions
+    load_monitor = WorkerLoadMonitor()
+    logger.info(f"Load threshold: {WORKER_LOAD_THRESHOLD}, max sessions: {load_monitor.max_sessions}")
+    
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
+            request_fnc=load_monitor.request_fnc,
+            load_fnc=load_monitor,
+            load_threshold=WORKER_LOAD_THRESHOLD,
         )
     )
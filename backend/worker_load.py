@@ -0,0 +1,205 @@
+"""
+Load reporting for the voice worker
+Combines CPU, active sessions and event-loop lag into one load value so LiveKit
+stops dispatching rooms to this worker before every session on it degrades.
+Sessions run in separate job processes, so each job samples its own event loop
+(report_loop_lag) and writes the lag to a per-worker directory the monitor reads.
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WORKER_MAX_SESSIONS = int(os.getenv("WORKER_MAX_SESSIONS", "8"))  # Hard cap, extra jobs are rejected
+WORKER_LOAD_THRESHOLD = float(os.getenv("WORKER_LOAD_THRESHOLD", "0.75"))  # Stop accepting dispatch above this
+WORKER_CPU_BUDGET = float(os.getenv("WORKER_CPU_BUDGET", "0.8"))  # CPU fraction that counts as fully loaded
+WORKER_LAG_BUDGET_MS = float(os.getenv("WORKER_LAG_BUDGET_MS", "100"))  # Event-loop lag that counts as fully loaded
+WORKER_STATUS_PORT = int(os.getenv("WORKER_STATUS_PORT", "8082"))  # 0 disables the status endpoint
+
+_SMOOTHING = 0.5  # EWMA weight of the newest CPU / lag sample
+_LAG_INTERVAL = 0.5  # seconds between event-loop lag samples in a job process
+_LAG_DIR_ENV = "XEBIA_WORKER_LAG_DIR"  # set by the monitor, inherited by the job processes it spawns
+_LAG_ABANDONED = 30.0  # seconds without a sample after which a job's lag file is left over, not a stalled loop
+
+
+async def report_loop_lag(interval: float = _LAG_INTERVAL) -> None:
+    """Run as a task in each job: sample this process' event-loop lag for the worker's load monitor"""
+    lag_dir = os.environ.get(_LAG_DIR_ENV)
+    if not lag_dir:
+        return
+    
+    path = os.path.join(lag_dir, str(os.getpid()))
+    lag_ms = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            sample = max(0.0, (time.perf_counter() - started - interval) * 1000)
+            lag_ms = _SMOOTHING * sample + (1 - _SMOOTHING) * lag_ms
+            try:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(f"{lag_ms:.1f}")
+                os.replace(tmp_path, path)
+            except OSError:
+                pass
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class WorkerLoadMonitor:
+    """load_fnc / request_fnc for WorkerOptions plus a JSON status endpoint"""
+    
+    def __init__(
+        self,
+        max_sessions: int = WORKER_MAX_SESSIONS,
+        cpu_budget: float = WORKER_CPU_BUDGET,
+        lag_budget_ms: float = WORKER_LAG_BUDGET_MS,
+        threshold: float = WORKER_LOAD_THRESHOLD,
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.cpu_budget = cpu_budget
+        self.lag_budget_ms = lag_budget_ms
+        self.threshold = threshold
+        
+        self._worker = None
+        self._cpu = 0.0
+        self._lag_ms = 0.0
+        self._snapshot: Dict = {}
+        self._lock = threading.Lock()
+        self._status_server: Optional[ThreadingHTTPServer] = None
+        self._status_server_failed = False  # port was unavailable, don't retry on every load tick
+        
+        # Job processes report their loop lag here (one file per process, named by pid)
+        self.lag_dir = tempfile.mkdtemp(prefix="xebia-worker-lag-")
+        os.environ[_LAG_DIR_ENV] = self.lag_dir
+        atexit.register(shutil.rmtree, self.lag_dir, True)
+        
+        # First cpu_percent() call only primes the counter
+        psutil.cpu_percent(interval=None)
+    
+    def __call__(self, worker) -> float:
+        """load_fnc: called periodically by the worker (from an executor thread)"""
+        self._worker = worker
+        if self._status_server is None and not self._status_server_failed and WORKER_STATUS_PORT:
+            self.start_status_server(WORKER_STATUS_PORT)
+        
+        cpu = psutil.cpu_percent(interval=None) / 100
+        self._cpu = _SMOOTHING * cpu + (1 - _SMOOTHING) * self._cpu
+        # Already smoothed by each job process; the slowest loop decides
+        self._lag_ms, reporting = self._job_loop_lag_ms()
+        
+        active_sessions = self.active_sessions()
+        components = {
+            "cpu": self._cpu / self.cpu_budget,
+            "sessions": active_sessions / self.max_sessions,
+            "event_loop_lag": self._lag_ms / self.lag_budget_ms,
+        }
+        # The most constrained resource decides
+        load = min(1.0, max(components.values()))
+        
+        with self._lock:
+            self._snapshot = {
+                "load": round(load, 3),
+                "threshold": self.threshold,
+                "accepting_jobs": load < self.threshold and active_sessions < self.max_sessions,
+                "active_sessions": active_sessions,
+                "max_sessions": self.max_sessions,
+                "cpu_percent": round(self._cpu * 100, 1),
+                "event_loop_lag_ms": round(self._lag_ms, 1),
+                "jobs_reporting_lag": reporting,
+                "components": {name: round(value, 3) for name, value in components.items()},
+                "updated_at": time.time(),
+            }
+        return load
+    
+    def active_sessions(self) -> int:
+        if self._worker is None:
+            return 0
+        return len(getattr(self._worker, "active_jobs", []) or [])
+    
+    def _job_loop_lag_ms(self) -> Tuple[float, int]:
+        """Worst event-loop lag reported by the job processes, and how many are reporting"""
+        try:
+            entries = [entry for entry in os.scandir(self.lag_dir) if entry.name.isdigit()]
+        except OSError:
+            return 0.0, 0
+        
+        now = time.time()
+        worst = 0.0
+        reporting = 0
+        for entry in entries:
+            try:
+                age = now - entry.stat().st_mtime
+                if age > _LAG_ABANDONED or not psutil.pid_exists(int(entry.name)):
+                    # Job process exited (or its job ended) without removing its file
+                    os.unlink(entry.path)
+                    continue
+                with open(entry.path) as f:
+                    reported = float(f.read() or 0)
+            except (OSError, ValueError):
+                continue
+            # A blocked loop stops reporting: the time since its last sample is lag too
+            stalled_ms = max(0.0, age - _LAG_INTERVAL) * 1000
+            worst = max(worst, reported, stalled_ms)
+            reporting += 1
+        return worst, reporting
+    
+    async def request_fnc(self, request) -> None:
+        """Hard per-worker concurrency limit on top of load-based dispatch"""
+        active_sessions = self.active_sessions()
+        if active_sessions >= self.max_sessions:
+            logger.warning(f"🚫 Rejecting job {request.id}: {active_sessions}/{self.max_sessions} sessions active")
+            await request.reject()
+            return
+        await request.accept()
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self._snapshot)
+    
+    def start_status_server(self, port: int) -> None:
+        """Serve the latest load snapshot as JSON on GET /status"""
+        monitor = self
+        
+        class _StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/status"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = json.dumps(monitor.snapshot()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        try:
+            self._status_server = ThreadingHTTPServer(("0.0.0.0", port), _StatusHandler)
+        except OSError as e:
+            logger.warning(f"⚠️ Worker status endpoint disabled, port {port} unavailable: {e}")
+            self._status_server_failed = True
+            return
+        
+        threading.Thread(target=self._status_server.serve_forever, name="worker-status", daemon=True).start()
+        logger.info(f"📊 Worker status endpoint: http://0.0.0.0:{port}/status")
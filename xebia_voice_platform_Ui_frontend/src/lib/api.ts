@@ -51,7 +51,7 @@ export interface BackendAgent {
   name: string;
   description?: string;
   template_id: string;
-  system_prompt: string;
+  system_prompt?: string; // Omitted by the summary projection
   color?: string;
   created_at: string;
   updated_at: string;
@@ -139,7 +139,7 @@ export function transformAgentFromBackend(backendAgent: BackendAgent): Agent {
     template: backendAgent.template_id, // Map template_id to template
     templateIcon: templateIcons[backendAgent.template_id] || '🤖',
     personality: 'professional', // Default - not stored in backend
-    systemPrompt: backendAgent.system_prompt,
+    systemPrompt: backendAgent.system_prompt ?? '',
     documents: [], // Not included in list response
     integrations: [], // Not stored in backend
     queryCount: backendAgent.query_count,
@@ -160,10 +160,12 @@ export function transformAgentFromBackend(backendAgent: BackendAgent): Agent {
 
 export const agentsAPI = {
   /**
-   * List all agents
+   * List all agents.
+   * `fields: 'summary'` omits system prompts and MCP config; `limit`/`cursor` page through
+   * the list (next cursor in the X-Next-Cursor header). Unchanged lists are revalidated with a 304.
    */
-  list: async () => {
-    const response = await api.get<BackendAgent[]>('/api/agents/list');
+  list: async (options: { fields?: 'full' | 'summary'; limit?: number; cursor?: string } = {}) => {
+    const response = await api.get<BackendAgent[]>('/api/agents/list', { params: options });
     
     // Transform backend agents to frontend format
     const transformedData = response.data.map(transformAgentFromBackend);
@@ -268,10 +270,11 @@ export const sessionsAPI = {
     api.post(`/api/sessions/${sessionId}/query`, { question }),
 
   /**
-   * Get recent activities
+   * Get recent activities (newest first).
+   * Pass `cursor` (X-Next-Cursor) for older pages or `since` (X-Latest-Cursor) to poll for new items.
    */
-  getRecent: (limit = 20) => 
-    api.get(`/api/sessions/recent`, { params: { limit } }),
+  getRecent: (limit = 20, options: { cursor?: string; since?: string } = {}) => 
+    api.get(`/api/sessions/recent`, { params: { limit, ...options } }),
 };
 
 // ============================================================================
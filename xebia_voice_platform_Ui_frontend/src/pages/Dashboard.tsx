@@ -31,7 +31,7 @@ export default function Dashboard() {
         setLoading(true);
         
         // Fetch agents
-        const agentsResponse = await agentsAPI.list();
+        const agentsResponse = await agentsAPI.list({ fields: 'summary' });
         const fetchedAgents = agentsResponse.data;
         setAgents(fetchedAgents);
         
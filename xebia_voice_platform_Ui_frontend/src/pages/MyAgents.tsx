@@ -45,7 +45,7 @@ export default function MyAgents() {
     const fetchAgents = async () => {
       try {
         setLoading(true);
-        const response = await agentsAPI.list();
+        const response = await agentsAPI.list({ fields: 'summary' });
         setAgents(response.data);
       } catch (error) {
         console.error('Error fetching agents:', error);